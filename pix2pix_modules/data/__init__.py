@@ -10,6 +10,7 @@
 Now you can use the dataset class by specifying flag '--dataset_mode dummy'.
 See our template dataset class 'template_dataset.py' for more details.
 """
+import sys
 import importlib
 import torch.utils.data
 from data.base_dataset import BaseDataset
@@ -44,6 +45,29 @@ def get_option_setter(dataset_name):
     return dataset_class.modify_commandline_options
 
 
+def worker_init(worker_id):
+    """Loader workers decode with one OpenCV thread (torch already runs one per worker),
+    so num_workers workers next to the network's intra-op threads do not oversubscribe the cores."""
+    if 'cv2' in sys.modules:
+        sys.modules['cv2'].setNumThreads(1)
+
+
+def loader_kwargs(num_workers, pin_memory=False, prefetch_factor=2, persistent_workers=False):
+    """DataLoader keyword arguments for num_workers decoding processes.
+
+    Parameters:
+        num_workers (int)         -- number of worker processes, 0 loads in the calling process
+        pin_memory (bool)         -- page-locked batches, for non_blocking copies to a GPU
+        prefetch_factor (int)     -- batches each worker loads ahead
+        persistent_workers (bool) -- keep the workers alive between passes over the dataset
+    """
+    kwargs = {'num_workers': int(num_workers), 'pin_memory': pin_memory}
+    if num_workers > 0:
+        kwargs.update(worker_init_fn=worker_init, prefetch_factor=prefetch_factor,
+                      persistent_workers=persistent_workers)
+    return kwargs
+
+
 def create_dataset(opt):
     """Create a dataset given the option.
 
@@ -76,7 +100,7 @@ class CustomDatasetDataLoader():
             self.dataset,
             batch_size=opt.batch_size,
             shuffle=not opt.serial_batches,
-            num_workers=int(opt.num_threads))
+            **loader_kwargs(int(opt.num_threads), pin_memory=len(opt.gpu_ids) > 0))
 
     def load_data(self):
         return self
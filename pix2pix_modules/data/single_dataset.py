@@ -1,8 +1,16 @@
+import os
+import csv
 from data.base_dataset import BaseDataset, get_transform
 from data.image_folder import make_dataset
 from PIL import Image
 
 
+def read_tile_manifest(manifest_path):
+    """Names of the tiles a tile manifest (utils/tile_triage.py) marks for inference."""
+    with open(manifest_path, newline='') as f:
+        return {row['tile'] for row in csv.DictReader(f) if int(row['infer'])}
+
+
 class SingleDataset(BaseDataset):
     """This dataset class can load a set of images specified by the path --dataroot /path/to/data.
 
@@ -17,6 +25,10 @@ class SingleDataset(BaseDataset):
         """
         BaseDataset.__init__(self, opt)
         self.A_paths = sorted(make_dataset(opt.dataroot, opt.max_dataset_size))
+        if getattr(opt, 'tile_manifest', ''):
+            # skip nodata / all-land / all-water tiles found by the triage pass
+            keep = read_tile_manifest(opt.tile_manifest)
+            self.A_paths = [p for p in self.A_paths if os.path.basename(p) in keep]
         input_nc = self.opt.output_nc if self.opt.direction == 'BtoA' else self.opt.input_nc
         self.transform = get_transform(opt, grayscale=(input_nc == 1))
 
@@ -0,0 +1,146 @@
+import os
+import sys
+import csv
+import numpy as np
+import torch
+import torch.nn.functional as F
+from data.base_dataset import BaseDataset, get_params, get_transform
+from data.single_dataset import read_tile_manifest
+from PIL import Image
+
+try:
+    from utils import tile_shards
+except ImportError:
+    # train.py / test.py run from pix2pix_modules, utils is in the repository root
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    from utils import tile_shards
+
+
+def find_shards(dataroot):
+    """A single shard (.npy) or the shards of a folder (see utils/tile_shards.py)."""
+    if dataroot.endswith('.npy'):
+        return [dataroot]
+    return tile_shards.find_shards(dataroot)
+
+
+def read_shard_names(shard_path):
+    """Tile names of a shard, in shard order, from its <name>_tiles.csv index."""
+    with open(tile_shards.index_for_shard(shard_path), newline='') as f:
+        return [row['tile'] for row in csv.DictReader(f)]
+
+
+class TileShardDataset(BaseDataset):
+    """This dataset class loads tiles from memory-mapped tile shards instead of image files.
+
+    --dataroot is a shard or a folder of shards written by utils/tile_shards.py. Tiles are sliced
+    straight out of the memory-mapped arrays, without per-file opens or JPEG decoding.
+    A_paths are <shard folder>/<tile name>, so results are named as for the tile files.
+    For training, shards are read from /path/to/data/<phase> and hold A and B side by side,
+    like the images of the aligned dataset.
+
+    float32 shards (tiles in [0, 1], any number of bands, e.g. R,G,B,NIR,SWIR1) are fed to the
+    network directly as --input_nc channel tensors scaled to [-1, 1], without a JPEG/PIL round trip.
+    """
+
+    def __init__(self, opt):
+        """Initialize this dataset class.
+
+        Parameters:
+            opt (Option class) -- stores all the experiment flags; needs to be a subclass of BaseOptions
+        """
+        BaseDataset.__init__(self, opt)
+        root = opt.dataroot
+        if opt.isTrain and os.path.isdir(os.path.join(root, opt.phase)):
+            root = os.path.join(root, opt.phase)
+        self.shard_paths = find_shards(root)
+        keep = read_tile_manifest(opt.tile_manifest) if getattr(opt, 'tile_manifest', '') else None
+
+        self.items = []
+        self.A_paths = []
+        for s, shard_path in enumerate(self.shard_paths):
+            for i, name in enumerate(read_shard_names(shard_path)):
+                if keep is not None and name not in keep:
+                    continue
+                self.items.append((s, i))
+                self.A_paths.append(os.path.join(os.path.dirname(shard_path), name))
+        if len(self.items) > opt.max_dataset_size:
+            self.items = self.items[:int(opt.max_dataset_size)]
+            self.A_paths = self.A_paths[:int(opt.max_dataset_size)]
+
+        self.input_nc = self.opt.output_nc if self.opt.direction == 'BtoA' else self.opt.input_nc
+        self.output_nc = self.opt.input_nc if self.opt.direction == 'BtoA' else self.opt.output_nc
+        self.transform = get_transform(opt, grayscale=(self.input_nc == 1))
+        self._shards = {}  # memory maps, opened lazily inside each loader worker
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_shards'] = {}
+        return state
+
+    def _tiles(self, s):
+        if s not in self._shards:
+            self._shards[s] = np.load(self.shard_paths[s], mmap_mode='r')
+        return self._shards[s]
+
+    def __getitem__(self, index):
+        """Return a data point and its metadata information.
+
+        Parameters:
+            index - - a random integer for data indexing
+
+        Returns a dictionary that contains A and A_paths (and B, B_paths when training)
+            A(tensor) - - an image in the input domain
+            A_paths(str) - - the tile name, joined to the shard folder
+        """
+        s, i = self.items[index]
+        A_path = self.A_paths[index]
+        tile = self._tiles(s)[i]
+        if tile.dtype != np.uint8:
+            return self._float_item(tile, A_path)
+        img = Image.fromarray(tile).convert('RGB')
+        if not self.opt.isTrain:
+            return {'A': self.transform(img), 'A_paths': A_path}
+
+        # split AB tile into A and B and apply the same transform to both
+        w, h = img.size
+        w2 = int(w / 2)
+        A = img.crop((0, 0, w2, h))
+        B = img.crop((w2, 0, w, h))
+        transform_params = get_params(self.opt, A.size)
+        A_transform = get_transform(self.opt, transform_params, grayscale=(self.input_nc == 1))
+        B_transform = get_transform(self.opt, transform_params, grayscale=(self.output_nc == 1))
+        return {'A': A_transform(A), 'B': B_transform(B), 'A_paths': A_path, 'B_paths': A_path}
+
+    def _float_transform(self, t, params):
+        """resize / crop / flip of a (C, H, W) tensor, following opt.preprocess and opt.no_flip"""
+        if 'resize' in self.opt.preprocess and t.shape[1:] != (self.opt.load_size, self.opt.load_size):
+            t = F.interpolate(t[None], size=(self.opt.load_size, self.opt.load_size), mode='bilinear',
+                              align_corners=False)[0]
+        if 'crop' in self.opt.preprocess:
+            x, y = params['crop_pos']
+            t = t[:, y:y + self.opt.crop_size, x:x + self.opt.crop_size]
+        if not self.opt.no_flip and params['flip']:
+            t = torch.flip(t, [2])
+        return t.contiguous()
+
+    def _float_item(self, tile, A_path):
+        # (H, W, C) in [0, 1] -> (C, H, W) in [-1, 1], the range of the normalized uint8 tiles
+        t = torch.from_numpy(np.array(tile, dtype=np.float32).transpose(2, 0, 1)) * 2 - 1
+        if not self.opt.isTrain:
+            if t.shape[0] != self.input_nc:
+                raise ValueError(f"{A_path}: shard tiles have {t.shape[0]} bands but --input_nc is {self.input_nc}")
+            return {'A': t, 'A_paths': A_path}
+
+        # split AB tile into A and B and apply the same transform to both
+        if t.shape[0] < max(self.input_nc, self.output_nc):
+            raise ValueError(f"{A_path}: shard tiles have {t.shape[0]} bands but --input_nc / --output_nc are "
+                             f"{self.input_nc} / {self.output_nc}")
+        w2 = t.shape[2] // 2
+        transform_params = get_params(self.opt, (w2, t.shape[1]))
+        A = self._float_transform(t[:self.input_nc, :, :w2], transform_params)
+        B = self._float_transform(t[:self.output_nc, :, w2:], transform_params)
+        return {'A': A, 'B': B, 'A_paths': A_path, 'B_paths': A_path}
+
+    def __len__(self):
+        """Return the total number of images in the dataset."""
+        return len(self.items)
@@ -0,0 +1,79 @@
+"""
+Benchmark the CPU inference backends of a trained generator (utils/generator_backend.py) on real tiles.
+Reports tiles/sec, speedup and mask IoU against the eager fp32 model in eval mode, which the backends
+fold, and against the default train-mode generator (per-tile BatchNorm statistics) that the pipeline
+runs without --backend / --eval.
+Usage example:
+    python scripts/benchmark_generator_backends.py --model shoreline_gan_nov --source data/Mombasa_2014/jpg_files/pix2pix_ready
+"""
+import argparse
+import warnings
+import torch
+from utils import gan_inference, generator_backend
+
+CONFIGS = {
+    'folded': ('eager', None),
+    'torchscript': ('torchscript', None),
+    'onnx': ('onnx', None),
+    'torchscript-int8': ('torchscript', 'static'),
+    'onnx-int8': ('onnx', 'dynamic'),
+}
+
+
+def load_batches(generator, source, dataset_mode, batch_size, n_batches):
+    loader = generator.dataloader(source, dataset_mode, batch_size=batch_size, num_workers=0)
+    batches = []
+    for data in loader:
+        batches.append(data['A'])
+        if len(batches) >= n_batches:
+            break
+    return batches
+
+
+def main(model_name, source, epoch='latest', dataset_mode='single', input_nc=3, batch_size=8, n_batches=4,
+         calibration_batches=2, configs=None, threads=None,
+         checkpoints_dir=gan_inference.CHECKPOINTS_DIR):
+    if threads:
+        torch.set_num_threads(threads)
+    # torch.jit / torch.ao deprecation notices, printed once per traced or quantized module
+    warnings.filterwarnings('ignore', category=FutureWarning)
+    warnings.filterwarnings('ignore', category=UserWarning, module='torch')
+    reference = gan_inference.ShorelineGenerator(model_name, epoch, checkpoints_dir, input_nc=input_nc,
+                                                 eval=True, device='cpu')
+    default = gan_inference.ShorelineGenerator(model_name, epoch, checkpoints_dir, input_nc=input_nc, device='cpu')
+    batches = load_batches(reference, source, dataset_mode, batch_size, n_batches + calibration_batches)
+    # calibrate on other tiles than the ones the masks are compared on
+    calibration, batches = batches[:calibration_batches], batches[calibration_batches:]
+    candidates = {}
+    for label in configs or list(CONFIGS):
+        backend, quantize = CONFIGS[label]
+        try:
+            candidates[label] = generator_backend.compile_generator(reference.netG, backend, quantize,
+                                                                    calibration or None, batches[0][:1],
+                                                                    threads=threads)
+        except ImportError as e:
+            print(f'skipping {label}: {e}')
+    rows = generator_backend.benchmark(reference.netG, candidates, batches, baseline=default.predict)
+    print(f"{'backend':<18}{'tiles/s':>10}{'speedup':>10}{'mask IoU':>10}{'max |diff|':>12}{'IoU default':>13}")
+    for row in rows:
+        print(f"{row['label']:<18}{row['tiles_per_sec']:>10.2f}{row['speedup']:>10.2f}{row['iou']:>10.4f}"
+              f"{row['max_abs_diff']:>12.4f}{row['baseline_iou']:>13.4f}")
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', required=True, help='Model name in checkpoints')
+    parser.add_argument('--source', required=True, help='Tile folder (or tile shard folder)')
+    parser.add_argument('--epoch', default='latest', help='Epoch to load')
+    parser.add_argument('--dataset-mode', default='single', choices=['single', 'tile_shard'])
+    parser.add_argument('--input-nc', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--batches', type=int, default=4, help='Batches to time and compare')
+    parser.add_argument('--calibration-batches', type=int, default=2, help='Batches to calibrate int8 on')
+    parser.add_argument('--configs', nargs='+', choices=list(CONFIGS), default=None)
+    parser.add_argument('--threads', type=int, default=None, help='Intra-op threads')
+    parser.add_argument('--checkpoints-dir', default=gan_inference.CHECKPOINTS_DIR)
+    args = parser.parse_args()
+    main(args.model, args.source, args.epoch, args.dataset_mode, args.input_nc, args.batch_size, args.batches,
+         args.calibration_batches, args.configs, args.threads, args.checkpoints_dir)
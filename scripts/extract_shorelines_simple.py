@@ -3,12 +3,22 @@ Simple shoreline extraction from segmentation masks.
 Uses contour detection to extract shorelines without requiring geopandas.
 """
 import os
+import sys
 import glob
 import numpy as np
 import cv2
 import pandas as pd
 from pathlib import Path
 
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from utils import mask_mosaic
+from utils import tile_triage
+from utils import gan_inference
+from utils import streaming_extraction
+from utils import window_inference
+
 def extract_shoreline_from_mask(mask_path, tile_coords=None):
     """
     Extract shoreline contours from a binary segmentation mask.
@@ -25,7 +35,50 @@ def extract_shoreline_from_mask(mask_path, tile_coords=None):
     mask = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
     if mask is None:
         return []
+    return extract_shoreline_from_array(mask, tile_coords)
+
+
+def split_at_nodata(coords, valid):
+    """
+    Split a contour into the runs of points that lie away from no-data pixels, so the
+    border of an uncovered area is not reported as shoreline.
+    
+    Args:
+        coords: (N, 2) contour points as (x, y) pixel coordinates
+        valid: 2D bool array, False on no-data pixels
+    
+    Returns:
+        List of (M, 2) runs with at least 2 points
+    """
+    # a contour traced along a no-data area runs on the pixels next to it
+    near_valid = cv2.erode(valid.astype(np.uint8), np.ones((3, 3), np.uint8), iterations=2).astype(bool)
+    xy = coords.astype(int)
+    keep = near_valid[xy[:, 1], xy[:, 0]]
+    runs = []
+    start = None
+    for i, k in enumerate(list(keep) + [False]):
+        if k and start is None:
+            start = i
+        elif not k and start is not None:
+            if i - start >= 2:
+                runs.append(coords[start:i])
+            start = None
+    return runs
+
+
+def extract_shoreline_from_array(mask, tile_coords=None, valid=None):
+    """
+    Extract shoreline contours from a grayscale mask array (tile or scene mosaic).
+    
+    Args:
+        mask: 2D mask array
+        tile_coords: Tuple of (y, x) offsets if this is a tile
+        valid: 2D bool array, False on no-data pixels (e.g. mosaic pixels no tile covered);
+            contours are split where they run along no-data pixels
     
+    Returns:
+        List of contours, each as (x, y) pixel coordinate arrays
+    """
     # Threshold if needed
     if mask.dtype != np.uint8 or mask.max() > 255:
         mask = cv2.normalize(mask, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
@@ -37,7 +90,10 @@ def extract_shoreline_from_mask(mask_path, tile_coords=None):
     mask_clean = cv2.morphologyEx(mask_clean, cv2.MORPH_OPEN, kernel, iterations=1)
     
     # Find contours
-    contours, _ = cv2.findContours(mask_clean, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    # every contour pixel is kept when the contours are split at no-data pixels, so the
+    # straight runs of a simplified contour do not lose their ends to the split
+    approx = cv2.CHAIN_APPROX_SIMPLE if valid is None else cv2.CHAIN_APPROX_NONE
+    contours, _ = cv2.findContours(mask_clean, cv2.RETR_EXTERNAL, approx)
     
     shorelines = []
     for contour in contours:
@@ -50,16 +106,86 @@ def extract_shoreline_from_mask(mask_path, tile_coords=None):
         if len(coords.shape) == 1:  # Single point
             continue
         
-        # Apply tile offset if this is from a tile
-        if tile_coords is not None:
-            coords[:, 0] += tile_coords[1]  # x offset
-            coords[:, 1] += tile_coords[0]  # y offset
-        
-        shorelines.append(coords)
+        for run in ([coords] if valid is None else split_at_nodata(coords, valid)):
+            # Apply tile offset if this is from a tile
+            if tile_coords is not None:
+                run[:, 0] += tile_coords[1]  # x offset
+                run[:, 1] += tile_coords[0]  # y offset
+            
+            shorelines.append(run)
     
     return shorelines
 
 
+def save_tile_shorelines(name, mask, shorelines, shorelines_dir, images_dir, file=None, transform=None,
+                         **fields):
+    """
+    Save the shorelines of one tile (or scene): an overlay on its mask and one x,y text file per shoreline.
+    Returns the summary rows of the tile.
+    
+    Args:
+        transform: Maps the (N, 2) pixel coordinates to the coordinates written, e.g. to map coordinates
+        fields: Further columns of the summary rows (e.g. epsg)
+    """
+    img_color = cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)
+    for shoreline in shorelines:
+        cv2.polylines(img_color, [shoreline.astype(np.int32)], False, (0, 255, 0), 2)
+    cv2.imwrite(os.path.join(images_dir, f'{name}_shoreline.png'), img_color)
+    
+    rows = []
+    for i, shoreline in enumerate(shorelines):
+        data_path = os.path.join(shorelines_dir, f'{name}_shoreline_{i}.txt')
+        np.savetxt(data_path, shoreline if transform is None else transform(shoreline),
+                   fmt='%.6f', delimiter=',', header='x,y', comments='')
+        rows.append(dict({
+            'file': file or name,
+            'shoreline_id': i,
+            'num_points': len(shoreline)
+        }, **fields, path=data_path))
+    return rows
+
+
+def save_scene_shorelines(scene, mosaic, shorelines_dir, images_dir, mosaic_dir, threshold=0.5):
+    """
+    Save a scene mosaic (probability raster and mask), extract its shorelines and save them
+    in map coordinates. Returns the summary rows of the scene.
+    """
+    # Save the probability raster and the thresholded mask
+    mask_mosaic.write_mosaic(os.path.join(mosaic_dir, f'{scene}_prob.tif'),
+                             mosaic.probability(), mosaic.geotransform, mosaic.epsg)
+    mask = mosaic.mask(threshold)
+    mask_mosaic.write_mosaic(os.path.join(mosaic_dir, f'{scene}_mask.png'),
+                             mask, mosaic.geotransform, mosaic.epsg)
+    
+    shorelines = extract_shoreline_from_array(mask, valid=mosaic.covered())
+    
+    # Save the overlay and the shorelines in map coordinates
+    return save_tile_shorelines(scene, mask, shorelines, shorelines_dir, images_dir,
+                                transform=lambda xy: mask_mosaic.pixel_to_map(xy, mosaic.geotransform),
+                                epsg=mosaic.epsg)
+
+
+def _output_dirs(output_dir, site_name):
+    """Create <output_dir>/processed/<site_name> and its shorelines, shoreline_images and mosaics folders.
+    Returns (output_subdir, shorelines_dir, images_dir, mosaic_dir)."""
+    output_subdir = os.path.join(output_dir, 'processed', site_name)
+    dirs = [os.path.join(output_subdir, d) for d in ['shorelines', 'shoreline_images', 'mosaics']]
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+    return (output_subdir, *dirs)
+
+
+def _write_summary(rows, output_subdir, detail=''):
+    """Write the summary rows to <output_subdir>/shorelines_summary.csv, sorted by file and shoreline."""
+    summary_df = pd.DataFrame(rows)
+    if len(summary_df):
+        summary_df = summary_df.sort_values(['file', 'shoreline_id'])
+    summary_df.to_csv(os.path.join(output_subdir, 'shorelines_summary.csv'), index=False)
+    
+    print(f"[OK] Extracted {len(rows)} shorelines{detail}")
+    print(f"[OK] Results saved to {output_subdir}")
+
+
 def process_gan_outputs(gan_output_dir, coords_csv, site_name, output_dir):
     """
     Process all GAN output segmentation masks and extract shorelines.
@@ -99,44 +225,137 @@ def process_gan_outputs(gan_output_dir, coords_csv, site_name, output_dir):
         
         # Extract shorelines
         shorelines = extract_shoreline_from_mask(mask_path)
-        
-        # Save shoreline visualization
         img = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
-        img_color = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
-        
-        for shoreline in shorelines:
-            shoreline_int = shoreline.astype(np.int32)
-            cv2.polylines(img_color, [shoreline_int], False, (0, 255, 0), 2)
-        
-        vis_path = os.path.join(images_dir, basename.replace('_fake_B.png', '_shoreline.png'))
-        cv2.imwrite(vis_path, img_color)
-        
-        # Save shoreline data
-        for i, shoreline in enumerate(shorelines):
-            data_path = os.path.join(shorelines_dir, 
-                                    basename.replace('_fake_B.png', f'_shoreline_{i}.txt'))
-            np.savetxt(data_path, shoreline, fmt='%.6f', delimiter=',', 
-                      header='x,y', comments='')
-            all_shorelines.append({
-                'file': basename,
-                'shoreline_id': i,
-                'num_points': len(shoreline),
-                'path': data_path
-            })
+        all_shorelines.extend(save_tile_shorelines(basename.replace('_fake_B.png', ''), img, shorelines,
+                                                   shorelines_dir, images_dir, file=basename))
     
     # Save summary
-    summary_df = pd.DataFrame(all_shorelines)
-    summary_path = os.path.join(output_subdir, 'shorelines_summary.csv')
-    summary_df.to_csv(summary_path, index=False)
+    _write_summary(all_shorelines, output_subdir)
     
-    print(f"[OK] Extracted {len(all_shorelines)} shorelines")
-    print(f"[OK] Results saved to {output_subdir}")
+    return output_subdir
+
+
+def process_scene_mosaics(gan_output_dir, tile_index_csvs, site_name, output_dir, threshold=0.5,
+                          fill_values=None):
+    """
+    Stitch the GAN output masks of each scene into one georeferenced mosaic
+    (overlapping tiles blended, see utils/mask_mosaic.py) and extract shorelines
+    once per scene, in map coordinates.
+    
+    Args:
+        gan_output_dir: Directory containing GAN output PNG masks (<tile>_fake_B.png)
+        tile_index_csvs: Tile index CSVs written by scene_tiler.tile_scene, one per scene
+        site_name: Name of the site (e.g., 'Mombasa_2014')
+        output_dir: Output directory for results
+        threshold: Probability threshold for the scene mask
+        fill_values: Mask value per triage reason for tiles skipped by the
+            tile manifest, mask_mosaic.DEFAULT_FILL_VALUES ({'water': 1.0, 'land': 0.0}) when None
+    """
+    output_subdir, shorelines_dir, images_dir, mosaic_dir = _output_dirs(output_dir, site_name)
+    
+    all_shorelines = []
+    for index_csv in tile_index_csvs:
+        manifest = tile_triage.manifest_path(os.path.dirname(index_csv))
+        mosaic = mask_mosaic.mosaic_from_index(index_csv, gan_output_dir,
+                                               manifest=manifest if os.path.exists(manifest) else None,
+                                               fill_values=fill_values)
+        scene = os.path.basename(index_csv).replace('_tiles.csv', '')
+        if mosaic is None:
+            print(f"[SKIP] No GAN masks found for {scene}")
+            continue
+        print(f"[INFO] Processing scene mosaic {scene} ({mosaic.width}x{mosaic.height})...")
+        all_shorelines.extend(save_scene_shorelines(scene, mosaic, shorelines_dir, images_dir, mosaic_dir,
+                                                    threshold))
+    
+    _write_summary(all_shorelines, output_subdir, f" from {len(tile_index_csvs)} scene(s)")
+    
+    return output_subdir
+
+
+def process_gan_stream(generator, source, site_name, output_dir, dataset_mode='single', tile_manifest=None,
+                       tile_index_csvs=None, batch_size=8, num_workers=None, threads=2, save_masks=False,
+                       threshold=0.5, fill_values=None):
+    """
+    Run a generator over the tiles of source and extract shorelines from its outputs in memory,
+    without writing and re-reading mask PNGs (see utils/streaming_extraction.py).
+    Results are saved as by process_scene_mosaics when tile index CSVs are given,
+    per tile as by process_gan_outputs otherwise.
+    
+    Args:
+        generator: a loaded gan_inference.ShorelineGenerator
+        source: Tile folder, or folder of tile shards
+        site_name: Name of the site (e.g., 'Mombasa_2014')
+        output_dir: Output directory for results
+        tile_index_csvs: Tile index CSVs of the scenes the tiles were cut from
+        threads: Extraction threads next to the generator
+        save_masks: Also write the masks to <site folder>/masks (<tile>_fake.png)
+        threshold, fill_values: see process_scene_mosaics
+    """
+    output_subdir, shorelines_dir, images_dir, mosaic_dir = _output_dirs(output_dir, site_name)
+    
+    writer = gan_inference.ResultWriter(os.path.join(output_subdir, 'masks'), output='masks') if save_masks else None
+    batches = generator.run(source, dataset_mode, tile_manifest, batch_size, num_workers)
+    all_shorelines = []
+    if tile_index_csvs:
+        def on_scene(scene, mosaic):
+            print(f"[INFO] Processing scene mosaic {scene} ({mosaic.width}x{mosaic.height})...")
+            all_shorelines.extend(save_scene_shorelines(scene, mosaic, shorelines_dir, images_dir, mosaic_dir,
+                                                        threshold))
+        streaming_extraction.stream_scenes(batches, tile_index_csvs, on_scene, threads=threads, writer=writer,
+                                           fill_values=fill_values)
+    else:
+        def on_tile(name, mask):
+            all_shorelines.extend(save_tile_shorelines(name, mask, extract_shoreline_from_array(mask),
+                                                       shorelines_dir, images_dir))
+        streaming_extraction.stream_tiles(batches, on_tile, threads=threads, writer=writer)
+    if writer is not None:
+        writer.close()
+    
+    _write_summary(all_shorelines, output_subdir)
+    
+    return output_subdir
+
+
+def process_gan_windows(generator, tif_paths, site_name, output_dir, window=window_inference.WINDOW_SIZE,
+                        margin=window_inference.MARGIN, batch_size=1, max_memory_mb=None, threshold=0.5,
+                        limits=None, bands=(1, 2, 3)):
+    """
+    Run a generator over whole scenes in large sliding windows instead of 256x256 tiles
+    (see utils/window_inference.py) and extract shorelines per scene, saved as by process_scene_mosaics.
+    
+    Args:
+        generator: a loaded gan_inference.ShorelineGenerator
+        tif_paths: Scene GeoTIFFs
+        site_name: Name of the site (e.g., 'Mombasa_2014')
+        output_dir: Output directory for results
+        window, margin: Window size and cropped margin in pixels
+        batch_size: Windows per forward pass
+        max_memory_mb: Size the windows to this memory budget instead of window
+        threshold: see process_scene_mosaics
+        limits: Per-band stretch limits shared by the scenes, estimated per scene when None
+        bands: 1-based scene bands fed to the generator, in the order the training tiles were cut with
+            (e.g. prepare_pix2pix_from_harmonized.RGB_BANDS for harmonized B,G,R,NIR,SWIR scenes)
+    """
+    output_subdir, shorelines_dir, images_dir, mosaic_dir = _output_dirs(output_dir, site_name)
+    
+    all_shorelines = []
+    for tif_path in tif_paths:
+        scene = os.path.splitext(os.path.basename(tif_path))[0]
+        mosaic = window_inference.predict_raster(generator, tif_path, window, margin, batch_size, bands=bands,
+                                                 limits=limits, max_memory_mb=max_memory_mb)
+        print(f"[INFO] Processing scene mosaic {scene} ({mosaic.width}x{mosaic.height})...")
+        all_shorelines.extend(save_scene_shorelines(scene, mosaic, shorelines_dir, images_dir, mosaic_dir,
+                                                    threshold))
+    
+    _write_summary(all_shorelines, output_subdir)
     
     return output_subdir
 
 
-def main():
-    """Extract shorelines from mock GAN outputs for all years."""
+def main(mosaic=True):
+    """Extract shorelines from mock GAN outputs for all years.
+    With mosaic=True, sites with tile index CSVs are stitched and extracted per scene;
+    the others fall back to per-tile extraction."""
     base_output = os.path.join(os.getcwd(), 'model_outputs')
     gan_output_base = os.path.join(base_output, 'gan', 'shoreline_gan_mock', 'test_latest', 'images')
     years = [1994, 2004, 2014, 2024]
@@ -144,9 +363,13 @@ def main():
     for year in years:
         site = f'Mombasa_{year}'
         coords_csv = os.path.join('data', site, f'{site}.csv')
+        tile_indexes = sorted(glob.glob(os.path.join('data', site, 'jpg_files', 'pix2pix_ready', '*_tiles.csv')))
         
         print(f"\n[INFO] Extracting shorelines for {site}...")
-        process_gan_outputs(gan_output_base, coords_csv, site, base_output)
+        if mosaic and tile_indexes:
+            process_scene_mosaics(gan_output_base, tile_indexes, site, base_output)
+        else:
+            process_gan_outputs(gan_output_base, coords_csv, site, base_output)
     
     print("\n[SUCCESS] Shoreline extraction complete!")
 
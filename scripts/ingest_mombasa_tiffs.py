@@ -11,21 +11,62 @@ Usage:
 Expect input filenames like: mombasa_1994_RGB.tif
 Output per-year folder: data/Mombasa_1994/
 Output metadata CSV: data/Mombasa_1994/Mombasa_1994.csv
+Every ingested scene is also registered in the scene catalog (data/scene_catalog.sqlite, utils/scene_catalog.py)
+Files are hashed and copied in parallel (utils/scene_ingest.py); files already in place with the same
+checksum are skipped and data/ingest_manifest.jsonl lets an interrupted ingest resume
 """
 
 import os
 import re
-import shutil
+import sys
 import argparse
 from pathlib import Path
 
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from utils import scene_catalog
+from utils import scene_ingest
+
 try:
     from utils.gdal_modules import gdal_functions_app as gda
 except Exception:
     gda = None  # GDAL-based helper may not be installed in lightweight environments
 
 
-def ingest(src_dir, move=False):
+def write_metadata_csv(dest_path, csv_path):
+    # Create metadata CSV using gdal_get_coords_and_res_list (fallback to rasterio or default metadata)
+    try:
+        num, csv = gda.gdal_get_coords_and_res_list([str(dest_path)], str(csv_path))
+        print(f'Wrote metadata CSV: {csv}')
+    except Exception as e:
+        # Fallback: try rasterio to read bounds/transform, else write a minimal CSV assuming EPSG:32737 and 30m resolution
+        try:
+            import rasterio
+            with rasterio.open(str(dest_path)) as src:
+                bounds = src.bounds
+                transform = src.transform
+                cols = src.width
+                rows = src.height
+                xres = abs(transform.a)
+                yres = abs(transform.e)
+                epsg = int(src.crs.to_epsg()) if src.crs else 32737
+            import csv
+            with open(str(csv_path), 'w', newline='') as cf:
+                writer = csv.writer(cf)
+                writer.writerow(['file','xmin','ymin','xmax','ymax','xres','yres','epsg','cols','rows'])
+                writer.writerow([str(dest_path), bounds.left, bounds.bottom, bounds.right, bounds.top, xres, yres, epsg, cols, rows])
+            print(f'Wrote fallback metadata CSV: {csv_path}')
+        except Exception:
+            import csv
+            with open(str(csv_path), 'w', newline='') as cf:
+                writer = csv.writer(cf)
+                writer.writerow(['file','xmin','ymin','xmax','ymax','xres','yres','epsg','cols','rows'])
+                writer.writerow([str(dest_path),'','','','',30,30,32737,'',''])
+            print(f'Wrote minimal metadata CSV (default EPSG:32737): {csv_path}')
+
+
+def ingest(src_dir, move=False, catalog=None, manifest=None, jobs=None):
     src_dir = Path(src_dir)
     if not src_dir.exists():
         raise FileNotFoundError(f"Source directory not found: {src_dir}")
@@ -36,55 +77,42 @@ def ingest(src_dir, move=False):
         return
 
     pattern = re.compile(r'mombasa[_-]?(?P<year>\d{4})', flags=re.IGNORECASE)
-
+    pairs = []
+    sites = {}
     for tif in tifs:
         m = pattern.search(tif.stem)
         if not m:
             print('Skipping file (cannot infer year):', tif.name)
             continue
-        year = m.group('year')
-        site = f'Mombasa_{year}'
-        dest_folder = Path('data') / site
-        dest_folder.mkdir(parents=True, exist_ok=True)
-
-        dest_path = dest_folder / tif.name
-        if move:
-            shutil.move(str(tif), str(dest_path))
-            print(f'Moved {tif.name} -> {dest_path}')
-        else:
-            shutil.copy2(str(tif), str(dest_path))
-            print(f'Copied {tif.name} -> {dest_path}')
-
-        # Create metadata CSV using gdal_get_coords_and_res_list (fallback to rasterio or default metadata)
-        csv_path = dest_folder / (site + '.csv')
+        site = f"Mombasa_{m.group('year')}"
+        dest_path = str(Path('data') / site / tif.name)
+        pairs.append((str(tif), dest_path))
+        sites[dest_path] = site
+
+    # hash/copy in parallel; files already in place are skipped, the manifest makes reruns resumable
+    records = scene_ingest.ingest_files(pairs, manifest=manifest, jobs=jobs, move=move)
+    catalog = scene_catalog.SceneCatalog(catalog or scene_catalog.catalog_path())
+
+    for rec in records:
+        dest_path = rec['dest']
+        if rec['status'] == 'failed':
+            print(f"Failed to ingest {rec['src']}: {rec['error']}")
+            continue
+        print(f"{rec['status'].capitalize()}: {os.path.basename(rec['src'])} -> {dest_path}")
+        site = sites[dest_path]
+        csv_path = os.path.join(os.path.dirname(dest_path), site + '.csv')
+        if rec['status'] != 'unchanged' or not os.path.exists(csv_path):
+            write_metadata_csv(dest_path, csv_path)
+
+        row = catalog.get(dest_path)
+        if row is not None and row['checksum'] == rec['sha256']:
+            continue
         try:
-            num, csv = gda.gdal_get_coords_and_res_list([str(dest_path)], str(csv_path))
-            print(f'Wrote metadata CSV: {csv}')
+            catalog.register(dest_path, site=site, checksum=rec['sha256'])
         except Exception as e:
-            # Fallback: try rasterio to read bounds/transform, else write a minimal CSV assuming EPSG:32737 and 30m resolution
-            try:
-                import rasterio
-                with rasterio.open(str(dest_path)) as src:
-                    bounds = src.bounds
-                    transform = src.transform
-                    cols = src.width
-                    rows = src.height
-                    xres = abs(transform.a)
-                    yres = abs(transform.e)
-                    epsg = int(src.crs.to_epsg()) if src.crs else 32737
-                import csv
-                with open(str(csv_path), 'w', newline='') as cf:
-                    writer = csv.writer(cf)
-                    writer.writerow(['file','xmin','ymin','xmax','ymax','xres','yres','epsg','cols','rows'])
-                    writer.writerow([str(dest_path), bounds.left, bounds.bottom, bounds.right, bounds.top, xres, yres, epsg, cols, rows])
-                print(f'Wrote fallback metadata CSV: {csv_path}')
-            except Exception:
-                import csv
-                with open(str(csv_path), 'w', newline='') as cf:
-                    writer = csv.writer(cf)
-                    writer.writerow(['file','xmin','ymin','xmax','ymax','xres','yres','epsg','cols','rows'])
-                    writer.writerow([str(dest_path),'','','','',30,30,32737,'',''])
-                print(f'Wrote minimal metadata CSV (default EPSG:32737): {csv_path}')
+            print(f'Could not add {dest_path} to the scene catalog: {e}')
+
+    catalog.close()
 
     print('\nIngest finished. You can now run:')
     print('  python scripts/preprocess_mombasa.py')
@@ -96,5 +124,8 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--src', type=str, default='data/mombasa', help='Source folder containing GEE-exported TIFFs')
     parser.add_argument('--move', action='store_true', help='Move files instead of copying')
+    parser.add_argument('--catalog', type=str, default=None, help='Scene catalog (default: data/scene_catalog.sqlite)')
+    parser.add_argument('--manifest', type=str, default=None, help='Ingest manifest (default: data/ingest_manifest.jsonl)')
+    parser.add_argument('--jobs', type=int, default=None, help='Hashing/copy threads (default: 2x CPU count, max 32)')
     args = parser.parse_args()
-    ingest(args.src, move=args.move)
+    ingest(args.src, move=args.move, catalog=args.catalog, manifest=args.manifest, jobs=args.jobs)
@@ -0,0 +1,263 @@
+"""
+Parallel preprocessing driver for the Mombasa years.
+Spreads RGB TIF -> JPEG conversion, harmonization and tiling over a process pool.
+Output names are the same as the serial scripts (simple_preprocess.py, preprocess_mombasa.py,
+prepare_pix2pix_from_harmonized.py), whatever order the workers finish in.
+
+Usage:
+    python scripts/parallel_preprocess.py --jobs 32
+    python scripts/parallel_preprocess.py --jobs 8 --steps harmonize tile --tile-source harmonized
+    python scripts/parallel_preprocess.py --jobs 8 --years 2014 2024 --timings preprocess_timings.csv
+    python scripts/parallel_preprocess.py --jobs 8 --stack-stretch
+    python scripts/parallel_preprocess.py --jobs 8 --steps tile triage --tile-source harmonized
+    python scripts/parallel_preprocess.py --jobs 8 --tile-format shard
+    python scripts/parallel_preprocess.py --jobs 8 --catalog data/scene_catalog.sqlite
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from utils import parallel_utils
+from utils import scene_catalog
+from utils import scene_tiler
+from utils import tile_shards
+from utils import tile_triage
+
+BASE = 'data'
+YEARS = [1994, 2004, 2014, 2024]
+STEPS = ['jpeg', 'harmonize', 'tile', 'triage']
+TILE_FORMATS = ['jpeg', 'shard']
+
+# harmonized band order is B,G,R,NIR,SWIR; GEE RGB exports are R,G,B
+TILE_BANDS = {'rgb': (1, 2, 3), 'harmonized': (3, 2, 1), 'multispectral': tile_shards.MULTISPECTRAL_BANDS}
+# (green, nir) bands for the NDWI water fraction of the triage step, None without NIR
+WATER_BANDS = {'rgb': None, 'harmonized': tile_triage.HARMONIZED_WATER_BANDS,
+               'multispectral': tile_triage.HARMONIZED_WATER_BANDS}
+# multispectral tiles are float16 shards for generators with input_nc=5, there are no JPEGs of them;
+# float16 halves the disk and I/O of float32 (see utils/tile_shards.py)
+SHARD_DTYPE = {'rgb': 'uint8', 'harmonized': 'uint8', 'multispectral': 'float16'}
+
+
+def _rgb_tif(site_folder, year):
+    return os.path.join(site_folder, f'mombasa_{year}_RGB.tif')
+
+
+def jpeg_tasks(years):
+    """One TIF -> JPEG conversion task per year."""
+    from scripts.simple_preprocess import process_rgb_tif_to_jpg
+    tasks = []
+    for year in years:
+        site_folder = os.path.join(BASE, f'Mombasa_{year}')
+        tif_path = _rgb_tif(site_folder, year)
+        if not os.path.exists(tif_path):
+            print(f"[SKIP] TIF not found: {tif_path}")
+            continue
+        preprocessed = os.path.join(site_folder, 'jpg_files', 'preprocessed')
+        jpg_path = os.path.join(preprocessed, f'mombasa_{year}_RGB.jpg')
+        jpeg_path = os.path.join(preprocessed, f'mombasa_{year}_RGB.jpeg')
+        tasks.append((f'jpeg {tif_path}', process_rgb_tif_to_jpg, (tif_path, jpg_path, jpeg_path)))
+    return tasks
+
+
+def _plan_task(site_folder):
+    from utils import landsat_preproc
+    plan = landsat_preproc.plan_site(site_folder)
+    # only the reference CDFs travel back and out to the scene tasks
+    if plan['todo']:
+        plan['ref'] = landsat_preproc.reference_matcher(plan['ref'])
+    return plan
+
+
+def run_harmonize(years, jobs):
+    """Harmonize all sites: reference and cache lookup first (one task per site),
+    then every scene that missed the cache, across all sites in one pool."""
+    from utils import landsat_preproc
+    sites = [os.path.join(BASE, f'Mombasa_{year}') for year in years]
+    sites = [s for s in sites if os.path.exists(s)]
+    plan_timings = parallel_utils.run_tasks(
+        [(f'reference {s}', _plan_task, (s,)) for s in sites], jobs=jobs)
+
+    plans = []
+    tasks = []
+    for site_folder, t in zip(sites, plan_timings):
+        if t['error'] or t['result']['ref_out'] is None:
+            print(f"[SKIP] No valid reference scene for {site_folder} {t['error'] or ''}")
+            continue
+        plan = t['result']
+        plans.append(plan)
+        for tif, key in plan['todo']:
+            tasks.append((f'harmonize {tif}', landsat_preproc.harmonize_scene,
+                          (tif, plan['out_folder'], plan['ref'], plan['ref_proj'], plan['target_bands'])))
+    scene_timings = parallel_utils.run_tasks(tasks, jobs=jobs)
+
+    i = 0
+    for plan in plans:
+        results = []
+        for tif, key in plan['todo']:
+            t = scene_timings[i]
+            results.append((tif, key, t['result'], t['error']))
+            i += 1
+        processed = landsat_preproc.finish_site(plan, results)
+        print(f"Wrote {len(processed)} harmonized files to {plan['out_folder']}")
+    return plan_timings + scene_timings
+
+
+def tile_sources(years, source='rgb', catalog=None):
+    """(tif, pix2pix_ready folder) of every scene to tile.
+    catalog: scene catalog to select the RGB scenes of the years from, instead of the file layout"""
+    bands = TILE_BANDS[source]
+    scene_list = []
+    if catalog is not None and source == 'rgb':
+        with scene_catalog.SceneCatalog(catalog) as cat:
+            for row in cat.query(years=list(years)):
+                output_dir = os.path.join(os.path.dirname(row['path']), 'jpg_files', 'pix2pix_ready')
+                scene_list.append((row['path'], output_dir))
+        return scene_list
+    for year in years:
+        site_folder = os.path.join(BASE, f'Mombasa_{year}')
+        if source == 'rgb':
+            tifs = [_rgb_tif(site_folder, year)]
+        else:
+            tifs = sorted(glob.glob(os.path.join(site_folder, 'harmonized', '*_harm.tif')))
+        output_dir = os.path.join(site_folder, 'jpg_files', 'pix2pix_ready')
+        for tif in tifs:
+            if not os.path.exists(tif):
+                print(f"[SKIP] TIF not found: {tif}")
+                continue
+            with scene_tiler.WindowedRaster(tif) as raster:
+                if raster.count < len(bands):
+                    continue
+            scene_list.append((tif, output_dir))
+    return scene_list
+
+
+def tile_tasks(years, source='rgb', tile_size=256, overlap=0, rows_per_task=4, stack_stretch=False,
+               tile_format='jpeg', catalog=None):
+    """Tiling tasks, split into bands of tile rows so one large scene can use several workers.
+    stack_stretch=True uses one set of stretch limits for all scenes of all years.
+    tile_format='shard' allocates one tile shard per scene (utils/tile_shards.py) that the
+    tasks fill in place, instead of writing one JPEG per tile; source='multispectral' needs it
+    and writes float16 R,G,B,NIR,SWIR1 shards.
+    Returns (tasks, scenes) where scenes maps each tile index CSV to its scene."""
+    bands = TILE_BANDS[source]
+    if SHARD_DTYPE[source] != 'uint8' and tile_format != 'shard':
+        raise ValueError(f"{source} tiles can only be written as shards (--tile-format shard)")
+    scene_list = tile_sources(years, source, catalog)
+
+    shared_limits = None
+    if stack_stretch and scene_list:
+        shared_limits = scene_tiler.stack_stretch_limits([tif for tif, d in scene_list], bands)
+
+    tasks = []
+    scenes = {}
+    for tif, output_dir in scene_list:
+        with scene_tiler.WindowedRaster(tif) as raster:
+            # shared stretch limits so every chunk of the scene is scaled the same way
+            limits = shared_limits or scene_tiler.stretch_limits(raster, bands)
+            row_offs = sorted({r for r, c in scene_tiler.tile_offsets(raster.height, raster.width,
+                                                                     tile_size, overlap)})
+        basename = os.path.splitext(os.path.basename(tif))[0]
+        scenes[os.path.join(output_dir, basename + '_tiles.csv')] = tif
+        if tile_format == 'shard':
+            shard = tile_shards.create_scene_shard(tif, output_dir, tile_size, overlap, bands, '.jpeg', basename,
+                                                   SHARD_DTYPE[source])
+        for i in range(0, len(row_offs), rows_per_task):
+            row_range = (row_offs[i], row_offs[min(i + rows_per_task, len(row_offs)) - 1] + 1)
+            name = f'tile {tif} rows {row_range[0]}-{row_range[1] - 1}'
+            if tile_format == 'shard':
+                tasks.append((name, tile_shards.fill_scene_shard,
+                              (tif, shard, tile_size, overlap, bands, limits, row_range)))
+            else:
+                tasks.append((name, scene_tiler.tile_scene,
+                              (tif, output_dir, tile_size, overlap, bands, '.jpeg', basename,
+                               True, False, limits, row_range)))
+    return tasks, scenes
+
+
+def run_tile(years, jobs, source='rgb', tile_size=256, overlap=0, rows_per_task=4, stack_stretch=False,
+             tile_format='jpeg', catalog=None):
+    tasks, scenes = tile_tasks(years, source, tile_size, overlap, rows_per_task, stack_stretch, tile_format,
+                               catalog)
+    timings = parallel_utils.run_tasks(tasks, jobs=jobs)
+    if tile_format != 'shard':
+        # one tile index per scene, rows in the same order as a serial run
+        # (shard tile indexes were written when the shards were allocated)
+        for index_csv, tif in scenes.items():
+            records = []
+            for (name, func, args), t in zip(tasks, timings):
+                if args[0] == tif and t['result']:
+                    records.extend(t['result'])
+            scene_tiler.write_tile_index(records, index_csv)
+    if catalog is not None:
+        failed = {args[0] for (name, func, args), t in zip(tasks, timings) if t['error']}
+        with scene_catalog.SceneCatalog(catalog) as cat:
+            for tif in scenes.values():
+                if tif not in failed and cat.get(tif) is not None:
+                    cat.set_status(tif, 'tiled')
+    return timings
+
+
+def run_triage(years, jobs, source='rgb', catalog=None):
+    """One triage task per pix2pix_ready folder, writing its tile_manifest.csv."""
+    folders = {}
+    for tif, output_dir in tile_sources(years, source, catalog):
+        index_csv = os.path.join(output_dir, os.path.splitext(os.path.basename(tif))[0] + '_tiles.csv')
+        if os.path.exists(index_csv):
+            folders.setdefault(output_dir, []).append((index_csv, tif))
+    return parallel_utils.run_tasks(
+        [(f'triage {folder}', tile_triage.triage_scenes, (folder, folder_scenes, WATER_BANDS[source]))
+         for folder, folder_scenes in sorted(folders.items())], jobs=jobs)
+
+
+def main(years=YEARS, jobs=None, steps=('tile',), tile_source='rgb', tile_size=256,
+         overlap=0, rows_per_task=4, timings_csv=None, stack_stretch=False, tile_format='jpeg', catalog=None):
+    if jobs is None:
+        jobs = parallel_utils.default_jobs()
+    start = time.perf_counter()
+    for step in STEPS:
+        if step not in steps:
+            continue
+        if step == 'jpeg':
+            timings = parallel_utils.run_tasks(jpeg_tasks(years), jobs=jobs)
+        elif step == 'harmonize':
+            timings = run_harmonize(years, jobs)
+        elif step == 'tile':
+            timings = run_tile(years, jobs, tile_source, tile_size, overlap, rows_per_task, stack_stretch,
+                               tile_format, catalog)
+        else:
+            timings = run_triage(years, jobs, tile_source, catalog)
+        parallel_utils.print_timings(timings, title=f'[{step}]')
+        if timings_csv:
+            parallel_utils.write_timings(timings, timings_csv)
+    print(f"[SUCCESS] Preprocessing complete in {time.perf_counter() - start:.1f} s with {jobs} jobs")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parallel preprocessing for the Mombasa years')
+    parser.add_argument('--jobs', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--years', type=int, nargs='+', default=YEARS, help='Years to process')
+    parser.add_argument('--steps', nargs='+', choices=STEPS, default=['tile'], help='Steps to run, in pipeline order')
+    parser.add_argument('--tile-source', choices=sorted(TILE_BANDS), default='rgb',
+                        help='Tile the GEE RGB TIF (rgb), the harmonized scenes (harmonized) or all five '
+                             'harmonized bands as float16 shards (multispectral)')
+    parser.add_argument('--tile-size', type=int, default=256, help='Tile size in pixels')
+    parser.add_argument('--overlap', type=int, default=0, help='Tile overlap in pixels')
+    parser.add_argument('--rows-per-task', type=int, default=4, help='Tile rows per tiling task')
+    parser.add_argument('--timings', type=str, default=None, help='CSV to append per-task timings to')
+    parser.add_argument('--stack-stretch', action='store_true',
+                        help='Use one percentile stretch for all scenes and years instead of one per scene')
+    parser.add_argument('--tile-format', choices=TILE_FORMATS, default='jpeg',
+                        help='One JPEG per tile (jpeg) or one memory-mapped tile shard per scene (shard)')
+    parser.add_argument('--catalog', type=str, default=None,
+                        help='Scene catalog (utils/scene_catalog.py) to select RGB scenes from and record tiling in')
+    args = parser.parse_args()
+    main(years=args.years, jobs=args.jobs, steps=args.steps, tile_source=args.tile_source,
+         tile_size=args.tile_size, overlap=args.overlap, rows_per_task=args.rows_per_task,
+         timings_csv=args.timings, stack_stretch=args.stack_stretch, tile_format=args.tile_format,
+         catalog=args.catalog)
@@ -63,7 +63,9 @@ from utils.landsat_preproc import harmonize_site
 BASE = 'data'
 YEARS = [1994, 2004, 2014, 2024]
 
-def main():
+def main(jobs=1):
+    """Harmonize every Mombasa year; jobs > 1 matches scenes on a process pool
+    (see scripts/parallel_preprocess.py to also spread work across years)."""
     for year in YEARS:
         site = f'Mombasa_{year}'
         site_folder = os.path.join(BASE, site)
@@ -71,7 +73,7 @@ def main():
             print(f"Site folder {site_folder} not found. Please run download_mombasa.py first.")
             continue
         print(f"Processing {site_folder}...")
-        processed = harmonize_site(site_folder)
+        processed = harmonize_site(site_folder, jobs=jobs)
         print(f"Wrote {len(processed)} harmonized files for {site}")
 
 if __name__ == "__main__":
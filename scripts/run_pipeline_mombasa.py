@@ -5,12 +5,16 @@ Usage example:
     python scripts/run_pipeline_mombasa.py --year 2014 --model shoreline_gan_nov --epoch latest
 """
 import argparse
+import glob
 import os
 from scripts import download_mombasa, preprocess_mombasa, prepare_pix2pix_from_harmonized
-from utils import gan_inference_utils
+from scripts import extract_shorelines_simple
+from utils import gan_inference, gan_inference_utils, generator_backend, scene_tiler, tile_shards, tile_triage
+from utils import window_inference
 
 
-def run_year(year, model_name='shoreline_gan_nov', epoch='latest'):
+def run_year(year, model_name='shoreline_gan_nov', epoch='latest', batch_size=8, workers=None, stream=False,
+             service=None, window=None, window_memory=None, backend='eager', quantize=None, eval=False):
     site = f'Mombasa_{year}'
     base = 'data'
     site_folder = os.path.join(base, site)
@@ -38,7 +42,38 @@ def run_year(year, model_name='shoreline_gan_nov', epoch='latest'):
         raise FileNotFoundError(f'Pix2pix source folder not found: {source}')
 
     print('Running GAN inference and extracting shorelines...')
-    gan_inference_utils.run_and_process(site, source, model_name, coords_csv, epoch=epoch)
+    options = gan_inference.backend_options(backend, quantize, eval)
+    if window or window_memory:
+        # whole scenes in large windows, the scenes are the ones the tiles were cut from, read with the
+        # same band map as the tiles (harmonized B,G,R,NIR,SWIR -> R,G,B)
+        scenes = []
+        for index_csv in sorted(glob.glob(os.path.join(source, '*_tiles.csv'))):
+            records = scene_tiler.read_tile_index(index_csv)
+            if records and records[0]['scene'] not in scenes and os.path.exists(records[0]['scene']):
+                scenes.append(records[0]['scene'])
+        if not scenes:
+            raise FileNotFoundError(f'No scene GeoTIFFs listed in the tile indexes of {source}')
+        bands = prepare_pix2pix_from_harmonized.RGB_BANDS
+        generator = gan_inference.ShorelineGenerator(model_name, epoch, input_nc=len(bands), **options)
+        extract_shorelines_simple.process_gan_windows(generator, scenes, site, outputs_dir,
+                                                      window=window or window_inference.WINDOW_SIZE,
+                                                      max_memory_mb=window_memory, bands=bands)
+    elif stream:
+        # generator outputs go straight into the per-scene extraction, no mask PNGs in between
+        shards = tile_shards.find_shards(source)
+        input_nc = tile_shards.TileShard(shards[0]).tiles.shape[-1] if shards else 3
+        manifest = tile_triage.manifest_path(source)
+        generator = gan_inference.ShorelineGenerator(model_name, epoch, input_nc=input_nc, **options)
+        tile_indexes = sorted(glob.glob(os.path.join(source, '*_tiles.csv')))
+        extract_shorelines_simple.process_gan_stream(generator, source, site, outputs_dir,
+                                                     'tile_shard' if shards else 'single',
+                                                     manifest if os.path.exists(manifest) else None,
+                                                     tile_index_csvs=tile_indexes, batch_size=batch_size,
+                                                     num_workers=workers)
+    else:
+        gan_inference_utils.run_and_process(site, source, model_name, coords_csv, epoch=epoch,
+                                            batch_size=batch_size, num_workers=workers, service=service,
+                                            **options)
     print('Pipeline finished for year', year)
 
 
@@ -47,5 +82,28 @@ if __name__ == '__main__':
     parser.add_argument('--year', type=int, required=True, help='Year to run (1994/2004/2014/2024)')
     parser.add_argument('--model', default='shoreline_gan_nov', help='Model name in checkpoints')
     parser.add_argument('--epoch', default='latest', help='Epoch to load')
+    parser.add_argument('--batch-size', type=int, default=8, help='Tiles per generator forward pass')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Data loader worker processes for inference (default: sized to the cores)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Extract shorelines from the generator outputs in memory, without mask PNGs')
+    parser.add_argument('--service', default=None,
+                        help='host:port of a warm inference service (utils/inference_service.py), '
+                             'started in the background if none is running; that one exits after '
+                             '15 min without requests and logs to <checkpoints>/inference_service.log')
+    parser.add_argument('--window', type=int, default=None,
+                        help='Run the generator on whole scenes in windows of this many pixels '
+                             '(e.g. 1024-4096) instead of 256 px tiles')
+    parser.add_argument('--window-memory', type=float, default=None,
+                        help='Size the --window windows to this forward pass memory budget in MB')
+    parser.add_argument('--backend', default='eager', choices=generator_backend.BACKENDS,
+                        help='Optimized CPU generator (utils/generator_backend.py); implies --eval')
+    parser.add_argument('--quantize', default=None, choices=['dynamic'],
+                        help='int8 weights, with --backend onnx; implies --eval')
+    parser.add_argument('--eval', action='store_true',
+                        help='Use the BatchNorm running statistics instead of per-tile ones')
     args = parser.parse_args()
-    run_year(args.year, model_name=args.model, epoch=args.epoch)
+    run_year(args.year, model_name=args.model, epoch=args.epoch, batch_size=args.batch_size,
+             workers=args.workers, stream=args.stream, service=args.service,
+             window=args.window, window_memory=args.window_memory, backend=args.backend, quantize=args.quantize,
+             eval=args.eval)
@@ -3,11 +3,19 @@ Simple preprocessing script that converts RGB TIFs to JPEGs and creates pix2pix
 Works around ctypes/rasterio issues by using OpenCV directly.
 """
 import os
+import sys
 import glob
 import numpy as np
 import cv2
 from pathlib import Path
 
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from utils import radiometric_stretch
+from utils import scene_tiler
+from utils import tile_triage
+
 BASE = 'data'
 YEARS = [1994, 2004, 2014, 2024]
 
@@ -26,24 +34,10 @@ def load_tif_with_opencv(tif_path):
         return None
 
 def scale_to_uint8(data):
-    """Normalize data to 0-255 uint8 range."""
+    """Normalize data to 0-255 uint8 range (2-98 percentile stretch, see utils/radiometric_stretch.py)."""
     if data is None or len(data) == 0:
         return np.zeros_like(data, dtype='uint8')
-    
-    data = np.asarray(data, dtype='float32')
-    # Handle NaNs and infinities
-    data = np.nan_to_num(data, nan=0.0, posinf=0.0, neginf=0.0)
-    
-    # Use percentile-based normalization for robustness
-    p2 = np.nanpercentile(data, 2)
-    p98 = np.nanpercentile(data, 98)
-    
-    if p98 - p2 <= 0:
-        return np.zeros_like(data, dtype='uint8')
-    
-    scaled = 255.0 * (data - p2) / (p98 - p2)
-    scaled = np.clip(scaled, 0, 255).astype('uint8')
-    return scaled
+    return radiometric_stretch.scale_to_uint8(data)
 
 def process_rgb_tif_to_jpg(tif_path, output_jpg_path, output_jpeg_path=None):
     """Convert RGB TIF to JPEG and optionally to .jpeg."""
@@ -61,10 +55,8 @@ def process_rgb_tif_to_jpg(tif_path, output_jpg_path, output_jpeg_path=None):
         print(f"Unexpected image shape: {img.shape}")
         return False
     
-    # Normalize each channel
-    rgb_u8 = np.zeros_like(rgb, dtype='uint8')
-    for b in range(min(3, rgb.shape[2])):
-        rgb_u8[:, :, b] = scale_to_uint8(rgb[:, :, b])
+    # Normalize each channel, block by block into one uint8 output
+    rgb_u8 = radiometric_stretch.stretch_to_uint8(rgb)
     
     # Save as JPG
     os.makedirs(os.path.dirname(output_jpg_path), exist_ok=True)
@@ -111,8 +103,24 @@ def split_and_resize_simple(input_dir, output_dir, tile_size=256, overlap=0, use
     print(f"Created {tile_count} tiles in {output_dir}")
     return tile_count
 
-def main():
-    """Process all Mombasa years."""
+def tile_tif_windowed(tif_path, output_dir, tile_size=256, overlap=0, use_jpeg=False):
+    """
+    Cut an RGB TIF straight into pix2pix tiles, reading one tile window at a time.
+    Tile names match split_and_resize_simple; each tile also gets a world file and
+    the scene gets a <name>_tiles.csv index with the tile geotransforms.
+    """
+    ext = '.jpeg' if use_jpeg else '.jpg'
+    records = scene_tiler.tile_scene(tif_path, output_dir, tile_size=tile_size,
+                                     overlap=overlap, bands=(1, 2, 3), ext=ext)
+    print(f"Created {len(records)} tiles in {output_dir}")
+    return len(records)
+
+def main(windowed=True, overlap=32):
+    """Process all Mombasa years.
+    windowed=True tiles straight from the TIF with bounded memory and skips the
+    full-scene JPEG; windowed=False keeps the original in-memory path.
+    overlap: tile overlap of the windowed path, blended back together by
+    utils/mask_mosaic.py before shoreline extraction."""
     for year in YEARS:
         site = f'Mombasa_{year}'
         site_folder = os.path.join(BASE, site)
@@ -130,6 +138,15 @@ def main():
             print(f"[SKIP] TIF not found: {tif_path}")
             continue
         
+        pix2pix_dir = os.path.join(site_folder, 'jpg_files', 'pix2pix_ready')
+        if windowed:
+            print(f"[INFO] Creating windowed pix2pix tiles for {site}...")
+            tile_tif_windowed(tif_path, pix2pix_dir, tile_size=256, overlap=overlap, use_jpeg=True)
+            # mark nodata / featureless tiles so inference can skip them
+            index_csv = os.path.join(pix2pix_dir, f'mombasa_{year}_RGB_tiles.csv')
+            tile_triage.triage_folder(pix2pix_dir, index_csv=index_csv)
+            continue
+        
         print(f"[INFO] Converting {tif_path} to JPEG...")
         if process_rgb_tif_to_jpg(tif_path, jpg_path, jpeg_path):
             print(f"[OK] Saved JPEG to {jpg_path}")
@@ -139,7 +156,6 @@ def main():
         
         # Step 2: Create pix2pix tiles (.jpeg format for GAN inference)
         preprocessed_dir = os.path.join(site_folder, 'jpg_files', 'preprocessed')
-        pix2pix_dir = os.path.join(site_folder, 'jpg_files', 'pix2pix_ready')
         
         print(f"[INFO] Creating pix2pix tiles for {site}...")
         split_and_resize_simple(preprocessed_dir, pix2pix_dir, tile_size=256, overlap=0, use_jpeg=True)
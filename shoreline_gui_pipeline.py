@@ -141,7 +141,7 @@ class ShorelineGANPipelineApp(QMainWindow):
         stages = [
             ("📥", "Load Data", "python scripts/download_mombasa.py"),
             ("⚙️", "Preprocess", "python scripts/preprocess_mombasa.py"),
-            ("🧠", "Run GAN", "python scripts/run_pipeline_mombasa.py --year 2014 --model shoreline_gan_nov --epoch latest"),
+            ("🧠", "Run GAN", "python scripts/run_pipeline_mombasa.py --year 2014 --model shoreline_gan_nov --epoch latest --service 127.0.0.1:8765"),
             ("🌊", "Extract Shorelines", "python scripts/extract_shorelines_simple.py"),
             ("📈", "Temporal Analysis", "python scripts/run_phase3_full.py"),
             ("📊", "Generate Reports", "python scripts/generate_report.py"),
@@ -0,0 +1,62 @@
+"""Reference implementations and fixtures shared by several test modules."""
+import os
+import numpy as np
+
+
+def unique_hist_match(source, template):
+    # SDS_preprocess.hist_match, kept here as the reference behaviour
+    oldshape = source.shape
+    source = source.ravel()
+    template = template.ravel()
+    s_values, bin_idx, s_counts = np.unique(source, return_inverse=True, return_counts=True)
+    t_values, t_counts = np.unique(template, return_counts=True)
+    s_quantiles = np.cumsum(s_counts).astype(np.float64)
+    s_quantiles /= s_quantiles[-1]
+    t_quantiles = np.cumsum(t_counts).astype(np.float64)
+    t_quantiles /= t_quantiles[-1]
+    interp_t_values = np.interp(s_quantiles, t_quantiles, t_values)
+    return interp_t_values[bin_idx.ravel()].reshape(oldshape)
+
+
+def percentile_rescale(im, cloud_mask, prob_high):
+    # SDS_preprocess.rescale_image_intensity before it used streaming histograms, kept here as the
+    # reference behaviour (exposure.rescale_intensity with in_range=(0, high) on non-negative floats)
+    vec_mask = cloud_mask.reshape(im.shape[0] * im.shape[1])
+    vec = im.reshape(im.shape[0] * im.shape[1], -1)
+    vec_adj = np.ones(vec.shape) * np.nan
+    for i in range(vec.shape[1]):
+        prc_high = np.percentile(vec[~vec_mask, i], prob_high)
+        vec_adj[~vec_mask, i] = np.clip(vec[~vec_mask, i], 0, prc_high) / prc_high
+    return vec_adj.reshape(im.shape)
+
+
+def write_tif(path, arr, x0=561030.0, y0=9574440.0, res=30.0, nodata=None):
+    # a (bands, rows, cols) GeoTIFF in UTM 37S (Mombasa), needs rasterio
+    import rasterio
+    from rasterio.transform import from_origin
+    bands, rows, cols = arr.shape
+    with rasterio.open(path, 'w', driver='GTiff', height=rows, width=cols, count=bands,
+                       dtype=arr.dtype, crs='EPSG:32737', transform=from_origin(x0, y0, res, res),
+                       nodata=nodata) as dst:
+        dst.write(arr)
+    return path
+
+
+def small_generator(input_nc=3):
+    # a small random unet_256 generator (ngf=8, seeded), needs torch
+    import torch
+    from utils import gan_inference
+    gan_inference._pix2pix_path()
+    from models import networks
+    torch.manual_seed(0)
+    return networks.define_G(input_nc, 1, 8, 'unet_256', 'batch', False, 'normal', 0.02, [])
+
+
+def generator_checkpoint(tmp_path, model_name='shoreline_test', input_nc=3):
+    # small_generator saved as <tmp_path>/checkpoints/<model_name>/latest_net_G.pth, needs torch
+    import torch
+    net = small_generator(input_nc)
+    checkpoints_dir = str(tmp_path / 'checkpoints')
+    os.makedirs(os.path.join(checkpoints_dir, model_name))
+    torch.save(net.state_dict(), os.path.join(checkpoints_dir, model_name, 'latest_net_G.pth'))
+    return checkpoints_dir
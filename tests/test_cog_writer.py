@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+rasterio = pytest.importorskip('rasterio')
+
+from utils import cog_writer, scene_tiler
+
+GEOREF = (561030.0, 30.0, 0.0, 9574440.0, 0.0, -30.0)
+WKT = 'EPSG:32737'
+
+
+def test_overview_levels_until_one_block():
+    assert cog_writer.overview_levels(1024, 700, 256) == [2, 4]
+    assert cog_writer.overview_levels(200, 250, 256) == []
+    assert cog_writer.predictor('float32') == 3
+    assert cog_writer.predictor('uint16') == 2
+
+
+def test_write_cog_tiled_compressed_with_overviews(tmp_path):
+    rng = np.random.default_rng(0)
+    arr = rng.random((600, 700, 5)).astype('float32')
+    path = cog_writer.write_cog(str(tmp_path / 'scene_harm.tif'), arr, GEOREF, WKT)
+
+    with rasterio.open(path) as src:
+        assert src.count == 5
+        assert src.block_shapes[0] == (256, 256)
+        assert src.compression.name.upper() == 'DEFLATE'
+        assert src.overviews(1) == [2, 4]
+        assert src.transform.to_gdal() == GEOREF
+        np.testing.assert_array_equal(np.moveaxis(src.read(), 0, -1), arr)
+    assert not (tmp_path / 'scene_harm.tif.tmp.tif').exists()
+
+    with scene_tiler.WindowedRaster(path) as raster:
+        np.testing.assert_array_equal(raster.read([2], 300, 400, 64, 64)[0], arr[300:364, 400:464, 1])
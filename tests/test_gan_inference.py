@@ -0,0 +1,117 @@
+import os
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+cv2 = pytest.importorskip('cv2')
+
+from tests.helpers import generator_checkpoint as _checkpoint
+from utils import gan_inference
+
+
+def _tiles(tmp_path, n=5):
+    folder = str(tmp_path / 'pix2pix_ready')
+    os.makedirs(folder)
+    rng = np.random.default_rng(0)
+    for i in range(n):
+        cv2.imwrite(os.path.join(folder, 'tile_%d.jpeg' % i), rng.integers(0, 255, (256, 256, 3), dtype=np.uint8))
+    return folder
+
+
+def test_masks_do_not_depend_on_batch_size(tmp_path):
+    gen = gan_inference.ShorelineGenerator('shoreline_test', checkpoints_dir=_checkpoint(tmp_path), ngf=8,
+                                           no_dropout=True, device='cpu')
+    source = _tiles(tmp_path)
+    single = gan_inference.infer(source, 'shoreline_test', batch_size=1, generator=gen)
+    batched = gan_inference.infer(source, 'shoreline_test', batch_size=4, generator=gen)
+    assert len(single) == 5
+    for path, mask in single.items():
+        assert mask.shape == (256, 256) and mask.dtype == np.uint8
+        assert np.abs(mask.astype(int) - batched[path]).max() <= 1
+
+
+def test_results_written_like_test_py(tmp_path):
+    gen = gan_inference.ShorelineGenerator('shoreline_test', checkpoints_dir=_checkpoint(tmp_path), ngf=8,
+                                           no_dropout=True, device='cpu')
+    folder = gan_inference.infer(_tiles(tmp_path), 'shoreline_test', results_dir=str(tmp_path / 'gan'),
+                                 max_tiles=3, generator=gen)
+    assert folder == os.path.join(str(tmp_path / 'gan'), 'shoreline_test', 'test_latest', 'images')
+    names = sorted(os.listdir(folder))
+    assert len(names) == 6
+    assert sum(name.endswith('_fake.png') for name in names) == 3
+    assert cv2.imread(os.path.join(folder, names[0])).shape == (256, 256, 3)
+
+
+def test_worker_decoding_matches_in_process(tmp_path):
+    gen = gan_inference.ShorelineGenerator('shoreline_test', checkpoints_dir=_checkpoint(tmp_path), ngf=8,
+                                           no_dropout=True, device='cpu')
+    source = _tiles(tmp_path)
+    in_process = gan_inference.infer(source, 'shoreline_test', batch_size=2, num_workers=0, generator=gen)
+    workers = gan_inference.infer(source, 'shoreline_test', batch_size=2, num_workers=2, generator=gen)
+    assert list(workers) == list(in_process)
+    for path, mask in in_process.items():
+        np.testing.assert_array_equal(mask, workers[path])
+    # the worker processes are kept for the next run over the same tiles
+    assert len(gen._loaders) == 1
+    gan_inference.infer(source, 'shoreline_test', batch_size=2, num_workers=2, generator=gen)
+    assert len(gen._loaders) == 1
+    gen.close()
+
+
+def test_runs_keep_one_worker_pool_and_restore_threads(tmp_path):
+    gen = gan_inference.ShorelineGenerator('shoreline_test', checkpoints_dir=_checkpoint(tmp_path), ngf=8,
+                                           no_dropout=True, device='cpu')
+    first = _tiles(tmp_path)
+    second = str(tmp_path / 'other_tiles')
+    os.makedirs(second)
+    cv2.imwrite(os.path.join(second, 'tile_0.jpeg'), np.full((256, 256, 3), 128, dtype=np.uint8))
+    threads = torch.get_num_threads()
+    gan_inference.infer(first, 'shoreline_test', batch_size=2, num_workers=2, generator=gen)
+    pool = next(iter(gen._loaders.values()))
+    gan_inference.infer(second, 'shoreline_test', batch_size=2, num_workers=2, generator=gen)
+    # the pool of the first folder was shut down when the second was opened
+    assert len(gen._loaders) == gan_inference.MAX_LOADERS == 1
+    assert pool._iterator is None
+    assert torch.get_num_threads() == threads
+    gen.close()
+    assert not gen._loaders
+
+
+def test_split_threads_and_prefetch():
+    assert gan_inference.split_threads(None, cpus=1) == (0, 1)
+    assert gan_inference.split_threads(None, cpus=16) == (3, 13)
+    assert gan_inference.split_threads(2, cpus=8) == (2, 6)
+    assert list(gan_inference.prefetch(iter(range(10)), depth=2)) == list(range(10))
+
+    def failing():
+        yield 1
+        raise IOError('unreadable tile')
+    with pytest.raises(IOError):
+        list(gan_inference.prefetch(failing()))
+
+
+def test_mask_only_writer_and_index(tmp_path):
+    gen = gan_inference.ShorelineGenerator('shoreline_test', checkpoints_dir=_checkpoint(tmp_path), ngf=8,
+                                           no_dropout=True, device='cpu')
+    source = _tiles(tmp_path)
+    masks = gan_inference.infer(source, 'shoreline_test', batch_size=2, generator=gen)
+    folder = gan_inference.infer(source, 'shoreline_test', results_dir=str(tmp_path / 'gan'), batch_size=2,
+                                 generator=gen, output='masks')
+    assert sorted(os.listdir(folder)) == ['tile_%d_fake.png' % i for i in range(5)]
+    for path, mask in masks.items():
+        name = os.path.splitext(os.path.basename(path))[0]
+        np.testing.assert_array_equal(cv2.imread(os.path.join(folder, name + '_fake.png'), cv2.IMREAD_UNCHANGED),
+                                      mask)
+
+    pytest.importorskip('dominate')
+    with gan_inference.ResultWriter(str(tmp_path / 'web' / 'images'), output='masks', html=True) as writer:
+        writer.submit(list(masks)[:2], list(masks.values())[:2])
+    with open(str(tmp_path / 'web' / 'index.html')) as f:
+        assert f.read().count('_fake.png') == 4
+
+
+def test_writer_errors_surface_on_close(tmp_path):
+    writer = gan_inference.ResultWriter(str(tmp_path / 'images'), output='masks')
+    writer.submit(['tile_0.jpeg'], [None])
+    with pytest.raises(Exception):
+        writer.close()
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+gdal = pytest.importorskip('osgeo.gdal')
+pytest.importorskip('rasterio')
+
+from utils.coastsat import gdal_merge
+from tests.helpers import write_tif as _write_tif
+
+
+def _inputs(tmp_path, nodata=None):
+    """Three overlapping 2-band scenes on one grid, with zero (nodata) holes in the later ones."""
+    rng = np.random.default_rng(0)
+    paths = []
+    for i, (dx, dy) in enumerate([(0, 0), (37, 21), (55, 64)]):
+        arr = rng.integers(1, 1000, (2, 90, 110)).astype(np.int16)
+        if i:
+            arr[:, 10:40, 5:60] = 0
+        paths.append(_write_tif(str(tmp_path / f'scene_{i}.tif'), arr, 561030.0 + dx * 30.0,
+                                9574440.0 - dy * 30.0, nodata=nodata))
+    return paths
+
+
+def _merge(tmp_path, name, inputs, *options):
+    out = str(tmp_path / name)
+    gdal_merge.main(['gdal_merge.py', '-q', '-o', out] + list(options) + inputs)
+    ds = gdal.Open(out)
+    arr, geotransform = ds.ReadAsArray(), ds.GetGeoTransform()
+    ds = None
+    return arr, geotransform
+
+
+def test_block_windows_cover_the_output():
+    blocks = gdal_merge.block_windows(100, 70, 32)
+    assert len(blocks) == 4 * 3
+    assert blocks[-1] == (96, 64, 4, 6)
+    covered = np.zeros((70, 100), dtype=int)
+    for x, y, w, h in blocks:
+        covered[y:y + h, x:x + w] += 1
+    assert (covered == 1).all()
+
+
+@pytest.mark.parametrize('validity', [[], ['-n', '0']])
+def test_block_mode_matches_classic_copy(tmp_path, validity):
+    inputs = _inputs(tmp_path)
+    classic = _merge(tmp_path, 'classic.tif', inputs, *validity)
+    for jobs, block in [('1', '32'), ('2', '17')]:
+        blocks = _merge(tmp_path, f'blocks_{jobs}.tif', inputs, *validity, '-jobs', jobs, '-block', block)
+        assert blocks[1] == classic[1]
+        np.testing.assert_array_equal(blocks[0], classic[0])
+
+
+def test_mask_band_last_matches_classic_copy(tmp_path):
+    # no -n: zeros are invalid through the band mask of the inputs' nodata value
+    inputs = _inputs(tmp_path, nodata=0)
+    classic = _merge(tmp_path, 'classic.tif', inputs)
+    blocks = _merge(tmp_path, 'blocks.tif', inputs, '-composite', 'last', '-jobs', '2', '-block', '32')
+    np.testing.assert_array_equal(blocks[0], classic[0])
+
+
+def test_first_and_mean_composites(tmp_path):
+    inputs = _inputs(tmp_path)
+    first = _merge(tmp_path, 'first.tif', inputs, '-n', '0', '-composite', 'first')[0]
+    reversed_last = _merge(tmp_path, 'reversed.tif', inputs[::-1], '-n', '0', '-composite', 'last')[0]
+    np.testing.assert_array_equal(first, reversed_last)
+
+    # each input alone on the grid of the composite, 0 where it is missing or nodata
+    mean, geotransform = _merge(tmp_path, 'mean.tif', inputs, '-n', '0', '-composite', 'mean')
+    ul_lr = [geotransform[0], geotransform[3], geotransform[0] + mean.shape[2] * geotransform[1],
+             geotransform[3] + mean.shape[1] * geotransform[5]]
+    alone = np.stack([_merge(tmp_path, f'alone_{i}.tif', [path], '-ul_lr', *map(str, ul_lr))[0]
+                      for i, path in enumerate(inputs)])
+    count = (alone != 0).sum(0)
+    expected = np.round(alone.sum(0, dtype=np.float64) / np.maximum(count, 1))
+    np.testing.assert_array_equal(mean, expected.astype(mean.dtype))
@@ -0,0 +1,62 @@
+import os
+import numpy as np
+import pytest
+
+gdal = pytest.importorskip('osgeo.gdal')
+pytest.importorskip('rasterio')
+
+from utils.gdal_modules import gdal_retile
+from tests.helpers import write_tif
+
+
+def _write_tif(path, rows=200, cols=150, bands=3, seed=0):
+    return write_tif(path, np.random.default_rng(seed).integers(0, 255, (bands, rows, cols), dtype=np.uint8))
+
+
+def _retile(src, target, jobs, levels=0):
+    os.makedirs(target)
+    gdal_retile.initGlobals()
+    gdal_retile.Quiet = True
+    gdal_retile.Names = [src]
+    gdal_retile.TileWidth = gdal_retile.TileHeight = 64
+    gdal_retile.Overlap = 8
+    gdal_retile.Levels = levels
+    gdal_retile.TargetDir = target + os.sep
+    gdal_retile.Jobs = jobs
+    assert gdal_retile.main() == 0
+    gdal_retile.Jobs = 1
+
+
+def _read_tiles(folder):
+    tiles = {}
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if name.endswith('.tif'):
+                ds = gdal.Open(os.path.join(root, name))
+                tiles[os.path.relpath(os.path.join(root, name), folder)] = (ds.ReadAsArray(), ds.GetGeoTransform())
+                ds = None
+    return tiles
+
+
+def test_dataset_cache_evicts_least_recently_used(tmp_path):
+    paths = [_write_tif(str(tmp_path / f'scene_{i}.tif'), 8, 8, 1, seed=i) for i in range(3)]
+    cache = gdal_retile.DataSetCache(cacheSize=2)
+    first = cache.get(paths[0])
+    cache.get(paths[1])
+    assert cache.get(paths[0]) is first
+    cache.get(paths[2])
+    assert list(cache.dict) == [paths[0], paths[2]]
+
+
+def test_parallel_tiles_match_serial(tmp_path):
+    src = _write_tif(str(tmp_path / 'scene.tif'))
+    _retile(src, str(tmp_path / 'serial'), jobs=1, levels=1)
+    _retile(src, str(tmp_path / 'parallel'), jobs=2, levels=1)
+    serial = _read_tiles(str(tmp_path / 'serial'))
+    parallel = _read_tiles(str(tmp_path / 'parallel'))
+    # 3 x 4 level 0 tiles of 64 px with 8 px overlap, plus the pyramid level
+    assert len([name for name in serial if os.sep not in name]) == 12
+    assert sorted(parallel) == sorted(serial)
+    for name, (arr, geotransform) in serial.items():
+        np.testing.assert_array_equal(parallel[name][0], arr)
+        assert parallel[name][1] == geotransform
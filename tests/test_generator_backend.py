@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from utils import gan_inference, generator_backend
+from tests.helpers import small_generator
+
+
+def _generator(input_nc=3):
+    net = small_generator(input_nc)
+    # running statistics that differ from the initial ones, so folding has something to fold
+    net.train()
+    with torch.no_grad():
+        for _ in range(3):
+            net(torch.rand(4, input_nc, 256, 256) * 2 - 1)
+    return net.eval()
+
+
+def test_fold_batchnorm_matches_eval_model():
+    net = _generator()
+    folded = generator_backend.fold_batchnorm(net)
+    assert not any(isinstance(m, torch.nn.BatchNorm2d) for m in folded.modules())
+    x = torch.rand(2, 3, 256, 256) * 2 - 1
+    with torch.no_grad():
+        torch.testing.assert_close(folded(x), net(x), atol=1e-5, rtol=1e-4)
+    with pytest.raises(ValueError):
+        generator_backend.fold_batchnorm(net.train())
+
+
+def test_torchscript_and_static_int8():
+    net = _generator()
+    x = torch.rand(2, 3, 256, 256) * 2 - 1
+    with torch.no_grad():
+        ref = net(x)
+        scripted = generator_backend.compile_generator(net, 'torchscript')
+        torch.testing.assert_close(scripted(x), ref, atol=1e-5, rtol=1e-4)
+        calibration = [torch.rand(2, 3, 256, 256) * 2 - 1 for _ in range(2)]
+        quantized = generator_backend.compile_generator(net, 'torchscript', 'static', calibration)
+        assert (quantized(x) - ref).abs().max() < 0.25
+    with pytest.raises(ValueError):
+        generator_backend.compile_generator(net, 'torchscript', 'dynamic')
+
+
+def test_onnx_backend(tmp_path):
+    pytest.importorskip('onnxruntime')
+    net = _generator()
+    x = torch.rand(3, 3, 256, 256) * 2 - 1
+    onnx_gen = generator_backend.compile_generator(net, 'onnx', onnx_path=str(tmp_path / 'g.onnx'))
+    with torch.no_grad():
+        torch.testing.assert_close(onnx_gen(x), net(x), atol=1e-4, rtol=1e-3)
+
+
+def test_mask_iou_and_benchmark():
+    a = np.zeros((4, 4), np.uint8)
+    b = a.copy()
+    assert generator_backend.mask_iou(a, b) == 1.0
+    a[:2] = 255
+    b[1:3] = 255
+    assert generator_backend.mask_iou(a, b) == pytest.approx(1 / 3)
+
+    net = _generator()
+    batches = [torch.rand(2, 3, 256, 256) * 2 - 1]
+    rows = generator_backend.benchmark(net, {'folded': generator_backend.fold_batchnorm(net)}, batches)
+    assert [row['label'] for row in rows] == ['eager fp32', 'folded']
+    assert rows[1]['iou'] == 1.0 and rows[1]['tiles_per_sec'] > 0
+    assert 'baseline_iou' not in rows[1]
+    # IoU against the generator the pipeline runs by default, identical here
+    rows = generator_backend.benchmark(net, {'folded': generator_backend.fold_batchnorm(net)}, batches,
+                                       baseline=net)
+    assert rows[0]['baseline_iou'] == 1.0 and rows[1]['baseline_iou'] == 1.0
+
+
+def test_backend_options_switch_to_eval():
+    assert gan_inference.backend_options() == {'eval': False, 'backend': 'eager', 'quantize': None}
+    assert gan_inference.backend_options(eval=True)['eval']
+    assert gan_inference.backend_options('torchscript')['eval']
+    assert gan_inference.backend_options('onnx', 'dynamic') == {'eval': True, 'backend': 'onnx',
+                                                                'quantize': 'dynamic'}
+
+
+def test_optimized_backend_needs_eval(tmp_path):
+    import os
+    checkpoints_dir = str(tmp_path)
+    os.makedirs(os.path.join(checkpoints_dir, 'm'))
+    torch.save(_generator().state_dict(), os.path.join(checkpoints_dir, 'm', 'latest_net_G.pth'))
+    with pytest.raises(ValueError):
+        gan_inference.ShorelineGenerator('m', checkpoints_dir=checkpoints_dir, ngf=8, backend='torchscript')
+    gen = gan_inference.ShorelineGenerator('m', checkpoints_dir=checkpoints_dir, ngf=8, eval=True,
+                                           backend='torchscript', device='cpu')
+    assert gen.predict(torch.zeros(1, 3, 256, 256)).shape == (1, 1, 256, 256)
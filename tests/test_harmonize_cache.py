@@ -0,0 +1,77 @@
+import os
+import json
+
+from utils import harmonize_cache
+
+
+def _inputs(tmp_path):
+    files = []
+    for name in ['scene_a', 'scene_b']:
+        path = str(tmp_path / f'{name}.tif')
+        with open(path, 'wb') as f:
+            f.write(name.encode())
+        files.append(path)
+    return files
+
+
+def test_key_changes(tmp_path, monkeypatch):
+    fn = _inputs(tmp_path)
+    params = {'target_bands': 5}
+    key = harmonize_cache.scene_key(fn, params, 'ref')
+    assert harmonize_cache.scene_key(list(fn), dict(params), 'ref') == key
+    assert harmonize_cache.scene_key(fn[0], params, 'ref') != key
+    assert harmonize_cache.scene_key(fn, {'target_bands': 4}, 'ref') != key
+    assert harmonize_cache.scene_key(fn, params, 'other ref') != key
+    assert harmonize_cache.scene_key(fn, params) != key
+    monkeypatch.setattr(harmonize_cache, 'HARMONIZE_VERSION', harmonize_cache.HARMONIZE_VERSION + 1)
+    assert harmonize_cache.scene_key(fn, params, 'ref') != key
+    monkeypatch.undo()
+    with open(fn[1], 'wb') as f:
+        f.write(b'reprocessed scene')
+    assert harmonize_cache.scene_key(fn, params, 'ref') != key
+
+
+def test_digests_reused_while_stat_unchanged(tmp_path):
+    path = _inputs(tmp_path)[0]
+    manifest = harmonize_cache.empty_manifest()
+    digest = harmonize_cache.file_digest(path, manifest)
+    assert manifest['files'][path]['sha256'] == digest
+    # a stale digest is returned as long as size and mtime match, i.e. the file is not reread
+    manifest['files'][path]['sha256'] = 'cached'
+    assert harmonize_cache.file_digest(path, manifest) == 'cached'
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert harmonize_cache.file_digest(path, manifest) == digest
+
+
+def test_manifest_round_trip_and_lookup(tmp_path):
+    out = str(tmp_path / 'harmonized')
+    os.makedirs(out)
+    assert harmonize_cache.load_manifest(out) == harmonize_cache.empty_manifest()
+
+    fn = _inputs(tmp_path)
+    manifest = harmonize_cache.empty_manifest()
+    key = harmonize_cache.scene_key(fn[0], {'target_bands': 5}, manifest=manifest)
+    output = str(tmp_path / 'harmonized' / 'scene_a_harmonized.tif')
+    with open(output, 'wb') as f:
+        f.write(b'harmonized')
+    harmonize_cache.record(manifest, fn[0], key, output, 'reference')
+    harmonize_cache.record(manifest, fn[1], 'skipped key', None, 'skipped')
+    harmonize_cache.record_run(manifest, [fn[0]], [fn[1]])
+    harmonize_cache.save_manifest(manifest, out)
+
+    loaded = harmonize_cache.load_manifest(out)
+    assert loaded == json.loads(json.dumps(manifest))
+    assert harmonize_cache.lookup(loaded, fn[0], key)['output'] == output
+    assert harmonize_cache.lookup(loaded, fn[0], 'other key') is None
+    assert harmonize_cache.lookup(loaded, fn[1], 'skipped key')['output'] is None
+    assert loaded['last_run']['hits'] == [fn[0]]
+    # a deleted output is a miss
+    os.remove(output)
+    assert harmonize_cache.lookup(loaded, fn[0], key) is None
+
+
+def test_unreadable_manifest_is_ignored(tmp_path):
+    with open(harmonize_cache.manifest_path(str(tmp_path)), 'w') as f:
+        f.write('{not json')
+    assert harmonize_cache.load_manifest(str(tmp_path)) == harmonize_cache.empty_manifest()
@@ -0,0 +1,36 @@
+import numpy as np
+from utils import hist_matching
+from tests.helpers import unique_hist_match
+
+
+def test_integer_bands_match_unique_implementation():
+    rng = np.random.default_rng(0)
+    source = rng.integers(0, 3000, (120, 90)).astype(np.uint16)
+    template = rng.normal(8000, 900, (100, 100)).astype(np.int16)
+    expected = unique_hist_match(source, template)
+    result = hist_matching.hist_match(source, template)
+    np.testing.assert_allclose(result, expected, rtol=1e-6)
+
+
+def test_float_bands_close_to_unique_implementation():
+    rng = np.random.default_rng(1)
+    source = rng.gamma(2.0, 0.05, (200, 150))
+    template = rng.beta(2.0, 5.0, (180, 160))
+    expected = unique_hist_match(source, template)
+    result = hist_matching.hist_match(source, template)
+    assert np.abs(result - expected).max() < 2e-3
+
+
+def test_matcher_batch_and_nan_handling():
+    rng = np.random.default_rng(2)
+    reference = rng.random((64, 64, 3))
+    scenes = [rng.random((50, 40, 3)) * (k + 1) for k in range(3)]
+    scenes[1][5, 7, 2] = np.nan
+    matcher = hist_matching.HistogramMatcher(reference)
+    results = list(matcher.match_many(scenes))
+    assert [r.shape for r in results] == [s.shape for s in scenes]
+    assert np.isnan(results[1][5, 7, 2])
+    assert np.isfinite(results[1][:, :, :2]).all()
+    for r in results:
+        assert np.nanmin(r) >= reference.min() - 1e-6
+        assert np.nanmax(r) <= reference.max() + 1e-6
@@ -0,0 +1,169 @@
+import os
+import threading
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+cv2 = pytest.importorskip('cv2')
+
+from utils import gan_inference, inference_service
+from tests.helpers import generator_checkpoint
+
+
+@pytest.fixture
+def service(tmp_path):
+    checkpoints_dir = generator_checkpoint(tmp_path, 'm')
+    server = inference_service.InferenceServer(('127.0.0.1', 0), checkpoints_dir, device='cpu', max_batch=8,
+                                               max_wait=0.05)
+    server.start()
+    yield server, checkpoints_dir
+    server.shutdown()
+
+
+def _tiles(n, seed=0):
+    return np.random.default_rng(seed).integers(0, 255, (n, 256, 256, 3), dtype=np.uint8)
+
+
+def test_masks_match_in_process_generator(service, tmp_path, monkeypatch):
+    server, checkpoints_dir = service
+    monkeypatch.setattr(inference_service, 'CHUNK', 2)
+    tiles = _tiles(5)
+    paths = []
+    for i, tile in enumerate(tiles):
+        paths.append(str(tmp_path / ('t%d.png' % i)))
+        cv2.imwrite(paths[-1], tile[:, :, ::-1])
+    gen = gan_inference.ShorelineGenerator('m', checkpoints_dir=checkpoints_dir, ngf=8, no_dropout=True,
+                                           device='cpu')
+    expected = gan_inference.to_uint8(gen.predict(gan_inference.tiles_to_batch(tiles)))
+
+    with inference_service.InferenceClient(server.address) as client:
+        assert client.ping()['ok']
+        for request in [{'tiles': tiles}, {'paths': paths}]:
+            masks = np.zeros_like(expected)
+            chunks = list(client.infer('m', ngf=8, no_dropout=True, **request))
+            assert len(chunks) > 1  # streamed back chunk by chunk
+            for indices, chunk in chunks:
+                masks[indices.start:indices.stop] = chunk
+            assert np.abs(masks.astype(int) - expected).max() <= 1
+        assert len(client.stats()) == 1  # loaded once, kept between requests
+
+
+def test_concurrent_requests_are_coalesced(service):
+    server, _ = service
+    with inference_service.InferenceClient(server.address) as client:
+        client.load('m', ngf=8, no_dropout=True)
+    results = {}
+
+    def request(i):
+        with inference_service.InferenceClient(server.address) as client:
+            results[i] = sum(len(chunk) for _, chunk in client.infer('m', tiles=_tiles(2, i), ngf=8,
+                                                                      no_dropout=True))
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == {i: 2 for i in range(4)}
+    stats = server.registry.stats()[0]
+    assert stats['tiles'] == 8 and stats['batches'] < 4
+
+
+def test_errors_are_sent_back(service):
+    server, _ = service
+    with inference_service.InferenceClient(server.address) as client:
+        with pytest.raises(RuntimeError):
+            list(client.infer('no_such_model', tiles=_tiles(1)))
+        assert client.ping()['ok']
+
+
+def test_model_options_stay_in_the_checkpoints_dir(service, tmp_path):
+    server, _ = service
+    # a checkpoint outside the service's checkpoints_dir
+    os.makedirs(str(tmp_path / 'elsewhere' / 'm'))
+    with inference_service.InferenceClient(server.address) as client:
+        for options in [{'checkpoints_dir': str(tmp_path / 'elsewhere')}, {'map_location': 'cpu'},
+                        {'ngf': '8'}]:
+            with pytest.raises(RuntimeError, match='model option'):
+                client.load('m', **options)
+        for model in ['../elsewhere/m', os.path.join(str(tmp_path), 'elsewhere', 'm'), '..']:
+            with pytest.raises(RuntimeError, match='plain name'):
+                client.load(model)
+        with pytest.raises(RuntimeError, match='plain name'):
+            client.load('m', epoch='../../elsewhere/m/latest')
+        assert client.stats() == []
+    assert inference_service.model_options({'model': 'm', 'epoch': 200, 'ngf': 8}) == \
+        {'model': 'm', 'epoch': 200, 'ngf': 8}
+    with pytest.raises(ValueError):
+        inference_service.model_options(None)
+
+
+def test_retrained_checkpoint_is_reloaded(service):
+    server, checkpoints_dir = service
+    registry = server.registry
+    worker = registry.get('m', ngf=8, no_dropout=True)
+    assert registry.get('m', ngf=8, no_dropout=True) is worker
+    path = registry.checkpoint_path('m')
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    reloaded = registry.get('m', ngf=8, no_dropout=True)
+    assert reloaded is not worker and len(registry.stats()) == 1
+    worker._thread.join(timeout=5)
+    assert not worker._thread.is_alive()  # the stale generator's thread stopped
+
+
+def test_slow_load_does_not_block_loaded_models(service, monkeypatch):
+    server, checkpoints_dir = service
+    registry = server.registry
+    worker = registry.get('m', ngf=8, no_dropout=True)
+    os.makedirs(os.path.join(checkpoints_dir, 'slow'))
+    with open(registry.checkpoint_path('slow'), 'wb'):
+        pass
+    loading, release = threading.Event(), threading.Event()
+
+    def slow_generator(*args, **kwargs):
+        loading.set()
+        release.wait(timeout=10)
+        raise RuntimeError('not a checkpoint')
+    monkeypatch.setattr(gan_inference, 'ShorelineGenerator', slow_generator)
+    errors = []
+
+    def load():
+        try:
+            registry.get('slow')
+        except RuntimeError as e:
+            errors.append(e)
+    thread = threading.Thread(target=load)
+    thread.start()
+    assert loading.wait(timeout=10)
+    assert registry.get('m', ngf=8, no_dropout=True) is worker
+    release.set()
+    thread.join(timeout=10)
+    assert len(errors) == 1 and not registry._loading
+
+
+def test_idle_service_exits(tmp_path):
+    server = inference_service.InferenceServer(str(tmp_path / 'idle.sock'), str(tmp_path), device='cpu',
+                                               idle_timeout=0.5)
+    thread = server.start()
+    with inference_service.InferenceClient(server.address) as client:
+        assert client.ping()['ok']
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert not os.path.exists(server.address)
+
+
+def test_service_that_fails_to_start_is_reported(tmp_path):
+    address = str(tmp_path / 'service.sock')
+    # the preloaded model has no checkpoint, so the service exits at startup
+    with pytest.raises(RuntimeError, match='exited') as e:
+        inference_service.connect(address, start=True, checkpoints_dir=str(tmp_path / 'checkpoints'),
+                                  device='cpu', preload=['no_such_model'])
+    log = str(tmp_path / 'checkpoints' / inference_service.SERVICE_LOG)
+    assert log in str(e.value) and 'no_such_model' in str(e.value)
+    assert 'no_such_model' in open(log).read()
+
+
+def test_parse_address():
+    assert inference_service.parse_address('localhost:9000') == ('localhost', 9000)
+    assert inference_service.parse_address(None) == inference_service.DEFAULT_ADDRESS
+    assert inference_service.parse_address('/tmp/shoreline.sock') == '/tmp/shoreline.sock'
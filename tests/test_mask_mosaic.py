@@ -0,0 +1,132 @@
+import os
+import numpy as np
+import cv2
+import pytest
+
+from utils import mask_mosaic, scene_tiler, tile_triage
+
+
+def _write_tiles(tmp_path, scene, tile_size, overlap, x0=561030.0, y0=9574440.0, res=30.0):
+    """Cut a scene-level mask into *_fake_B.png tiles plus a tile index, like tile_scene + test.py."""
+    mask_dir = tmp_path / 'masks'
+    mask_dir.mkdir()
+    records = []
+    for r, c in scene_tiler.tile_offsets(scene.shape[0], scene.shape[1], tile_size, overlap):
+        name = f'scene_{r:04d}_{c:04d}.jpeg'
+        cv2.imwrite(str(mask_dir / name.replace('.jpeg', mask_mosaic.MASK_SUFFIX)),
+                    scene[r:r + tile_size, c:c + tile_size])
+        records.append({'tile': name, 'scene': 'scene.tif', 'row_off': r, 'col_off': c,
+                        'xmin': x0 + c * res, 'ymin': y0 - (r + tile_size) * res,
+                        'xmax': x0 + (c + tile_size) * res, 'ymax': y0 - r * res,
+                        'xres': res, 'yres': res, 'epsg': 32737, 'cols': tile_size, 'rows': tile_size})
+    index_csv = str(tmp_path / 'scene_tiles.csv')
+    scene_tiler.write_tile_index(records, index_csv)
+    return index_csv, str(mask_dir)
+
+
+def test_blend_weights_ramp_only_in_overlap():
+    w = mask_mosaic.blend_weights(64, 64, overlap=16)
+    assert w[32, 32] == 1.0
+    assert 0 < w[0, 0] < w[0, 8] < w[0, 32]
+    assert np.all(mask_mosaic.blend_weights(8, 8, overlap=0) == 1.0)
+
+
+def test_overlapping_tiles_reassemble_scene(tmp_path):
+    scene = np.zeros((224, 288), dtype=np.uint8)
+    scene[:, :150] = 255
+    index_csv, mask_dir = _write_tiles(tmp_path, scene, tile_size=64, overlap=16)
+
+    records = scene_tiler.read_tile_index(index_csv)
+    assert mask_mosaic.infer_overlap(records) == 16
+
+    mosaic = mask_mosaic.mosaic_from_index(index_csv, mask_dir)
+    height, width = mosaic.height, mosaic.width
+    np.testing.assert_array_equal(mosaic.mask(), scene[:height, :width])
+    assert mosaic.geotransform == (561030.0, 30.0, 0.0, 9574440.0, 0.0, -30.0)
+    assert mosaic.epsg == 32737
+
+
+def test_overlap_is_weighted_average():
+    mosaic = mask_mosaic.MaskMosaic(4, 6)
+    mosaic.add(np.ones((4, 4)), 0, 0, np.full((4, 4), 3.0, dtype=np.float32))
+    mosaic.add(np.zeros((4, 4)), 0, 2)
+    prob = mosaic.probability()
+    assert prob[0, 0] == 1.0
+    assert prob[0, 2] == pytest.approx(0.75)
+    assert prob[0, 5] == 0.0
+
+    empty = mask_mosaic.MaskMosaic(2, 2)
+    assert np.isnan(empty.probability()).all()
+    assert not empty.mask().any()
+
+
+def test_write_mosaic_world_file(tmp_path):
+    gt = (100.0, 10.0, 0.0, 500.0, 0.0, -10.0)
+    path = mask_mosaic.write_mosaic(str(tmp_path / 'scene_mask.png'),
+                                    np.full((5, 5), 255, dtype=np.uint8), gt)
+    assert cv2.imread(path, cv2.IMREAD_GRAYSCALE).shape == (5, 5)
+    assert os.path.exists(str(tmp_path / 'scene_mask.pgw'))
+    np.testing.assert_allclose(mask_mosaic.pixel_to_map([[1, 2]], gt), [[110.0, 480.0]])
+
+
+def _skip_middle_tile(tmp_path, index_csv, reason):
+    rows = [{'tile': rec['tile'], 'nodata_frac': 0.0, 'intensity_std': 0.0, 'edge_density': 0.0,
+             'water_frac': 0.0, 'infer': int(rec['row_off'] != 64 or rec['col_off'] != 64),
+             'reason': 'infer' if rec['row_off'] != 64 or rec['col_off'] != 64 else reason}
+            for rec in scene_tiler.read_tile_index(index_csv)]
+    return tile_triage.write_manifest(rows, str(tmp_path / 'tile_manifest.csv'))
+
+
+def test_skipped_tiles_filled_by_reason(tmp_path):
+    scene = np.zeros((192, 192), dtype=np.uint8)
+    scene[:150] = 255
+    index_csv, mask_dir = _write_tiles(tmp_path, scene, tile_size=64, overlap=0)
+    os.remove(os.path.join(mask_dir, 'scene_0064_0064' + mask_mosaic.MASK_SUFFIX))
+    manifest = _skip_middle_tile(tmp_path, index_csv, 'water')
+
+    mosaic = mask_mosaic.mosaic_from_index(index_csv, mask_dir, manifest=manifest)
+    assert mosaic.covered().all()
+    np.testing.assert_array_equal(mosaic.mask(), scene)
+    unfilled = mask_mosaic.mosaic_from_index(index_csv, mask_dir, manifest=manifest, fill_values={})
+    assert not unfilled.covered()[64:128, 64:128].any()
+
+
+def test_uncovered_tiles_do_not_make_shorelines(tmp_path):
+    from scripts.extract_shorelines_simple import extract_shoreline_from_array
+    scene = np.zeros((192, 192), dtype=np.uint8)
+    scene[:96] = 255
+    index_csv, mask_dir = _write_tiles(tmp_path, scene, tile_size=64, overlap=0)
+    os.remove(os.path.join(mask_dir, 'scene_0064_0064' + mask_mosaic.MASK_SUFFIX))
+    # a tile triage skips for a reason with no fill value stays uncovered
+    manifest = _skip_middle_tile(tmp_path, index_csv, 'uniform')
+    mosaic = mask_mosaic.mosaic_from_index(index_csv, mask_dir, manifest=manifest)
+
+    mask = mosaic.mask()
+    # traced as 0, the hole bends the waterline around the middle tile
+    traced = np.concatenate(extract_shoreline_from_array(mask))
+    assert (traced[:, 1] < 90).any()
+    shorelines = extract_shoreline_from_array(mask, valid=mosaic.covered())
+    points = np.concatenate(shorelines)
+    # what is left is the waterline, on both sides of the hole
+    inner = (points[:, 1] > 0) & (points[:, 1] < 191) & (points[:, 0] > 0) & (points[:, 0] < 191)
+    assert np.all(np.abs(points[inner, 1] - 95.5) <= 1)
+    assert (points[inner, 0] < 64).any() and (points[inner, 0] > 128).any()
+    assert not ((points[:, 0] >= 63) & (points[:, 0] <= 128) & (points[:, 1] > 60)).any()
+
+
+def test_scene_shorelines_saved_in_map_coordinates(tmp_path):
+    import pandas as pd
+    from scripts import extract_shorelines_simple
+    scene = np.zeros((128, 128), dtype=np.uint8)
+    scene[:64] = 255
+    index_csv, mask_dir = _write_tiles(tmp_path, scene, tile_size=64, overlap=0)
+    output_subdir = extract_shorelines_simple.process_scene_mosaics(mask_dir, [index_csv], 'site',
+                                                                    str(tmp_path / 'out'))
+    summary = pd.read_csv(os.path.join(output_subdir, 'shorelines_summary.csv'))
+    assert list(summary.columns) == ['file', 'shoreline_id', 'num_points', 'epsg', 'path']
+    assert (summary['file'] == 'scene').all() and (summary['epsg'] == 32737).all()
+    assert os.path.exists(os.path.join(output_subdir, 'shoreline_images', 'scene_shoreline.png'))
+    xy = np.loadtxt(summary['path'][0], delimiter=',', skiprows=1)
+    assert len(xy) == summary['num_points'][0]
+    assert np.all((xy[:, 0] >= 561030.0) & (xy[:, 0] <= 561030.0 + 128 * 30.0))
+    assert np.all((xy[:, 1] <= 9574440.0) & (xy[:, 1] >= 9574440.0 - 128 * 30.0))
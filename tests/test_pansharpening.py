@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+import sklearn.decomposition as decomposition
+
+from utils import pansharpening
+from tests.helpers import unique_hist_match
+
+
+def _full_pansharpen(im_ms, im_pan, cloud_mask):
+    # SDS_preprocess.pansharpen, kept here as the reference behaviour
+    vec = im_ms.reshape(im_ms.shape[0] * im_ms.shape[1], im_ms.shape[2])
+    vec_mask = cloud_mask.reshape(im_ms.shape[0] * im_ms.shape[1])
+    vec = vec[~vec_mask, :]
+    pca = decomposition.PCA()
+    vec_pcs = pca.fit_transform(vec)
+    vec_pan = im_pan.reshape(-1)[~vec_mask]
+    vec_pcs[:, 0] = unique_hist_match(vec_pan, vec_pcs[:, 0])
+    vec_ms_ps = pca.inverse_transform(vec_pcs)
+    full = np.ones((len(vec_mask), im_ms.shape[2])) * np.nan
+    full[~vec_mask, :] = vec_ms_ps
+    return full.reshape(im_ms.shape)
+
+
+def _scene(rows=300, cols=260, seed=0):
+    rng = np.random.default_rng(seed)
+    base = rng.random((rows, cols))
+    im_ms = np.stack([base * 0.3 + rng.random((rows, cols)) * 0.05 + k * 0.1 for k in range(3)], 2)
+    im_pan = (base * 1000 + rng.random((rows, cols)) * 40).astype(np.uint16)
+    cloud_mask = np.zeros((rows, cols), dtype=bool)
+    cloud_mask[:40, :90] = True
+    return im_ms, im_pan, cloud_mask
+
+
+@pytest.mark.parametrize('method', pansharpening.METHODS)
+def test_blockwise_close_to_full_pca(method):
+    im_ms, im_pan, cloud_mask = _scene()
+    expected = _full_pansharpen(im_ms, im_pan, cloud_mask)
+    result = pansharpening.pansharpen_blockwise(im_ms, im_pan, cloud_mask, method=method,
+                                                n_samples=20000, block_rows=64)
+    assert result.dtype == np.float32
+    assert np.array_equal(np.isnan(result), np.isnan(expected))
+    err = np.nanmax(np.abs(result - expected)) / (np.nanmax(expected) - np.nanmin(expected))
+    assert err < 1e-2
+
+
+def test_cloudy_scene_returned_unchanged():
+    im_ms, im_pan, cloud_mask = _scene(60, 50)
+    cloud_mask[:] = True
+    assert pansharpening.pansharpen_blockwise(im_ms, im_pan, cloud_mask) is im_ms
+
+
+@pytest.mark.parametrize('method', pansharpening.METHODS)
+def test_fewer_valid_pixels_than_bands_returned_unchanged(method):
+    im_ms, im_pan, cloud_mask = _scene(2, 2)
+    cloud_mask[0] = True
+    assert pansharpening.pansharpen_blockwise(im_ms, im_pan, cloud_mask, method=method) is im_ms
+    with pytest.raises(ValueError):
+        pansharpening.fit_pca(im_ms, ~cloud_mask, 'incremental')
@@ -0,0 +1,14 @@
+import math
+from utils import parallel_utils
+
+
+def test_run_tasks_keeps_order_and_reports_errors():
+    tasks = [(f'pow {i}', math.pow, (i, 2)) for i in range(6)]
+    tasks.append(('bad', math.sqrt, (-1,)))
+    for jobs in [1, 3]:
+        timings = parallel_utils.run_tasks(tasks, jobs=jobs)
+        assert [t['name'] for t in timings] == [t[0] for t in tasks]
+        assert [t['result'] for t in timings[:6]] == [float(i * i) for i in range(6)]
+        assert timings[-1]['result'] is None
+        assert timings[-1]['error'].startswith('ValueError')
+        assert all(t['seconds'] >= 0 for t in timings)
@@ -0,0 +1,71 @@
+import os
+import numpy as np
+
+from utils import preprocess_cache
+
+
+def _settings(tmp_path):
+    return {'inputs': {'filepath': str(tmp_path), 'sitename': 'MOMBASA'}}
+
+
+def _scene(tmp_path):
+    files = []
+    for name in ['ms', 'mask']:
+        path = str(tmp_path / f'2014-01-02-07-23-45_L5_MOMBASA_{name}.tif')
+        with open(path, 'wb') as f:
+            f.write(name.encode())
+        files.append(path)
+    return files
+
+
+def test_round_trip(tmp_path):
+    settings = _settings(tmp_path)
+    fn = _scene(tmp_path)
+    params = {'cloud_mask_issue': False, 'pan_off': False, 's2cloudless_prob': 40,
+              'pansharpen_mode': 'full', 'bbox': None}
+    key = preprocess_cache.cache_key(fn, 'L5', params)
+    path = preprocess_cache.entry_path(settings, key)
+    assert path.startswith(os.path.join(str(tmp_path), 'MOMBASA', preprocess_cache.CACHE_DIR))
+    assert preprocess_cache.load(path) is None
+
+    rng = np.random.default_rng(0)
+    products = (rng.random((20, 30, 5)).astype(np.float32), np.array([561030.0, 15, 0, 9574440.0, 0, -15]),
+                rng.random((20, 30)) > 0.8, [], rng.integers(0, 2**16, (20, 30), dtype=np.uint16),
+                np.zeros((20, 30), dtype=bool))
+    preprocess_cache.save(path, products)
+    loaded = preprocess_cache.load(path)
+    assert loaded[3] == []
+    for a, b in zip(products, loaded):
+        if isinstance(a, np.ndarray):
+            assert a.dtype == b.dtype
+            np.testing.assert_array_equal(a, b)
+
+
+def test_key_changes(tmp_path):
+    fn = _scene(tmp_path)
+    params = {'cloud_mask_issue': False, 'pan_off': False, 's2cloudless_prob': 40,
+              'pansharpen_mode': 'full', 'bbox': None}
+    key = preprocess_cache.cache_key(fn, 'L5', params)
+    assert preprocess_cache.cache_key(list(fn), 'L5', dict(params)) == key
+    assert preprocess_cache.cache_key(fn, 'L5', dict(params, pan_off=True)) != key
+    assert preprocess_cache.cache_key(fn, 'L5', dict(params, bbox=[0.0, 0.0, 1.0, 1.0])) != key
+    assert preprocess_cache.cache_key(fn, 'L7', params) != key
+    with open(fn[1], 'wb') as f:
+        f.write(b'new mask')
+    assert preprocess_cache.cache_key(fn, 'L5', params) != key
+
+
+def test_prune_removes_least_recently_used(tmp_path):
+    directory = tmp_path / preprocess_cache.CACHE_DIR
+    directory.mkdir()
+    paths = []
+    for i in range(4):
+        path = directory / f'{i}.npz'
+        path.write_bytes(b'x' * 100)
+        os.utime(path, ns=(i * 10**9, i * 10**9))
+        paths.append(str(path))
+    # reading an entry makes it the most recently used
+    os.utime(paths[0])
+    assert preprocess_cache.prune(str(directory), max_bytes=250) == paths[1:3]
+    assert sorted(os.listdir(directory)) == ['0.npz', '3.npz']
+    assert preprocess_cache.prune(str(directory), max_bytes=250) == []
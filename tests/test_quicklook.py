@@ -0,0 +1,42 @@
+import numpy as np
+import cv2
+
+from utils import quicklook
+
+
+def test_seismic_lut():
+    lut = quicklook.seismic_lut()
+    assert lut.shape == (256, 3) and lut.dtype == np.uint8
+    np.testing.assert_array_equal(lut[0], [0, 0, 76])
+    np.testing.assert_array_equal(lut[-1], [128, 0, 0])
+    assert (lut[127:129] > 250).all()
+
+
+def test_scene_quicklook(tmp_path):
+    rng = np.random.default_rng(0)
+    im_RGB = rng.random((300, 400, 3))
+    im_RGB[:10, :10] = np.nan
+    canvas = quicklook.scene_quicklook(im_RGB, '2014-01-02-07-23-45', 'L8')
+    assert canvas.shape == (1350, 2700, 3) and canvas.dtype == np.uint8
+    # white background around the panel, the panel centred horizontally
+    assert (canvas[:, :50] == 255).all() and (canvas[:, -50:] == 255).all()
+    cols = np.where((canvas != 255).any(axis=(0, 2)))[0]
+    assert abs((cols[0] + cols[-1]) / 2 - 1350) < 5
+
+    three = quicklook.scene_quicklook(im_RGB, 'date', 'L8', im_RGB[:, :, 0], im_RGB[:, :, 1])
+    assert three.shape == canvas.shape
+
+    path = quicklook.save(str(tmp_path / 'quicklook.jpg'), canvas)
+    back = cv2.imread(path)[:, :, ::-1]
+    assert back.shape == canvas.shape
+    assert np.abs(back.astype(int) - canvas).mean() < 8
+
+
+def test_compose_vertical_for_wide_scenes():
+    wide = np.zeros((100, 400, 3), dtype=np.uint8)
+    canvas = quicklook.compose([wide, wide], ['a', 'b'], size=(800, 600))
+    rows = np.where((canvas == 0).all(axis=2).any(axis=1))[0]
+    cols = np.where((canvas == 0).all(axis=2).any(axis=0))[0]
+    # stacked panels span the canvas width rather than half of it
+    assert cols[-1] - cols[0] > 600
+    assert rows[-1] - rows[0] > 300
@@ -0,0 +1,66 @@
+import numpy as np
+from utils import radiometric_stretch
+
+
+def test_streaming_percentiles_exact_for_integer_data():
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 30000, (400, 300)).astype(np.uint16)
+    hist = radiometric_stretch.array_histograms(data, block_rows=37)[0]
+    for q in [2, 50, 98, 99.9]:
+        assert hist.percentile(q) == np.percentile(data, q)
+
+
+def test_histogram_grows_across_blocks():
+    hist = radiometric_stretch.StreamingHistogram(max_bins=1000)
+    values = [np.linspace(0.2, 0.3, 5000), np.linspace(-4.0, 9.0, 5000), np.linspace(100, 101, 10)]
+    for v in values:
+        hist.update(v)
+    allv = np.concatenate(values)
+    assert len(hist.counts) <= 1000
+    assert hist.total == allv.size
+    assert abs(hist.percentile(50) - np.percentile(allv, 50)) < 2 * hist.width
+
+
+def test_stretch_to_uint8_matches_full_percentile_stretch():
+    rng = np.random.default_rng(1)
+    im = rng.gamma(2.0, 500.0, (300, 200, 3)).astype(np.float32)
+    im[10, 10, 0] = np.nan
+    out = radiometric_stretch.stretch_to_uint8(im, block_rows=64)
+    assert out.dtype == np.uint8 and out.shape == im.shape
+    for b in range(3):
+        band = np.nan_to_num(im[:, :, b])
+        p2, p98 = np.percentile(band, [2, 98])
+        expected = np.clip(255.0 * (band - p2) / (p98 - p2), 0, 255).astype('uint8')
+        assert np.abs(out[:, :, b].astype(int) - expected.astype(int)).max() <= 1
+
+
+def test_constant_first_block_does_not_fix_coarse_bins():
+    # a NaN (-> 0) nodata border read first, as raster_histograms does window by window
+    rng = np.random.default_rng(2)
+    im = rng.gamma(2.0, 0.05, (2048, 512)).astype(np.float32)
+    im[:600] = np.nan
+    hist = radiometric_stretch.array_histograms(im, block_rows=512)[0]
+    band = np.nan_to_num(im)
+    for q in [2, 50, 98]:
+        assert abs(hist.percentile(q) - np.percentile(band, q)) < 1e-3
+
+    hist = radiometric_stretch.StreamingHistogram()
+    hist.update(np.full(100, 3.0, dtype=np.float32))
+    assert hist.total == 100 and hist.percentile(50) == 3.0
+    hist.update(np.full(10, 3.0, dtype=np.float32))
+    hist.update(np.linspace(0.0, 1.0, 50, dtype=np.float32))
+    assert hist.total == 160
+    assert abs(hist.percentile(98) - 3.0) < 1e-3
+
+
+def test_rescale_image_intensity_matches_percentile_rescale():
+    from tests.helpers import percentile_rescale
+    rng = np.random.default_rng(5)
+    cloud_mask = rng.random((300, 200)) < 0.2
+    reflectance = rng.gamma(2, 0.05, (300, 200, 3))
+    for im in [reflectance, reflectance[:, :, 0], rng.integers(0, 4000, (300, 200, 3)).astype(float)]:
+        rescaled = radiometric_stretch.rescale_image_intensity(im, cloud_mask, 99.9, block_rows=64)
+        expected = percentile_rescale(im, cloud_mask, 99.9)
+        assert rescaled.shape == im.shape
+        np.testing.assert_array_equal(np.isnan(rescaled), np.isnan(expected))
+        np.testing.assert_allclose(rescaled, expected, atol=1e-4)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+rasterio = pytest.importorskip('rasterio')
+
+from utils import scene_catalog
+from tests.helpers import write_tif
+
+
+def _write_tif(path, x0, y0):
+    write_tif(path, np.zeros((1, 50, 80), dtype='uint8'), x0, y0)
+
+
+def test_names_give_date_and_sensor():
+    assert scene_catalog.scene_date('mombasa_1994_RGB.tif') == (None, 1994)
+    assert scene_catalog.scene_date('2014-01-02-07-23-45_L8_mombasa_ms.tif') == ('2014-01-02', 2014)
+    assert scene_catalog.scene_sensor('2014-01-02-07-23-45_L8_mombasa_ms.tif') == 'L8'
+    assert scene_catalog.scene_sensor('data/sat/L5/ms/scene.tif') == 'L5'
+    assert scene_catalog.scene_sensor('mombasa_1994_RGB.tif') is None
+
+
+def test_register_and_query(tmp_path):
+    near = str(tmp_path / '2014-01-02-07-23-45_L8_mombasa_ms.tif')
+    far = str(tmp_path / '2014-06-10-07-23-45_L8_mombasa_ms.tif')
+    old = str(tmp_path / 'mombasa_1994_RGB.tif')
+    _write_tif(near, 561030.0, 9574440.0)
+    _write_tif(far, 761030.0, 9574440.0)
+    _write_tif(old, 561030.0, 9574440.0)
+
+    with scene_catalog.SceneCatalog(str(tmp_path / 'catalog.sqlite')) as cat:
+        row = cat.register(near, site='Mombasa_2014', cloud_fraction=0.1)
+        assert row['epsg'] == 32737 and row['sensor'] == 'L8' and len(row['checksum']) == 64
+        assert row['xmax'] == 561030.0 + 80 * 30.0
+        assert 39.0 < row['lon_min'] < 40.0
+        cat.register(far, site='Mombasa_2014', cloud_fraction=0.6)
+        cat.register(old, site='Mombasa_1994')
+
+        box = (561000.0, 9573000.0, 562000.0, 9574000.0)
+        paths = [r['path'] for r in cat.query(bbox=box, epsg=32737)]
+        assert paths == [old, near]
+        lonlat = (row['lon_min'], row['lat_min'], row['lon_min'] + 0.001, row['lat_min'] + 0.001)
+        assert [r['path'] for r in cat.query(bbox=lonlat)] == [old, near]
+
+        assert [r['path'] for r in cat.query(start='2014-01-01', end='2014-12-31')] == [near, far]
+        assert [r['path'] for r in cat.query(start='2014-01-01', max_cloud=0.5)] == [near]
+        assert [r['path'] for r in cat.query(end='2000-01-01')] == [old]
+        assert [r['path'] for r in cat.query(years=[1994])] == [old]
+
+        cat.set_status(near, 'tiled')
+        assert [r['path'] for r in cat.query(status='tiled')] == [near]
+        cat.register(near, site='Mombasa_2014', checksum=False)
+        assert len(cat.query()) == 3
@@ -0,0 +1,74 @@
+import json
+import os
+
+from utils import scene_ingest
+
+
+def _sources(folder, n=4):
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(n):
+        path = os.path.join(folder, f'mombasa_{1990 + i}_RGB.tif')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(1000 + i))
+        paths.append(path)
+    return paths
+
+
+def _pairs(paths, dest):
+    return [(p, os.path.join(dest, os.path.basename(p))) for p in paths]
+
+
+def test_copy_then_unchanged(tmp_path):
+    pairs = _pairs(_sources(str(tmp_path / 'src')), str(tmp_path / 'dest'))
+    manifest = str(tmp_path / 'ingest_manifest.jsonl')
+
+    first = scene_ingest.ingest_files(pairs, manifest=manifest, jobs=3)
+    assert [r['status'] for r in first] == ['copied'] * 4
+    for src, dest in pairs:
+        assert open(src, 'rb').read() == open(dest, 'rb').read()
+        assert not os.path.exists(dest + scene_ingest.PART_SUFFIX)
+
+    second = scene_ingest.ingest_files(pairs, manifest=manifest, jobs=3)
+    assert [r['status'] for r in second] == ['unchanged'] * 4
+    assert [r['sha256'] for r in second] == [r['sha256'] for r in first]
+    # unchanged files are not appended again
+    assert len(open(manifest).readlines()) == 4
+
+
+def test_resume_and_skip_existing(tmp_path):
+    pairs = _pairs(_sources(str(tmp_path / 'src')), str(tmp_path / 'dest'))
+    manifest = str(tmp_path / 'ingest_manifest.jsonl')
+    scene_ingest.ingest_files(pairs[:2], manifest=manifest)
+    # an interrupted run: a half-written record and a leftover .part file
+    with open(manifest, 'a') as f:
+        f.write('{"src": "trunc')
+    with open(pairs[2][1] + scene_ingest.PART_SUFFIX, 'wb') as f:
+        f.write(b'partial')
+
+    # a destination copied outside the ingest is verified by checksum instead of copied again
+    os.remove(manifest)
+    records = scene_ingest.ingest_files(pairs, manifest=manifest)
+    assert [r['status'] for r in records] == ['skipped', 'skipped', 'copied', 'copied']
+    assert open(pairs[2][0], 'rb').read() == open(pairs[2][1], 'rb').read()
+    assert not os.path.exists(pairs[2][1] + scene_ingest.PART_SUFFIX)
+
+    # a changed source is copied again
+    with open(pairs[0][0], 'wb') as f:
+        f.write(b'new scene')
+    records = scene_ingest.ingest_files(pairs, manifest=manifest)
+    assert [r['status'] for r in records] == ['copied', 'unchanged', 'unchanged', 'unchanged']
+    assert open(pairs[0][1], 'rb').read() == b'new scene'
+    assert scene_ingest.load_manifest(manifest)[pairs[0][1]]['size'] == 9
+
+
+def test_move_and_failures(tmp_path):
+    pairs = _pairs(_sources(str(tmp_path / 'src'), 2), str(tmp_path / 'dest'))
+    pairs.append((str(tmp_path / 'src' / 'missing.tif'), str(tmp_path / 'dest' / 'missing.tif')))
+    manifest = str(tmp_path / 'ingest_manifest.jsonl')
+    records = scene_ingest.ingest_files(pairs, manifest=manifest, move=True)
+    assert [r['status'] for r in records] == ['copied', 'copied', 'failed']
+    assert 'FileNotFoundError' in records[2]['error']
+    assert not any(os.path.exists(src) for src, _ in pairs)
+    assert all(os.path.exists(dest) for _, dest in pairs[:2])
+    assert [json.loads(l)['status'] for l in open(manifest)].count('failed') == 1
@@ -0,0 +1,53 @@
+import os
+import numpy as np
+import pytest
+
+rasterio = pytest.importorskip('rasterio')
+
+from tests.helpers import write_tif as _write_tif
+from utils import scene_tiler
+
+
+def test_tile_scene_names_georef_and_index(tmp_path):
+    rng = np.random.default_rng(0)
+    arr = rng.integers(0, 4000, (3, 300, 520), dtype=np.uint16)
+    tif = str(tmp_path / 'mombasa_1994_RGB.tif')
+    _write_tif(tif, arr)
+
+    out_dir = str(tmp_path / 'pix2pix_ready')
+    records = scene_tiler.tile_scene(tif, out_dir, tile_size=128, overlap=0)
+
+    # 2 full tile rows x 4 full tile cols, partial edge tiles dropped
+    assert len(records) == 8
+    names = sorted(r['tile'] for r in records)
+    assert names[0] == 'mombasa_1994_RGB_0000_0000.jpeg'
+    assert 'mombasa_1994_RGB_0128_0384.jpeg' in names
+    for name in names:
+        assert os.path.exists(os.path.join(out_dir, name))
+
+    rec = [r for r in records if r['tile'] == 'mombasa_1994_RGB_0128_0384.jpeg'][0]
+    assert rec['xmin'] == 561030.0 + 384 * 30.0
+    assert rec['ymax'] == 9574440.0 - 128 * 30.0
+    assert rec['epsg'] == 32737
+
+    with open(os.path.join(out_dir, 'mombasa_1994_RGB_0128_0384.jgw')) as f:
+        world = [float(v) for v in f.read().split()]
+    assert world[0] == 30.0 and world[3] == -30.0
+    assert world[4] == rec['xmin'] + 15.0
+
+    index = scene_tiler.read_tile_index(os.path.join(out_dir, 'mombasa_1994_RGB_tiles.csv'))
+    assert [r['tile'] for r in index] == [r['tile'] for r in records]
+
+
+def test_iter_tiles_matches_full_scene_crop(tmp_path):
+    rng = np.random.default_rng(1)
+    arr = rng.integers(0, 255, (3, 256, 256), dtype=np.uint8)
+    tif = str(tmp_path / 'scene.tif')
+    _write_tif(tif, arr)
+
+    with scene_tiler.WindowedRaster(tif) as raster:
+        limits = [(0.0, 255.0)] * 3
+        tiles = {(r, c): t.copy() for r, c, t in scene_tiler.iter_tiles(raster, 64, 32, limits=limits)}
+
+    assert len(tiles) == 7 * 7
+    np.testing.assert_array_equal(tiles[(32, 96)], np.transpose(arr[:, 32:96, 96:160], (1, 2, 0)))
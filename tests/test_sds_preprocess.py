@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+gdal = pytest.importorskip('osgeo.gdal')
+pytest.importorskip('rasterio')
+SDS_preprocess = pytest.importorskip('utils.coastsat.SDS_preprocess')
+
+from tests.helpers import write_tif as _write_tif
+
+GEOREF = (561030.0, 30.0, 0.0, 9574440.0, 0.0, -30.0)
+
+
+def test_read_bands_window(tmp_path):
+    rng = np.random.default_rng(0)
+    arr = rng.random((5, 120, 90))
+    tif = str(tmp_path / 'scene.tif')
+    _write_tif(tif, arr)
+
+    im, georef = SDS_preprocess.read_bands(tif)
+    assert im.dtype == np.float32 and im.shape == (120, 90, 5)
+    np.testing.assert_allclose(im, np.moveaxis(arr, 0, -1), rtol=1e-6)
+    np.testing.assert_array_equal(georef, GEOREF)
+
+    window = (10, 20, 30, 40)
+    crop, georef = SDS_preprocess.read_bands(tif, bands=[1, 3], window=window)
+    np.testing.assert_array_equal(crop, im[20:60, 10:40, [1, 3]])
+    assert georef[0] == GEOREF[0] + 10 * 30.0 and georef[3] == GEOREF[3] - 20 * 30.0
+
+    # the bbox of a window gives the same window back, windows are clipped to the raster
+    bbox = SDS_preprocess.window_bbox(tif, window)
+    assert SDS_preprocess.raster_window(np.array(GEOREF), (120, 90), bbox=bbox) == window
+    assert SDS_preprocess.raster_window(np.array(GEOREF), (120, 90), window=(80, -5, 50, 10)) == (80, 0, 10, 5)
+    with pytest.raises(ValueError):
+        SDS_preprocess.raster_window(np.array(GEOREF), (120, 90), window=(200, 0, 10, 10))
+
+
+def test_preprocess_single_window(tmp_path):
+    rng = np.random.default_rng(1)
+    ms = str(tmp_path / '1994-01-02-07-23-45_L5_site_ms.tif')
+    mask = str(tmp_path / '1994-01-02-07-23-45_L5_site_mask.tif')
+    _write_tif(ms, rng.random((5, 64, 64)) + 0.1)
+    _write_tif(mask, np.zeros((1, 64, 64)))
+
+    full = SDS_preprocess.preprocess_single([ms, mask], 'L5', False, False)
+    roi = SDS_preprocess.preprocess_single([ms, mask], 'L5', False, False, window=(8, 16, 32, 24))
+    np.testing.assert_array_equal(roi[0], full[0][16:40, 8:40])
+    np.testing.assert_array_equal(roi[2], full[2][16:40, 8:40])
+    assert roi[1][0] == full[1][0] + 8 * 30.0
+
+
+def test_rescale_image_intensity_uses_streaming_histograms():
+    from utils import radiometric_stretch
+    rng = np.random.default_rng(6)
+    im = rng.gamma(2, 0.05, (120, 90, 3))
+    cloud_mask = rng.random((120, 90)) < 0.1
+    np.testing.assert_array_equal(SDS_preprocess.rescale_image_intensity(im, cloud_mask, 99.9),
+                                  radiometric_stretch.rescale_image_intensity(im, cloud_mask, 99.9))
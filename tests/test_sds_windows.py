@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from utils.coastsat import SDS_windows
+
+GEOREF = np.array([561030.0, 30.0, 0.0, 9574440.0, 0.0, -30.0])
+
+
+def test_bbox_window_and_georef():
+    # a bbox on the pixel grid gives back exactly its pixels
+    bbox = (561030.0 + 10 * 30.0, 9574440.0 - 60 * 30.0, 561030.0 + 40 * 30.0, 9574440.0 - 20 * 30.0)
+    window = SDS_windows.raster_window(GEOREF, (120, 90), bbox=bbox)
+    assert window == (10, 20, 30, 40)
+    georef = SDS_windows.window_georef(GEOREF, window)
+    assert georef[0] == bbox[0] and georef[3] == bbox[3]
+    # partly outside: clipped to the image
+    assert SDS_windows.raster_window(GEOREF, (120, 90), bbox=(bbox[0], bbox[1], 1e7, 1e8)) == (10, 0, 80, 60)
+    assert SDS_windows.raster_window(GEOREF, (120, 90)) == (0, 0, 90, 120)
+
+
+def test_reference_buffer_outside_the_image():
+    ref_sl = np.array([[600000.0, 9500000.0, 0.0], [600300.0, 9500600.0, 0.0]])
+    bbox = SDS_windows.buffer_bbox(ref_sl, 250.0)
+    assert bbox == (599750.0, 9499750.0, 600550.0, 9500850.0)
+    # a WindowError is a ValueError, SDS_shoreline.extract_shorelines skips the image on it
+    with pytest.raises(SDS_windows.WindowError):
+        SDS_windows.raster_window(GEOREF, (120, 90), bbox=bbox)
+    with pytest.raises(ValueError):
+        SDS_windows.raster_window(GEOREF, (120, 90), window=(200, 0, 10, 10))
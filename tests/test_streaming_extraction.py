@@ -0,0 +1,100 @@
+import os
+import numpy as np
+import cv2
+import pytest
+
+from utils import mask_mosaic, scene_tiler, streaming_extraction
+
+
+def _scene_tiles(tmp_path, scene, tile_size=64, overlap=16, x0=561030.0, y0=9574440.0, res=30.0):
+    """Tile index of a scene-level mask, its tile masks as generator batches and as *_fake_B.png files."""
+    mask_dir = tmp_path / 'masks'
+    mask_dir.mkdir()
+    records, paths, masks = [], [], []
+    for r, c in scene_tiler.tile_offsets(scene.shape[0], scene.shape[1], tile_size, overlap):
+        name = f'scene_{r:04d}_{c:04d}.jpeg'
+        tile = scene[r:r + tile_size, c:c + tile_size]
+        cv2.imwrite(str(mask_dir / name.replace('.jpeg', mask_mosaic.MASK_SUFFIX)), tile)
+        paths.append(str(tmp_path / 'tiles' / name))
+        masks.append(tile)
+        records.append({'tile': name, 'scene': 'scene.tif', 'row_off': r, 'col_off': c,
+                        'xmin': x0 + c * res, 'ymin': y0 - (r + tile_size) * res,
+                        'xmax': x0 + (c + tile_size) * res, 'ymax': y0 - r * res,
+                        'xres': res, 'yres': res, 'epsg': 32737, 'cols': tile_size, 'rows': tile_size})
+    index_csv = str(tmp_path / 'scene_tiles.csv')
+    scene_tiler.write_tile_index(records, index_csv)
+    batches = [(paths[i:i + 3], np.stack(masks[i:i + 3])) for i in range(0, len(paths), 3)]
+    return index_csv, str(mask_dir), batches
+
+
+def test_streamed_scene_matches_mosaic_from_files(tmp_path):
+    scene = np.zeros((224, 288), dtype=np.uint8)
+    scene[:, :150] = 255
+    index_csv, mask_dir, batches = _scene_tiles(tmp_path, scene)
+
+    mosaics = {}
+    scenes = streaming_extraction.stream_scenes(iter(batches), [index_csv],
+                                                lambda name, mosaic: mosaics.update({name: mosaic}), threads=2)
+    assert scenes == ['scene']
+    expected = mask_mosaic.mosaic_from_index(index_csv, mask_dir)
+    np.testing.assert_allclose(mosaics['scene'].probability(), expected.probability(), atol=1e-6)
+    assert mosaics['scene'].geotransform == expected.geotransform
+
+
+def test_stream_tiles_passes_masks_as_generated():
+    mask = np.full((8, 8), 200, dtype=np.uint8)
+    mask[:, 4:] = 255
+    seen = {}
+    n = streaming_extraction.stream_tiles(iter([(['a/t0.jpeg', 'a/t1.jpeg'], np.stack([mask, mask]))]),
+                                          lambda name, m: seen.update({name: m}))
+    assert n == 2 and sorted(seen) == ['t0', 't1']
+    np.testing.assert_array_equal(seen['t0'], mask)
+    # thresholding is opt-in
+    streaming_extraction.stream_tiles(iter([(['a/t0.jpeg'], mask[np.newaxis])]),
+                                      lambda name, m: seen.update({name: m}), threshold=250)
+    assert not seen['t0'][:, :4].any() and seen['t0'][:, 4:].all()
+
+
+def test_streamed_tiles_give_the_file_based_shorelines(tmp_path):
+    from scripts import extract_shorelines_simple
+    rng = np.random.default_rng(0)
+    masks = np.zeros((3, 128, 128), dtype=np.uint8)
+    for i, mask in enumerate(masks):
+        # water with soft edges: values between 1 and 250 are water to findContours
+        mask[:, :40 + 20 * i] = 255
+        mask[:, 40 + 20 * i:60 + 20 * i] = rng.integers(1, 250, (128, 20))
+    gan_dir = tmp_path / 'gan'
+    gan_dir.mkdir()
+    paths = []
+    for i, mask in enumerate(masks):
+        cv2.imwrite(str(gan_dir / f't{i}_fake_B.png'), mask)
+        paths.append(str(tmp_path / 'tiles' / f't{i}.jpeg'))
+
+    class Generator:
+        def run(self, *args):
+            return iter([(paths[:2], masks[:2]), (paths[2:], masks[2:])])
+
+    files = extract_shorelines_simple.process_gan_outputs(str(gan_dir), 'missing.csv', 'site', str(tmp_path / 'files'))
+    streamed = extract_shorelines_simple.process_gan_stream(Generator(), 'tiles', 'site', str(tmp_path / 'stream'))
+    names = sorted(os.listdir(os.path.join(files, 'shorelines')))
+    assert names and names == sorted(os.listdir(os.path.join(streamed, 'shorelines')))
+    for name in names:
+        np.testing.assert_array_equal(np.loadtxt(os.path.join(files, 'shorelines', name), delimiter=',', skiprows=1),
+                                      np.loadtxt(os.path.join(streamed, 'shorelines', name), delimiter=',',
+                                                 skiprows=1))
+
+
+def test_extraction_errors_stop_the_generator():
+    produced = []
+
+    def batches():
+        for i in range(100):
+            produced.append(i)
+            yield ['t%d.jpeg' % i], np.zeros((1, 4, 4), np.uint8)
+
+    def on_tile(name, mask):
+        raise RuntimeError('extraction failed')
+
+    with pytest.raises(RuntimeError):
+        streaming_extraction.stream_tiles(batches(), on_tile, queue_size=2)
+    assert len(produced) < 100
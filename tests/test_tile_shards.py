@@ -0,0 +1,155 @@
+import os
+import numpy as np
+import pytest
+
+rasterio = pytest.importorskip('rasterio')
+
+from utils import scene_tiler, tile_shards, tile_triage
+from tests.helpers import write_tif as _write_tif
+
+
+def test_shard_matches_tiles_and_index(tmp_path):
+    rng = np.random.default_rng(0)
+    arr = rng.integers(0, 4000, (3, 300, 520), dtype=np.uint16)
+    tif = str(tmp_path / 'mombasa_1994_RGB.tif')
+    _write_tif(tif, arr)
+
+    out_dir = str(tmp_path / 'pix2pix_ready')
+    path = tile_shards.tile_scene_shard(tif, out_dir, tile_size=128)
+    assert path == os.path.join(out_dir, 'mombasa_1994_RGB_tiles.npy')
+    assert tile_shards.find_shards(out_dir) == [path]
+
+    shard = tile_shards.TileShard(path)
+    assert len(shard) == 8
+    assert shard.names[0] == 'mombasa_1994_RGB_0000_0000.jpeg'
+    assert shard.record('mombasa_1994_RGB_0128_0384.jpeg')['xmin'] == 561030.0 + 384 * 30.0
+
+    with scene_tiler.WindowedRaster(tif) as raster:
+        expected = {(r, c): t.copy() for r, c, t in scene_tiler.iter_tiles(raster, tile_size=128)}
+    for rec, tile in zip(shard.records, shard.tiles):
+        np.testing.assert_array_equal(tile, expected[(rec['row_off'], rec['col_off'])])
+    assert isinstance(shard[2:4], np.memmap)
+
+
+def test_fill_row_ranges_separately(tmp_path):
+    rng = np.random.default_rng(1)
+    arr = rng.integers(0, 4000, (3, 256, 256), dtype=np.uint16)
+    tif = str(tmp_path / 'scene.tif')
+    _write_tif(tif, arr)
+
+    out_dir = str(tmp_path / 'out')
+    whole = tile_shards.tile_scene_shard(tif, out_dir, tile_size=64, basename='whole')
+    with scene_tiler.WindowedRaster(tif) as raster:
+        limits = scene_tiler.stretch_limits(raster, (1, 2, 3))
+    split = tile_shards.create_scene_shard(tif, out_dir, tile_size=64, basename='split')
+    assert tile_shards.fill_scene_shard(tif, split, 64, limits=limits, row_range=(128, 256)) == 8
+    assert tile_shards.fill_scene_shard(tif, split, 64, limits=limits, row_range=(0, 128)) == 8
+    np.testing.assert_array_equal(np.load(whole), np.load(split))
+
+
+def test_triage_reads_shard(tmp_path):
+    arr = np.zeros((3, 128, 256), dtype=np.uint16)
+    arr[:, :, 128:160] = 3000
+    arr[:, :, 160:] = 500
+    tif = str(tmp_path / 'scene.tif')
+    _write_tif(tif, arr)
+
+    path = tile_shards.tile_scene_shard(tif, str(tmp_path), tile_size=128)
+    rows = tile_triage.triage_folder(str(tmp_path), index_csv=tile_shards.index_for_shard(path))
+    assert [r['reason'] for r in rows] == ['nodata', 'infer']
+
+
+def test_float_multispectral_shard(tmp_path):
+    rng = np.random.default_rng(2)
+    arr = rng.random((5, 128, 256)).astype(np.float32)
+    tif = str(tmp_path / 'scene_harm.tif')
+    _write_tif(tif, arr)
+
+    bands = tile_shards.MULTISPECTRAL_BANDS
+    path = tile_shards.tile_scene_shard(tif, str(tmp_path / 'out'), tile_size=128, bands=bands, dtype='float32')
+    shard = tile_shards.TileShard(path)
+    assert shard.tiles.dtype == np.float32 and shard.tiles.shape == (2, 128, 128, 5)
+    assert shard.tiles.min() >= 0 and shard.tiles.max() <= 1
+
+    # same stretch as the uint8 tiles, without the quantization
+    rgb = tile_shards.tile_scene_shard(tif, str(tmp_path / 'rgb'), tile_size=128, bands=bands)
+    assert np.abs(np.load(rgb) - shard.tiles * 255).max() <= 1.0
+    with pytest.raises(ValueError):
+        tile_shards.create_scene_shard(tif, str(tmp_path), 128, dtype='float64')
+
+
+def test_float16_shard_halves_the_disk(tmp_path):
+    rng = np.random.default_rng(3)
+    arr = rng.random((5, 128, 256)).astype(np.float32)
+    tif = str(tmp_path / 'scene_harm.tif')
+    _write_tif(tif, arr)
+
+    bands = tile_shards.MULTISPECTRAL_BANDS
+    full = tile_shards.tile_scene_shard(tif, str(tmp_path / 'f32'), tile_size=128, bands=bands, dtype='float32')
+    half = tile_shards.tile_scene_shard(tif, str(tmp_path / 'f16'), tile_size=128, bands=bands, dtype='float16')
+    assert np.load(half).dtype == np.float16
+    assert os.path.getsize(half) < 0.51 * os.path.getsize(full)
+    np.testing.assert_allclose(np.load(half), np.load(full), atol=1e-3)
+
+
+def _float_shard(folder, tiles):
+    os.makedirs(folder)
+    path = os.path.join(folder, 'scene' + tile_shards.SHARD_SUFFIX)
+    np.save(path, tiles)
+    scene_tiler.write_tile_index([{'tile': 'scene_%d.jpeg' % i} for i in range(len(tiles))],
+                                 tile_shards.index_for_shard(path))
+    return path
+
+
+def _train_options(dataroot, **overrides):
+    from utils import gan_inference
+    gan_inference._pix2pix_path()
+    import argparse
+    from options.train_options import TrainOptions
+    opt = TrainOptions().initialize(argparse.ArgumentParser()).parse_args(['--dataroot', dataroot])
+    opt.isTrain = True
+    for key, value in overrides.items():
+        setattr(opt, key, value)
+    return opt
+
+
+def test_float_shard_dataset(tmp_path):
+    pytest.importorskip('torch')
+    from utils import gan_inference
+    gan_inference._pix2pix_path()
+    from data.tile_shard_dataset import TileShardDataset
+    rng = np.random.default_rng(4)
+
+    # inference: (5, H, W) tensors scaled from [0, 1] to [-1, 1]
+    tiles = rng.random((3, 64, 64, 5)).astype(np.float16)
+    test_root = str(tmp_path / 'test')
+    _float_shard(test_root, tiles)
+    dataset = TileShardDataset(gan_inference.test_options(test_root, dataset_mode='tile_shard', input_nc=5))
+    assert len(dataset) == 3
+    item = dataset[1]
+    assert item['A'].shape == (5, 64, 64) and item['A'].dtype.is_floating_point
+    assert item['A_paths'] == os.path.join(test_root, 'scene_1.jpeg')
+    np.testing.assert_allclose(item['A'].numpy(), tiles[1].astype(np.float32).transpose(2, 0, 1) * 2 - 1,
+                               atol=1e-6)
+    with pytest.raises(ValueError, match='input_nc'):
+        TileShardDataset(gan_inference.test_options(test_root, dataset_mode='tile_shard', input_nc=3))[0]
+
+    # training: A (5 bands) and B (the mask, 1 band) side by side, cropped and flipped together
+    ab = np.zeros((2, 64, 128, 5), dtype=np.float32)
+    ab[:, :, :64] = rng.random((2, 64, 64, 5))
+    ab[:, :, 64:, 0] = ab[:, :, :64, 0] > 0.5
+    train_root = str(tmp_path / 'train_data')
+    _float_shard(os.path.join(train_root, 'train'), ab)
+    opt = _train_options(train_root, dataset_mode='tile_shard', input_nc=5, output_nc=1, load_size=72,
+                         crop_size=64)
+    item = TileShardDataset(opt)[0]
+    assert item['A'].shape == (5, 64, 64) and item['B'].shape == (1, 64, 64)
+    assert item['A'].min() >= -1 and item['A'].max() <= 1 and item['B'].min() >= -1 and item['B'].max() <= 1
+    # without resizing / cropping / flipping, A and B are the two halves of the tile
+    opt = _train_options(train_root, dataset_mode='tile_shard', input_nc=5, output_nc=1, preprocess='none',
+                         no_flip=True)
+    item = TileShardDataset(opt)[1]
+    np.testing.assert_allclose(item['A'].numpy(), ab[1, :, :64].transpose(2, 0, 1) * 2 - 1, atol=1e-6)
+    np.testing.assert_array_equal(item['B'].numpy()[0], ab[1, :, 64:, 0] * 2 - 1)
+    with pytest.raises(ValueError, match='input_nc'):
+        TileShardDataset(_train_options(train_root, dataset_mode='tile_shard', input_nc=6, output_nc=1))[0]
@@ -0,0 +1,45 @@
+import numpy as np
+import cv2
+
+from utils import tile_triage
+
+
+def _coast_tile(size=64):
+    tile = np.full((size, size, 3), 40, dtype=np.uint8)
+    tile[:, size // 2:] = 180
+    return tile
+
+
+def test_tile_stats_vectorized_over_batch():
+    stack = np.stack([np.zeros((64, 64, 3), dtype=np.uint8),
+                      np.full((64, 64, 3), 120, dtype=np.uint8),
+                      _coast_tile()])
+    stats = tile_triage.tile_stats(stack)
+    np.testing.assert_allclose(stats['nodata_frac'], [1.0, 0.0, 0.0])
+    assert stats['intensity_std'][1] == 0.0
+    assert stats['intensity_std'][2] > tile_triage.MIN_STD
+    assert stats['edge_density'][1] == 0.0
+    assert stats['edge_density'][2] > 0.0
+    assert np.isnan(stats['water_frac']).all()
+
+
+def test_classify_with_water_mask():
+    stack = np.stack([_coast_tile()] * 3)
+    water = np.zeros((3, 64, 64), dtype=bool)
+    water[0] = True
+    water[2, :, :32] = True
+    stats = tile_triage.tile_stats(stack, water=water)
+    assert tile_triage.classify(stats) == ['water', 'land', 'infer']
+
+
+def test_triage_folder_writes_manifest(tmp_path):
+    cv2.imwrite(str(tmp_path / 'a_empty.jpeg'), np.zeros((64, 64, 3), dtype=np.uint8))
+    cv2.imwrite(str(tmp_path / 'b_flat.jpeg'), np.full((64, 64, 3), 120, dtype=np.uint8))
+    cv2.imwrite(str(tmp_path / 'c_coast.png'), _coast_tile())
+
+    rows = tile_triage.triage_folder(str(tmp_path))
+    assert [r['reason'] for r in rows] == ['nodata', 'uniform', 'infer']
+
+    manifest = tile_triage.read_manifest(tile_triage.manifest_path(str(tmp_path)))
+    assert manifest['c_coast.png']['infer'] == 1
+    assert tile_triage.tiles_to_infer(tile_triage.manifest_path(str(tmp_path))) == ['c_coast.png']
@@ -0,0 +1,104 @@
+import os
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from tests.helpers import generator_checkpoint, write_tif
+from utils import window_inference
+
+
+def _first_band(batch):
+    """A 'generator' returning its first input band, so stitched masks can be checked against the input."""
+    return batch[:, :1]
+
+
+@pytest.mark.parametrize('size,window,margin', [(1000, 256, 32), (256, 256, 32), (100, 256, 32), (700, 512, 0)])
+def test_window_valid_ranges_tile_the_axis(size, window, margin):
+    windows = window_inference.window_offsets(size, window, margin)
+    assert windows[0][1] == 0 and windows[-1][2] == size
+    for (_, _, stop), (_, start, _) in zip(windows[:-1], windows[1:]):
+        assert stop == start
+    for offset, start, stop in windows:
+        assert 0 <= offset and offset + min(window, size) <= size
+        assert start == 0 or start >= offset + margin
+        assert stop == size or stop <= offset + window - margin
+
+
+def test_stitched_windows_reproduce_the_scene():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (300, 700, 3), dtype=np.uint8)
+    for window, batch_size in [(256, 1), (256, 3), (1024, 1)]:
+        mask = window_inference.predict_image(_first_band, image, window=window, margin=32,
+                                              batch_size=batch_size)
+        assert mask.shape == (300, 700) and mask.dtype == np.uint8
+        assert np.abs(mask.astype(int) - image[:, :, 0]).max() <= 1
+
+
+def test_generator_windows_and_memory(tmp_path):
+    pytest.importorskip('cv2')
+    from utils import gan_inference
+    gen = gan_inference.ShorelineGenerator('shoreline_test', checkpoints_dir=generator_checkpoint(tmp_path), ngf=8,
+                                           no_dropout=True, eval=True, device='cpu')
+    image = np.random.default_rng(0).random((200, 300, 3)).astype(np.float32)
+    # one window: the scene mirror-padded to 256 x 512, run once, cropped
+    padded = window_inference.pad_window(image, 256, 512)
+    expected = gan_inference.to_uint8(gen.predict(gan_inference.tiles_to_batch(padded[np.newaxis])))[0]
+    np.testing.assert_array_equal(window_inference.predict_image(gen, image, window=1024), expected[:200, :300])
+    assert window_inference.predict_image(gen, image, window=256, margin=32).shape == (200, 300)
+
+    assert window_inference.window_for_memory(100, ngf=64) == 256
+    assert window_inference.window_for_memory(500, ngf=64) == 1024
+    assert window_inference.window_for_memory(500, ngf=8) > window_inference.window_for_memory(500, ngf=64)
+    assert window_inference.window_for_memory(500, ngf=64, batch_size=4) == 512
+
+
+def test_predict_raster_is_georeferenced(tmp_path):
+    pytest.importorskip('rasterio')
+    arr = np.random.default_rng(0).integers(0, 4000, (3, 300, 520), dtype=np.uint16)
+    tif = str(tmp_path / 'mombasa_1994_RGB.tif')
+    write_tif(tif, arr)
+    mosaic = window_inference.predict_raster(_first_band, tif, window=256, margin=32)
+    assert (mosaic.height, mosaic.width) == (300, 520)
+    assert mosaic.geotransform[0] == 561030.0 and mosaic.epsg == 32737
+    prob = mosaic.probability()
+    assert not np.isnan(prob).any()
+    # the first band, stretched like the tiles of scene_tiler
+    from utils import scene_tiler
+    with scene_tiler.WindowedRaster(tif) as raster:
+        limits = scene_tiler.stretch_limits(raster, [1, 2, 3])
+    first = window_inference.radiometric_stretch.apply_stretch(np.moveaxis(arr, 0, -1), limits)[:, :, 0]
+    assert np.abs(prob * 255 - first).max() <= 1.5
+
+
+def test_windows_read_the_bands_the_tiles_were_cut_with(tmp_path):
+    pytest.importorskip('rasterio')
+    cv2 = pytest.importorskip('cv2')
+    from scripts import prepare_pix2pix_from_harmonized
+    from utils import scene_tiler
+    # harmonized B,G,R,NIR,SWIR scene whose bands all differ, tiled as R,G,B
+    bands = prepare_pix2pix_from_harmonized.RGB_BANDS
+    rng = np.random.default_rng(0)
+    arr = (rng.integers(0, 1000, (5, 300, 520)) + 1000 * np.arange(5)[:, None, None]).astype(np.uint16)
+    tif = str(tmp_path / 'mombasa_2014_harm.tif')
+    write_tif(tif, arr)
+    tile_dir = str(tmp_path / 'tiles')
+    records = scene_tiler.tile_scene(tif, tile_dir, bands=bands, ext='.png', world_files=False)
+    # full tiles only: the two 256 px tiles of the top rows
+    assert len(records) == 2
+    tiled = np.hstack([cv2.imread(os.path.join(tile_dir, record['tile']))[:, :, 2]  # R of the R,G,B tile
+                       for record in records])
+
+    mosaic = window_inference.predict_raster(_first_band, tif, window=256, margin=32, bands=bands)
+    assert np.abs(mosaic.probability()[:256, :512] * 255 - tiled).max() <= 1.5
+    # the default band order would feed the generator the blue band
+    mosaic = window_inference.predict_raster(_first_band, tif, window=256, margin=32)
+    assert np.abs(mosaic.probability()[:256, :512] * 255 - tiled).max() > 10
+
+    class Generator5:
+        input_nc = 5
+
+        def predict(self, batch):
+            return batch[:, :1]
+    with pytest.raises(ValueError):
+        window_inference.predict_raster(Generator5(), tif, window=256, bands=bands)
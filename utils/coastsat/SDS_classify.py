@@ -121,7 +121,8 @@ def label_images(metadata,settings):
             im_ms, georef, cloud_mask, im_extra, im_QA, im_nodata = SDS_preprocess.preprocess_single(fn, satname, 
                                                                                                      settings['cloud_mask_issue'],
                                                                                                      settings['pan_off'],
-                                                                                                     settings['s2cloudless_prob'])
+                                                                                                     settings['s2cloudless_prob'],
+                                                                                                     settings.get('pansharpen_mode', 'full'))
 
             # compute cloud_cover percentage (with no data pixels)
             cloud_cover_combined = np.divide(sum(sum(cloud_mask.astype(int))),
@@ -571,7 +572,8 @@ def evaluate_classifier(classifier, metadata, settings):
             im_ms, georef, cloud_mask, im_extra, im_QA, im_nodata = SDS_preprocess.preprocess_single(fn, satname, 
                                                                                                      settings['cloud_mask_issue'],
                                                                                                      settings['pan_off'],
-                                                                                                     settings['s2cloudless_prob'])
+                                                                                                     settings['s2cloudless_prob'],
+                                                                                                     settings.get('pansharpen_mode', 'full'))
             image_epsg = metadata[satname]['epsg'][i]
 
             # compute cloud_cover percentage (with no data pixels)
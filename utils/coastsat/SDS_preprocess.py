@@ -32,11 +32,13 @@ import re
 
 # CoastSat modules
 from .SDS_tools import *
+from .SDS_windows import WindowError, buffer_bbox, raster_window, window_georef
 
 np.seterr(all='ignore') # raise/ignore divisions by 0 and nans
 
 # Main function to preprocess a satellite image (L5, L7, L8, L9 or S2)
-def preprocess_single(fn, satname, cloud_mask_issue, pan_off, s2cloudless_prob=40):
+def preprocess_single(fn, satname, cloud_mask_issue, pan_off, s2cloudless_prob=40, pansharpen_mode='full',
+                      window=None, bbox=None):
     """
     Reads the image and outputs the pansharpened/down-sampled multispectral bands,
     the georeferencing vector of the image (coordinates of the upper left pixel),
@@ -60,6 +62,14 @@ def preprocess_single(fn, satname, cloud_mask_issue, pan_off, s2cloudless_prob=4
         if True, disable panchromatic sharpening and ignore pan band
     s2cloudless_prob: float [0,100)
         threshold to identify cloud pixels in the s2cloudless probability mask
+    pansharpen_mode: str
+        'full' (PCA on every pixel), 'subsample' or 'incremental' (bounded memory),
+        see pansharpen()
+    window: tuple
+        optional pixel window (col_off, row_off, ncols, nrows) of the first (multispectral) file;
+        only this window is read from every file, see read_bands()
+    bbox: tuple
+        optional (xmin, ymin, xmax, ymax) in the image CRS, used instead of window
         
     Returns:
     -----------
@@ -67,7 +77,7 @@ def preprocess_single(fn, satname, cloud_mask_issue, pan_off, s2cloudless_prob=4
         3D array containing the pansharpened/down-sampled bands (B,G,R,NIR,SWIR1)
     georef: np.array
         vector of 6 elements [Xtr, Xscale, Xshear, Ytr, Yshear, Yscale] defining the
-        coordinates of the top-left pixel of the image
+        coordinates of the top-left pixel of the image (of the window when one is given)
     cloud_mask: np.array
         2D cloud mask with True where cloud pixels are
     im_extra : np.array
@@ -88,6 +98,9 @@ def preprocess_single(fn, satname, cloud_mask_issue, pan_off, s2cloudless_prob=4
     fn_to_split=fn_to_split.split(os.sep)[-1].split('.')[0]
     # search for the year the tif was taken with regex and convert to int
     year = int(re.search('[0-9]+',fn_to_split).group(0))
+    # the window is given in pixels of the first file, the other files are read over the same bbox
+    if window is not None and bbox is None:
+        bbox = window_bbox(fn[0] if isinstance(fn, list) else fn, window)
         
     #=============================================================================================#
     # L5 images
@@ -97,14 +110,9 @@ def preprocess_single(fn, satname, cloud_mask_issue, pan_off, s2cloudless_prob=4
         fn_ms = fn[0]
         fn_mask = fn[1]
         # read ms bands
-        data = gdal.Open(fn_ms, gdal.GA_ReadOnly)
-        georef = np.array(data.GetGeoTransform())
-        bands = [data.GetRasterBand(k + 1).ReadAsArray() for k in range(data.RasterCount)]
-        im_ms = np.stack(bands, 2)
+        im_ms, georef = read_bands(fn_ms, bbox=bbox)
         # read cloud mask
-        data = gdal.Open(fn_mask, gdal.GA_ReadOnly)
-        bands = [data.GetRasterBand(k + 1).ReadAsArray() for k in range(data.RasterCount)]
-        im_QA = bands[0]
+        im_QA = read_bands(fn_mask, bands=[0], bbox=bbox, dtype=None)[0][:,:,0]
         cloud_mask = create_cloud_mask(im_QA, satname, cloud_mask_issue)
 
         # check if -inf or nan values on any band and eventually add those pixels to cloud mask
@@ -135,14 +143,9 @@ def preprocess_single(fn, satname, cloud_mask_issue, pan_off, s2cloudless_prob=4
         fn_pan = fn[1]  
         fn_mask = fn[2]  
         # read ms bands
-        data = gdal.Open(fn_ms, gdal.GA_ReadOnly)
-        georef = np.array(data.GetGeoTransform())
-        bands = [data.GetRasterBand(k + 1).ReadAsArray() for k in range(data.RasterCount)]
-        im_ms = np.stack(bands, 2)
+        im_ms, georef = read_bands(fn_ms, bbox=bbox)
         # read cloud mask
-        data = gdal.Open(fn_mask, gdal.GA_ReadOnly)
-        bands = [data.GetRasterBand(k + 1).ReadAsArray() for k in range(data.RasterCount)]
-        im_QA = bands[0]
+        im_QA = read_bands(fn_mask, bands=[0], bbox=bbox, dtype=None)[0][:,:,0]
         cloud_mask = create_cloud_mask(im_QA, satname, cloud_mask_issue)
         # check if -inf or nan values on any band and eventually add those pixels to cloud mask
         im_nodata = np.zeros(cloud_mask.shape).astype(bool)
@@ -168,15 +171,13 @@ def preprocess_single(fn, satname, cloud_mask_issue, pan_off, s2cloudless_prob=4
         # otherwise perform panchromatic sharpening
         else:
             # read panchromatic band
-            data = gdal.Open(fn_pan, gdal.GA_ReadOnly)
-            georef = np.array(data.GetGeoTransform())
-            bands = [data.GetRasterBand(k + 1).ReadAsArray() for k in range(data.RasterCount)]
-            im_pan = bands[0]
+            im_pan, georef = read_bands(fn_pan, bands=[0], bbox=bbox)
+            im_pan = im_pan[:,:,0]
            
             # pansharpen Green, Blue, NIR for Landsat 7
             if satname == 'L7':
                 try:
-                    im_ms_ps = pansharpen(im_ms[:,:,[1,2,3]], im_pan, cloud_mask)
+                    im_ms_ps = pansharpen(im_ms[:,:,[1,2,3]], im_pan, cloud_mask, pansharpen_mode)
                 except: # if pansharpening fails, keep downsampled bands (for long runs)
                     print('\npansharpening of image %s failed.'%fn[0])
                     im_ms_ps = im_ms[:,:,[1,2,3]]
@@ -190,7 +191,7 @@ def preprocess_single(fn, satname, cloud_mask_issue, pan_off, s2cloudless_prob=4
             # pansharpen Blue, Green, Red for Landsat 8 and 9           
             elif satname in ['L8','L9']:
                 try:
-                    im_ms_ps = pansharpen(im_ms[:,:,[0,1,2]], im_pan, cloud_mask)
+                    im_ms_ps = pansharpen(im_ms[:,:,[0,1,2]], im_pan, cloud_mask, pansharpen_mode)
                 except: # if pansharpening fails, keep downsampled bands (for long runs)
                     print('\npansharpening of image %s failed.'%fn[0])
                     im_ms_ps = im_ms[:,:,[0,1,2]]
@@ -206,19 +207,18 @@ def preprocess_single(fn, satname, cloud_mask_issue, pan_off, s2cloudless_prob=4
     if satname == 'S2':
         # read 10m bands (R,G,B,NIR)
         fn_ms = fn[0]
-        data = gdal.Open(fn_ms, gdal.GA_ReadOnly)
-        georef = np.array(data.GetGeoTransform())
-        bands = [data.GetRasterBand(k + 1).ReadAsArray() for k in range(data.RasterCount-1)]
-        im_ms = np.stack(bands, 2)
-        im_ms = im_ms/10000 # TOA scaled to 10000
+        nbands = raster_count(fn_ms)
+        # read the ms bands with room for the SWIR1 band appended below
+        im_ms, georef = read_bands(fn_ms, bands=range(nbands-1), bbox=bbox, extra_bands=1)
+        im_ms /= 10000 # TOA scaled to 10000
         # read s2cloudless cloud probability (last band in ms image)
-        cloud_prob = data.GetRasterBand(data.RasterCount).ReadAsArray()
+        cloud_prob = read_bands(fn_ms, bands=[nbands-1], bbox=bbox, dtype=None)[0][:,:,0]
 
         # image size
         nrows = im_ms.shape[0]
         ncols = im_ms.shape[1]
         # if image contains only zeros (can happen with S2), skip the image
-        if sum(sum(sum(im_ms))) < 1:
+        if np.sum(im_ms[:,:,:-1]) < 1:
             im_ms = []
             georef = []
             # skip the image by giving it a full cloud_mask
@@ -227,20 +227,14 @@ def preprocess_single(fn, satname, cloud_mask_issue, pan_off, s2cloudless_prob=4
 
         # read 20m band (SWIR1)
         fn_swir = fn[1]
-        data = gdal.Open(fn_swir, gdal.GA_ReadOnly)
-        bands = [data.GetRasterBand(k + 1).ReadAsArray() for k in range(data.RasterCount)]
-        im_swir = bands[0]
-        im_swir = im_swir/10000 # TOA scaled to 10000
-        im_swir = np.expand_dims(im_swir, axis=2)
-
-        # append down-sampled SWIR1 band to the other 10m bands
-        im_ms = np.append(im_ms, im_swir, axis=2)
+        # read it straight into the last band of im_ms (down-sampled SWIR1 appended to the 10m bands)
+        read_bands(fn_swir, bands=[0], bbox=bbox, out=im_ms[:,:,-1:])
+        im_ms[:,:,-1] /= 10000 # TOA scaled to 10000
+        im_swir = im_ms[:,:,-1:]
 
         # create cloud mask using 60m QA band (not as good as Landsat cloud cover)
         fn_mask = fn[2]
-        data = gdal.Open(fn_mask, gdal.GA_ReadOnly)
-        bands = [data.GetRasterBand(k + 1).ReadAsArray() for k in range(data.RasterCount)]
-        im_QA = bands[0]
+        im_QA = read_bands(fn_mask, bands=[0], bbox=bbox, dtype=None)[0][:,:,0]
         # compute cloud mask using QA60 band
         cloud_mask_QA60 = create_cloud_mask(im_QA, satname, cloud_mask_issue)
         # compute cloud mask using s2cloudless probability band
@@ -277,10 +271,116 @@ def preprocess_single(fn, satname, cloud_mask_issue, pan_off, s2cloudless_prob=4
 
     return im_ms, georef, cloud_mask, im_extra, im_QA, im_nodata
 
+def preprocess_single_cached(fn, satname, settings, bbox=None):
+    """
+    preprocess_single with the parameters taken from settings, its products cached on disk
+    (utils/preprocess_cache.py) so that save_jpg, extract_shorelines and get_reference_sl
+    preprocess each image only once.
+
+    Arguments:
+    -----------
+    fn: str or list of str
+        filename(s) of the .TIF file(s) of the image
+    satname: str
+        name of the satellite mission (e.g., 'L5')
+    settings: dict with the following keys
+        'inputs', 'cloud_mask_issue', 'pan_off', 's2cloudless_prob', 'pansharpen_mode' (optional)
+        'preprocess_cache': bool
+            True to cache the products on disk (default False)
+        'preprocess_cache_max_gb': float
+            size bound of the cache directory, least recently used entries are removed
+            beyond it (default preprocess_cache.MAX_BYTES)
+    bbox: tuple
+        optional (xmin, ymin, xmax, ymax) to read, see preprocess_single
+
+    Returns:
+    -----------
+    the outputs of preprocess_single
+
+    """
+    params = {'cloud_mask_issue': bool(settings['cloud_mask_issue']),
+              'pan_off': bool(settings['pan_off']),
+              's2cloudless_prob': settings['s2cloudless_prob'],
+              'pansharpen_mode': settings.get('pansharpen_mode', 'full'),
+              'bbox': [float(v) for v in bbox] if bbox is not None else None}
+    if not settings.get('preprocess_cache', False):
+        return preprocess_single(fn, satname, params['cloud_mask_issue'], params['pan_off'],
+                                 params['s2cloudless_prob'], params['pansharpen_mode'], bbox=bbox)
+    from utils import preprocess_cache
+    path = preprocess_cache.entry_path(settings, preprocess_cache.cache_key(fn, satname, params))
+    products = preprocess_cache.load(path)
+    if products is None:
+        products = preprocess_single(fn, satname, params['cloud_mask_issue'], params['pan_off'],
+                                     params['s2cloudless_prob'], params['pansharpen_mode'], bbox=bbox)
+        preprocess_cache.save(path, products)
+        max_gb = settings.get('preprocess_cache_max_gb')
+        preprocess_cache.prune(preprocess_cache.cache_dir(settings),
+                               preprocess_cache.MAX_BYTES if max_gb is None else max_gb * 2**30)
+    return products
+
 ###################################################################################################
 # AUXILIARY FUNCTIONS
 ###################################################################################################
 
+def raster_count(fn):
+    """Number of bands of a raster file."""
+    data = gdal.Open(fn, gdal.GA_ReadOnly)
+    return data.RasterCount
+
+def window_bbox(fn, window):
+    """(xmin, ymin, xmax, ymax) of a pixel window of a raster file."""
+    data = gdal.Open(fn, gdal.GA_ReadOnly)
+    georef = np.array(data.GetGeoTransform())
+    col_off, row_off, ncols, nrows = raster_window(georef, (data.RasterYSize, data.RasterXSize), window=window)
+    xs = [georef[0] + col_off*georef[1], georef[0] + (col_off + ncols)*georef[1]]
+    ys = [georef[3] + row_off*georef[5], georef[3] + (row_off + nrows)*georef[5]]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+def read_bands(fn, bands=None, window=None, bbox=None, dtype=np.float32, out=None, extra_bands=0):
+    """
+    Reads bands of a raster, or only a window of them, straight into a preallocated
+    (rows, cols, bands) array; no full-scene float64 copy is made as with ReadAsArray + np.stack.
+
+    Arguments:
+    -----------
+    fn: str
+        filename of the .TIF file
+    bands: list
+        0-based band indices, all bands if None
+    window: tuple
+        pixel window (col_off, row_off, ncols, nrows)
+    bbox: tuple
+        (xmin, ymin, xmax, ymax) in the image CRS, used if window is None
+    dtype: np.dtype
+        dtype of the output array, the dtype of the raster if None
+    out: np.array
+        optional output array (or view) of shape (rows, cols, len(bands))
+    extra_bands: int
+        number of empty bands to allocate after the bands read (e.g. for a band from another file)
+
+    Returns:
+    -----------
+    im: np.array
+        3D array (rows, cols, bands)
+    georef: np.array
+        geotransform of the window
+
+    """
+    data = gdal.Open(fn, gdal.GA_ReadOnly)
+    georef = np.array(data.GetGeoTransform())
+    if bands is None:
+        bands = range(data.RasterCount)
+    bands = list(bands)
+    col_off, row_off, ncols, nrows = raster_window(georef, (data.RasterYSize, data.RasterXSize), window, bbox)
+    if out is None:
+        if dtype is None:
+            dtype = data.GetRasterBand(bands[0] + 1).ReadAsArray(0, 0, 1, 1).dtype
+        out = np.zeros((nrows, ncols, len(bands) + extra_bands), dtype=dtype)
+    for i, k in enumerate(bands):
+        # GDAL writes into the strided band view directly
+        data.GetRasterBand(k + 1).ReadAsArray(col_off, row_off, ncols, nrows, buf_obj=out[:,:,i])
+    return out, window_georef(georef, (col_off, row_off))
+
 def find_edge_padding(im_band: np.ndarray) -> np.ndarray:
     """
     Finds the padding required for each edge of an image band based on the presence of data.
@@ -463,13 +563,16 @@ def hist_match(source, template):
 
     return interp_t_values[bin_idx].reshape(oldshape)
 
-def pansharpen(im_ms, im_pan, cloud_mask):
+def pansharpen(im_ms, im_pan, cloud_mask, mode='full'):
     """
     Pansharpens a multispectral image, using the panchromatic band and a cloud mask.
     A PCA is applied to the image, then the 1st PC is replaced, after histogram
     matching with the panchromatic band. Note that it is essential to match the
     histrograms of the 1st PC and the panchromatic band before replacing and
     inverting the PCA.
+    With mode 'subsample' or 'incremental' the PCA is fitted on a pixel subsample
+    or with IncrementalPCA and applied block by block into a float32 output
+    (utils/pansharpening.py), which keeps memory bounded on large scenes.
 
     KV WRL 2018
 
@@ -481,6 +584,8 @@ def pansharpen(im_ms, im_pan, cloud_mask):
         Panchromatic band (2D)
     cloud_mask: np.array
         2D cloud mask with True where cloud pixels are
+    mode: str
+        'full', 'subsample' or 'incremental'
 
     Returns:
     -----------
@@ -488,6 +593,10 @@ def pansharpen(im_ms, im_pan, cloud_mask):
         Pansharpened multispectral image (3D)
 
     """
+    if mode != 'full':
+        from utils import pansharpening
+        return pansharpening.pansharpen_blockwise(im_ms, im_pan, cloud_mask, method=mode)
+
     # check that cloud cover is not too high otherwise pansharpening fails
     if sum(sum(cloud_mask)) > 0.95*cloud_mask.shape[0]*cloud_mask.shape[1]:
         return im_ms
@@ -518,6 +627,8 @@ def rescale_image_intensity(im, cloud_mask, prob_high):
     Rescales the intensity of an image (multispectral or single band) by applying
     a cloud mask and clipping the prob_high upper percentile. This functions allows
     to stretch the contrast of an image, only for visualisation purposes.
+    The percentiles come from streaming histograms, one row block at a time, instead of
+    np.percentile on a full copy of every band (utils/radiometric_stretch.py).
 
     KV WRL 2018
 
@@ -533,44 +644,13 @@ def rescale_image_intensity(im, cloud_mask, prob_high):
     Returns:
     -----------
     im_adj: np.array
-        rescaled image
+        rescaled image (float32, NaN on cloud pixels)
     """
+    from utils import radiometric_stretch
+    return radiometric_stretch.rescale_image_intensity(im, cloud_mask, prob_high)
 
-    # lower percentile is set to 0
-    prc_low = 0
-
-    # reshape the 2D cloud mask into a 1D vector
-    vec_mask = cloud_mask.reshape(im.shape[0] * im.shape[1])
-
-    # if image contains several bands, stretch the contrast for each band
-    if len(im.shape) > 2:
-        # reshape into a vector
-        vec =  im.reshape(im.shape[0] * im.shape[1], im.shape[2])
-        # initiliase with NaN values
-        vec_adj = np.ones((len(vec_mask), im.shape[2])) * np.nan
-        # loop through the bands
-        for i in range(im.shape[2]):
-            # find the higher percentile (based on prob)
-            prc_high = np.percentile(vec[~vec_mask, i], prob_high)
-            # clip the image around the 2 percentiles and rescale the contrast
-            vec_rescaled = exposure.rescale_intensity(vec[~vec_mask, i],
-                                                      in_range=(prc_low, prc_high))
-            vec_adj[~vec_mask,i] = vec_rescaled
-        # reshape into image
-        im_adj = vec_adj.reshape(im.shape[0], im.shape[1], im.shape[2])
-
-    # if image only has 1 bands (grayscale image)
-    else:
-        vec =  im.reshape(im.shape[0] * im.shape[1])
-        vec_adj = np.ones(len(vec_mask)) * np.nan
-        prc_high = np.percentile(vec[~vec_mask], prob_high)
-        vec_rescaled = exposure.rescale_intensity(vec[~vec_mask], in_range=(prc_low, prc_high))
-        vec_adj[~vec_mask] = vec_rescaled
-        im_adj = vec_adj.reshape(im.shape[0], im.shape[1])
-
-    return im_adj
-
-def create_jpg(im_ms, cloud_mask, date, satname, filepath, use_matplotlib=True):
+def create_jpg(im_ms, cloud_mask, date, satname, filepath, use_matplotlib=True, renderer='matplotlib',
+               panels=('RGB',)):
     """
     Saves a .jpg file with the RGB image as well as the NIR and SWIR1 grayscale images.
     This functions can be modified to obtain different visualisations of the
@@ -591,17 +671,25 @@ def create_jpg(im_ms, cloud_mask, date, satname, filepath, use_matplotlib=True):
     filepath: str
         directory in which to save the images
     use_matplotlib: boolean
-        False to save a .jpg and True to save as matplotlib plots
+        False to save a .jpg and True to save as a titled figure
+    renderer: str
+        'matplotlib' (default) to draw it with a matplotlib figure, or 'array' to compose it
+        directly with utils/quicklook.py (faster, no matplotlib; OpenCV title font and
+        jpg encoder, so the pixels differ slightly from the matplotlib figure)
+    panels: tuple
+        panels of the figure, among 'RGB', 'NIR' and 'SWIR'
 
     Returns:
     -----------
         Saves a .jpg image corresponding to the preprocessed satellite image
 
     """
+    # only the RGB image is needed for the default figure
+    bands = ['RGB', 'NIR', 'SWIR'] if not use_matplotlib else panels
     # rescale image intensity for display purposes
     im_RGB = rescale_image_intensity(im_ms[:,:,[2,1,0]], cloud_mask, 99.9)
-    im_NIR = rescale_image_intensity(im_ms[:,:,3], cloud_mask, 99.9)
-    im_SWIR = rescale_image_intensity(im_ms[:,:,4], cloud_mask, 99.9)
+    im_NIR = rescale_image_intensity(im_ms[:,:,3], cloud_mask, 99.9) if 'NIR' in bands else None
+    im_SWIR = rescale_image_intensity(im_ms[:,:,4], cloud_mask, 99.9) if 'SWIR' in bands else None
     
     # creates raw jpg files that can be used for ML applications
     if not use_matplotlib:
@@ -614,8 +702,7 @@ def create_jpg(im_ms, cloud_mask, date, satname, filepath, use_matplotlib=True):
         # create folders RGB, SWIR, and NIR to hold each type of image
         for ext in file_types:
             ext_filepath = filepath + os.sep + ext
-            if not os.path.exists(ext_filepath):
-                os.mkdir(ext_filepath)
+            os.makedirs(ext_filepath, exist_ok=True)
             # location to save image rgb image would be in sitename/RGB/sitename.jpg
             fname=os.path.join(ext_filepath, date + '_'+ ext +'_' + satname + '.jpg')
             if ext == "RGB":
@@ -624,45 +711,78 @@ def create_jpg(im_ms, cloud_mask, date, satname, filepath, use_matplotlib=True):
                 imsave(fname, im_SWIR, quality=100)
             if ext == "NIR":
                 imsave(fname, im_NIR, quality=100)
+
+    # titled figure composed as an array, without creating a matplotlib figure
+    elif renderer == 'array':
+        from utils import quicklook
+        canvas = quicklook.scene_quicklook(im_RGB, date, satname, im_NIR, im_SWIR)
+        quicklook.save(os.path.join(filepath, date + '_' + satname + '.jpg'), canvas)
                 
-    # if use_matplotlib=True, creates a nicer plot
+    # otherwise draw the figure with matplotlib
     else:
         fig = plt.figure()
         fig.set_size_inches([18,9])
         fig.set_tight_layout(True)
-        ax1 = fig.add_subplot(111)
-        ax1.axis('off')
-        ax1.imshow(im_RGB)
-        ax1.set_title(date + '   ' + satname, fontsize=16)
-        
         # choose vertical or horizontal based on image size
-        # if im_RGB.shape[1] > 2.5*im_RGB.shape[0]:
-        #     ax1 = fig.add_subplot(311)
-        #     ax2 = fig.add_subplot(312)
-        #     ax3 = fig.add_subplot(313)
-        # else:
-        #     ax1 = fig.add_subplot(131)
-        #     ax2 = fig.add_subplot(132)
-        #     ax3 = fig.add_subplot(133)
-        # # RGB
-        # ax1.axis('off')
-        # ax1.imshow(im_RGB)
-        # ax1.set_title(date + '   ' + satname, fontsize=16)
-        # # NIR
-        # ax2.axis('off')
-        # ax2.imshow(im_NIR, cmap='seismic')
-        # ax2.set_title('Near Infrared', fontsize=16)
-        # # SWIR
-        # ax3.axis('off')
-        # ax3.imshow(im_SWIR, cmap='seismic')
-        # ax3.set_title('Short-wave Infrared', fontsize=16)
+        n = len(panels)
+        if n > 1 and im_RGB.shape[1] > 2.5*im_RGB.shape[0]:
+            axes = [fig.add_subplot(n, 1, k + 1) for k in range(n)]
+        else:
+            axes = [fig.add_subplot(1, n, k + 1) for k in range(n)]
+        for ax, panel in zip(axes, panels):
+            ax.axis('off')
+            if panel == 'RGB':
+                ax.imshow(im_RGB)
+                ax.set_title(date + '   ' + satname, fontsize=16)
+            elif panel == 'NIR':
+                ax.imshow(im_NIR, cmap='seismic')
+                ax.set_title('Near Infrared', fontsize=16)
+            elif panel == 'SWIR':
+                ax.imshow(im_SWIR, cmap='seismic')
+                ax.set_title('Short-wave Infrared', fontsize=16)
     
         # save figure
         fig.savefig(os.path.join(filepath, date + '_' + satname + '.jpg'), dpi=150)
+        plt.close(fig)
+
+def save_jpg_single(fn, satname, date, settings, filepath_jpg, use_matplotlib=False):
+    """
+    Preprocesses one image and saves its .jpg unless it is too cloudy (one save_jpg task).
+
+    Returns:
+    -----------
+    saved: bool
+        True if the .jpg was written
+
+    """
+    im_ms, georef, cloud_mask, im_extra, im_QA, im_nodata = preprocess_single_cached(fn, satname, settings)
+
+    # compute cloud_cover percentage (with no data pixels)
+    cloud_cover_combined = np.divide(sum(sum(cloud_mask.astype(int))),
+                            (cloud_mask.shape[0]*cloud_mask.shape[1]))
+    if cloud_cover_combined > 0.99: # if 99% of cloudy pixels in image skip
+        return False
+
+    # remove no data pixels from the cloud mask (for example L7 bands of no data should not be accounted for)
+    cloud_mask_adv = np.logical_xor(cloud_mask, im_nodata)
+    # compute updated cloud cover percentage (without no data pixels)
+    cloud_cover = np.divide(sum(sum(cloud_mask_adv.astype(int))),
+                            (sum(sum((~im_nodata).astype(int)))))
+    # skip image if cloud cover is above threshold
+    if cloud_cover > settings['cloud_thresh'] or cloud_cover == 1:
+        return False
+    # save .jpg with date and satellite in the title
+    renderer = settings.get('jpg_renderer', 'matplotlib')
+    if renderer == 'matplotlib':
+        plt.ioff()  # turning interactive plotting off
+    create_jpg(im_ms, cloud_mask, date, satname, filepath_jpg, use_matplotlib, renderer,
+               settings.get('jpg_panels', ('RGB',)))
+    return True
 
 def save_jpg(metadata, settings, use_matplotlib=False):
     """
     Saves a .jpg image for all the images contained in metadata.
+    The images are preprocessed and rendered on a process pool (utils/parallel_utils.py).
 
     KV WRL 2018
 
@@ -683,16 +803,24 @@ def save_jpg(metadata, settings, use_matplotlib=False):
             threshold to identify cloud pixels in the s2cloudless probability mask
         'use_matplotlib': boolean
             False to save a .jpg and True to save as matplotlib plots
+        'preprocess_cache': boolean
+            True to enable the preprocessed scene cache shared with extract_shorelines
+            (default False, see preprocess_single_cached)
+        'jpg_renderer': str
+            'matplotlib' (default) or 'array', see create_jpg
+        'jpg_panels': tuple
+            panels of the titled figures, default ('RGB',), see create_jpg
+        'jobs': int
+            number of worker processes, default 1 (each worker holds a full scene in memory)
 
     Returns:
     -----------
     Stores the images as .jpg in a folder named /preprocessed
 
     """
+    from utils import parallel_utils
 
     sitename = settings['inputs']['sitename']
-    cloud_thresh = settings['cloud_thresh']
-    s2cloudless_prob = settings['s2cloudless_prob']
     filepath_data = settings['inputs']['filepath']
     
     # create subfolder to store the jpg files
@@ -700,41 +828,26 @@ def save_jpg(metadata, settings, use_matplotlib=False):
     if not os.path.exists(filepath_jpg):
             os.makedirs(filepath_jpg)
 
-    # loop through satellite list
+    # one task per image
     print('Saving images as jpg:')
+    tasks = []
     for satname in metadata.keys():
         
         filepath = SDS_tools.get_filepath(settings['inputs'],satname)
         filenames = metadata[satname]['filenames']
         print('%s: %d images'%(satname,len(filenames)))
-        # loop through images
         for i in range(len(filenames)):
-            print('\r%d%%' %int((i+1)/len(filenames)*100), end='')
             # image filename
             fn = SDS_tools.get_filenames(filenames[i],filepath, satname)
-            # read and preprocess image
-            im_ms, georef, cloud_mask, im_extra, im_QA, im_nodata = preprocess_single(fn, satname, settings['cloud_mask_issue'],
-                                                                                      settings['pan_off'], s2cloudless_prob)
-
-            # compute cloud_cover percentage (with no data pixels)
-            cloud_cover_combined = np.divide(sum(sum(cloud_mask.astype(int))),
-                                    (cloud_mask.shape[0]*cloud_mask.shape[1]))
-            if cloud_cover_combined > 0.99: # if 99% of cloudy pixels in image skip
-                continue
-
-            # remove no data pixels from the cloud mask (for example L7 bands of no data should not be accounted for)
-            cloud_mask_adv = np.logical_xor(cloud_mask, im_nodata)
-            # compute updated cloud cover percentage (without no data pixels)
-            cloud_cover = np.divide(sum(sum(cloud_mask_adv.astype(int))),
-                                    (sum(sum((~im_nodata).astype(int)))))
-            # skip image if cloud cover is above threshold
-            if cloud_cover > cloud_thresh or cloud_cover == 1:
-                continue
-            # save .jpg with date and satellite in the title
             date = filenames[i][:19]
-            plt.ioff()  # turning interactive plotting off
-            create_jpg(im_ms, cloud_mask, date, satname, filepath_jpg, use_matplotlib)
-        print('')
+            tasks.append((filenames[i], save_jpg_single,
+                          (fn, satname, date, settings, filepath_jpg, use_matplotlib)))
+    timings = parallel_utils.run_tasks(tasks, settings.get('jobs', 1))
+    for t in timings:
+        if t['error']:
+            print('Could not save %s: %s'%(t['name'], t['error']))
+    print('%d images saved, %d skipped (cloudy)'%(sum(t['result'] is True for t in timings),
+                                                   sum(t['result'] is False for t in timings)))
     # print the location where the images have been saved
     print('Satellite images saved as .jpg in ' + os.path.join(filepath_data, sitename,
                                                     'jpg_files', 'preprocessed'))
@@ -810,9 +923,7 @@ def get_reference_sl(metadata, settings):
 
         # read image
         fn = SDS_tools.get_filenames(filenames[i],filepath, satname)
-        im_ms, georef, cloud_mask, im_extra, im_QA, im_nodata = preprocess_single(fn, satname, settings['cloud_mask_issue'],
-                                                                                  settings['pan_off'],
-                                                                                  settings['s2cloudless_prob'])
+        im_ms, georef, cloud_mask, im_extra, im_QA, im_nodata = preprocess_single_cached(fn, satname, settings)
 
         # compute cloud_cover percentage (with no data pixels)
         cloud_cover_combined = np.divide(sum(sum(cloud_mask.astype(int))),
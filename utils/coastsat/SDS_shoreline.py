@@ -77,6 +77,12 @@ def extract_shorelines(metadata, settings):
             are erroneously being masked on the images
         's2cloudless_prob': float [0,100)
             threshold to identify cloud pixels in the s2cloudless probability mask
+        'crop_to_reference': bool
+            if True, only the bounding box of the reference shoreline buffer is read
+            from each image (see reference_bbox), the cloud cover is computed on that region
+        'preprocess_cache': bool
+            True to enable the preprocessed scene cache shared with save_jpg
+            (default False, see SDS_preprocess.preprocess_single_cached)
             
     Returns:
     -----------
@@ -147,13 +153,21 @@ def extract_shorelines(metadata, settings):
 
             # get image filename
             fn = SDS_tools.get_filenames(filenames[i],filepath, satname)
-            # preprocess image (cloud mask + pansharpening/downsampling)
-            im_ms, georef, cloud_mask, im_extra, im_QA, im_nodata = SDS_preprocess.preprocess_single(fn, satname, 
-                                                                                                     settings['cloud_mask_issue'], 
-                                                                                                     settings['pan_off'],
-                                                                                                     settings['s2cloudless_prob'])
             # get image spatial reference system (epsg code) from metadata dict
             image_epsg = metadata[satname]['epsg'][i]
+            # only read the region around the reference shoreline if requested
+            bbox = None
+            if settings.get('crop_to_reference', False):
+                bbox = reference_bbox(image_epsg, settings)
+            # preprocess image (cloud mask + pansharpening/downsampling)
+            # (with settings["preprocess_cache"], images already preprocessed by save_jpg are not processed again)
+            try:
+                im_ms, georef, cloud_mask, im_extra, im_QA, im_nodata = SDS_preprocess.preprocess_single_cached(fn, satname,
+                                                                                                                settings, bbox=bbox)
+            except SDS_preprocess.WindowError:
+                # the reference shoreline is outside this image
+                print('\n%s: skipped, the reference shoreline is outside the image' % filenames[i])
+                continue
             
             # compute cloud_cover percentage (with no data pixels)
             cloud_cover_combined = np.divide(sum(sum(cloud_mask.astype(int))),
@@ -522,6 +536,35 @@ def find_wl_contours2(im_ms, im_labels, cloud_mask, im_ref_buffer):
 # SHORELINE PROCESSING FUNCTIONS
 ###################################################################################################
 
+def reference_bbox(image_epsg, settings):
+    """
+    Bounding box of the buffer around the reference shoreline, in the image CRS, used to
+    read only that region of the images (SDS_preprocess.preprocess_single(bbox=...)).
+
+    Arguments:
+    -----------
+    image_epsg: int
+        spatial reference system of the image
+    settings: dict with the following keys
+        'output_epsg': int
+            output spatial reference system
+        'reference_shoreline': np.array
+            coordinates of the reference shoreline
+        'max_dist_ref': int
+            maximum distance from the reference shoreline in metres
+
+    Returns:    
+    -----------
+    bbox: tuple
+        (xmin, ymin, xmax, ymax), None if there is no reference shoreline
+
+    """
+    if 'reference_shoreline' not in settings.keys() or len(settings['reference_shoreline']) == 0:
+        return None
+    ref_sl = SDS_tools.convert_epsg(settings['reference_shoreline'], settings['output_epsg'], image_epsg)
+    # pad the buffer by a few pixels for the morphological operations along its edges
+    return SDS_preprocess.buffer_bbox(ref_sl[:,:2], settings['max_dist_ref'] + 100)
+
 def create_shoreline_buffer(im_shape, georef, image_epsg, pixel_size, settings):
     """
     Creates a buffer around the reference shoreline. The size of the buffer is 
@@ -0,0 +1,80 @@
+"""
+This module contains the pixel window helpers used to read only a region of the
+satellite images; numpy only, no GDAL, so they can be used and tested anywhere.
+"""
+
+# load modules
+import numpy as np
+
+
+class WindowError(ValueError):
+    """A window or bounding box that does not intersect the image."""
+
+
+def raster_window(georef, shape, window=None, bbox=None):
+    """
+    Pixel window of a raster, clipped to the raster extent.
+
+    Arguments:
+    -----------
+    georef: np.array
+        geotransform of the raster [Xtr, Xscale, Xshear, Ytr, Yshear, Yscale]
+    shape: tuple
+        (rows, cols) of the raster
+    window: tuple
+        pixel window (col_off, row_off, ncols, nrows)
+    bbox: tuple
+        (xmin, ymin, xmax, ymax) in the raster CRS, used if window is None
+
+    Returns:
+    -----------
+    window: tuple
+        (col_off, row_off, ncols, nrows), the full raster if neither window nor bbox are given
+
+    """
+    rows, cols = shape
+    if window is None and bbox is None:
+        return 0, 0, cols, rows
+    if window is None:
+        xmin, ymin, xmax, ymax = bbox
+        # pixel edges, with a tolerance so that a bbox on the pixel grid is not widened by rounding
+        c = sorted([(xmin - georef[0])/georef[1], (xmax - georef[0])/georef[1]])
+        r = sorted([(ymin - georef[3])/georef[5], (ymax - georef[3])/georef[5]])
+        col0, col1 = int(np.floor(c[0] + 1e-6)), int(np.ceil(c[1] - 1e-6))
+        row0, row1 = int(np.floor(r[0] + 1e-6)), int(np.ceil(r[1] - 1e-6))
+    else:
+        col0, row0 = window[0], window[1]
+        col1, row1 = col0 + window[2], row0 + window[3]
+    col0, col1 = max(col0, 0), min(col1, cols)
+    row0, row1 = max(row0, 0), min(row1, rows)
+    if col1 <= col0 or row1 <= row0:
+        raise WindowError('window does not intersect the image')
+    return col0, row0, col1 - col0, row1 - row0
+
+def window_georef(georef, window):
+    """Geotransform of a pixel window (col_off, row_off, ncols, nrows) of a raster."""
+    col_off, row_off = window[0], window[1]
+    return np.array([georef[0] + col_off*georef[1] + row_off*georef[2], georef[1], georef[2],
+                     georef[3] + col_off*georef[4] + row_off*georef[5], georef[4], georef[5]])
+
+
+def buffer_bbox(points, distance):
+    """
+    Bounding box of a set of points grown by distance on every side.
+
+    Arguments:
+    -----------
+    points: np.array
+        (N, 2) coordinates (x, y)
+    distance: float
+        distance added on each side, in the units of the coordinates
+
+    Returns:
+    -----------
+    bbox: tuple
+        (xmin, ymin, xmax, ymax)
+
+    """
+    points = np.asarray(points)
+    return (np.min(points[:,0]) - distance, np.min(points[:,1]) - distance,
+            np.max(points[:,0]) + distance, np.max(points[:,1]) + distance)
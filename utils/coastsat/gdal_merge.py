@@ -33,6 +33,7 @@
 import math
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
 
 from osgeo import gdal
 
@@ -45,6 +46,10 @@ __version__ = '$id$'[5:-1]
 verbose = 0
 quiet = 0
 
+# creation options of the block mode when none are given on the command line
+TILED_CREATE_OPTIONS = ['TILED=YES', 'COMPRESS=DEFLATE', 'PREDICTOR=2', 'BIGTIFF=IF_SAFER']
+COMPOSITE_METHODS = ['first', 'last', 'mean']
+
 
 # =============================================================================
 def raster_copy( s_fh, s_xoff, s_yoff, s_xsize, s_ysize, s_band_n,
@@ -198,29 +203,19 @@ class file_info:
         print('UL:(%f,%f)   LR:(%f,%f)'
               % (self.ulx,self.uly,self.lrx,self.lry))
 
-    def copy_into( self, t_fh, s_band = 1, t_band = 1, nodata_arg=None ):
+    def windows( self, t_geotransform, t_xsize, t_ysize ):
         """
-        Copy this files image into target file.
+        Footprint of this file in a target grid.
 
-        This method will compute the overlap area of the file_info objects
-        file, and the target gdal.Dataset object, and copy the image data
-        for the common window area.  It is assumed that the files are in
-        a compatible projection ... no checking or warping is done.  However,
-        if the destination file is a different resolution, or different
-        image pixel type, the appropriate resampling and conversions will
-        be done (using normal GDAL promotion/demotion rules).
-
-        t_fh -- gdal.Dataset object for the file into which some or all
-        of this file may be copied.
-
-        Returns 1 on success (or if nothing needs to be copied), and zero one
-        failure.
+        Returns ((tw_xoff, tw_yoff, tw_xsize, tw_ysize),
+        (sw_xoff, sw_yoff, sw_xsize, sw_ysize)), the target window in
+        target pixels and the matching source window in source pixels,
+        or None if the file does not overlap the target.
         """
-        t_geotransform = t_fh.GetGeoTransform()
         t_ulx = t_geotransform[0]
         t_uly = t_geotransform[3]
-        t_lrx = t_geotransform[0] + t_fh.RasterXSize * t_geotransform[1]
-        t_lry = t_geotransform[3] + t_fh.RasterYSize * t_geotransform[5]
+        t_lrx = t_geotransform[0] + t_xsize * t_geotransform[1]
+        t_lry = t_geotransform[3] + t_ysize * t_geotransform[5]
 
         # figure out intersection region
         tgw_ulx = max(t_ulx,self.ulx)
@@ -234,11 +229,11 @@ class file_info:
 
         # do they even intersect?
         if tgw_ulx >= tgw_lrx:
-            return 1
+            return None
         if t_geotransform[5] < 0 and tgw_uly <= tgw_lry:
-            return 1
+            return None
         if t_geotransform[5] > 0 and tgw_uly >= tgw_lry:
-            return 1
+            return None
 
         # compute target window in pixel coordinates.
         tw_xoff = int((tgw_ulx - t_geotransform[0]) / t_geotransform[1] + 0.1)
@@ -249,7 +244,7 @@ class file_info:
                    - tw_yoff
 
         if tw_xsize < 1 or tw_ysize < 1:
-            return 1
+            return None
 
         # Compute source window in pixel coordinates.
         sw_xoff = int((tgw_ulx - self.geotransform[0]) / self.geotransform[1])
@@ -260,7 +255,35 @@ class file_info:
                        / self.geotransform[5] + 0.5) - sw_yoff
 
         if sw_xsize < 1 or sw_ysize < 1:
+            return None
+
+        return ((tw_xoff, tw_yoff, tw_xsize, tw_ysize),
+                (sw_xoff, sw_yoff, sw_xsize, sw_ysize))
+
+    def copy_into( self, t_fh, s_band = 1, t_band = 1, nodata_arg=None ):
+        """
+        Copy this files image into target file.
+
+        This method will compute the overlap area of the file_info objects
+        file, and the target gdal.Dataset object, and copy the image data
+        for the common window area.  It is assumed that the files are in
+        a compatible projection ... no checking or warping is done.  However,
+        if the destination file is a different resolution, or different
+        image pixel type, the appropriate resampling and conversions will
+        be done (using normal GDAL promotion/demotion rules).
+
+        t_fh -- gdal.Dataset object for the file into which some or all
+        of this file may be copied.
+
+        Returns 1 on success (or if nothing needs to be copied), and zero one
+        failure.
+        """
+        windows = self.windows( t_fh.GetGeoTransform(), t_fh.RasterXSize,
+                                t_fh.RasterYSize )
+        if windows is None:
             return 1
+        (tw_xoff, tw_yoff, tw_xsize, tw_ysize), \
+            (sw_xoff, sw_yoff, sw_xsize, sw_ysize) = windows
 
         # Open the source file, and copy the selected region.
         s_fh = gdal.Open( self.filename )
@@ -270,13 +293,207 @@ class file_info:
                             nodata_arg )
 
 
+# =============================================================================
+# Block mode: the output grid is cut into blocks, worker processes read the
+# overlapping window of every input and composite them, and the main process
+# writes the finished blocks in order.
+
+# source datasets opened by this process, kept open across blocks
+_datasets = {}
+
+def _open_source( filename ):
+    if filename not in _datasets:
+        _datasets[filename] = gdal.Open( filename )
+    return _datasets[filename]
+
+def block_windows( xsize, ysize, block ):
+    """Output blocks (xoff, yoff, xsize, ysize), row by row."""
+    blocks = []
+    for yoff in range(0, ysize, block):
+        for xoff in range(0, xsize, block):
+            blocks.append( (xoff, yoff, min(block, xsize - xoff),
+                            min(block, ysize - yoff)) )
+    return blocks
+
+def _read_window( filename, s_band_n, windows, block, nodata ):
+    """
+    Read the part of a source band that falls in an output block.
+
+    Returns (x0, y0, data, valid), with (x0, y0) the offset of data in the
+    block and valid a boolean array of the pixels to composite, or None if
+    the source does not overlap the block.
+    """
+    import numpy
+
+    (tw_xoff, tw_yoff, tw_xsize, tw_ysize), \
+        (sw_xoff, sw_yoff, sw_xsize, sw_ysize) = windows
+    bx, by, bw, bh = block
+    x0 = max(bx, tw_xoff)
+    y0 = max(by, tw_yoff)
+    x1 = min(bx + bw, tw_xoff + tw_xsize)
+    y1 = min(by + bh, tw_yoff + tw_ysize)
+    if x0 >= x1 or y0 >= y1:
+        return None
+
+    # matching source window, the source may have another resolution
+    fx = sw_xsize / float(tw_xsize)
+    fy = sw_ysize / float(tw_ysize)
+    s_xoff = sw_xoff + int(round((x0 - tw_xoff) * fx))
+    s_yoff = sw_yoff + int(round((y0 - tw_yoff) * fy))
+    s_xsize = max(1, sw_xoff + int(round((x1 - tw_xoff) * fx)) - s_xoff)
+    s_ysize = max(1, sw_yoff + int(round((y1 - tw_yoff) * fy)) - s_yoff)
+
+    s_fh = _open_source( filename )
+    s_xsize = min(s_xsize, s_fh.RasterXSize - s_xoff)
+    s_ysize = min(s_ysize, s_fh.RasterYSize - s_yoff)
+    s_band = s_fh.GetRasterBand( s_band_n )
+    data = s_band.ReadAsArray( s_xoff, s_yoff, s_xsize, s_ysize, x1 - x0, y1 - y0 )
+
+    # same validity rules as raster_copy: -n, else the mask band, else an alpha band
+    if nodata is not None:
+        valid = numpy.not_equal( data, nodata )
+    elif s_band.GetMaskFlags() != gdal.GMF_ALL_VALID:
+        mask = s_band.GetMaskBand().ReadAsArray( s_xoff, s_yoff, s_xsize, s_ysize,
+                                                 x1 - x0, y1 - y0 )
+        valid = numpy.not_equal( mask, 0 )
+    elif s_band.GetColorInterpretation() == gdal.GCI_AlphaBand:
+        valid = numpy.not_equal( data, 0 )
+    else:
+        valid = numpy.ones( data.shape, dtype=bool )
+    return x0 - bx, y0 - by, data, valid
+
+def composite_block( block, sources, band_map, dtype, nodata, method, init, base ):
+    """
+    Composite the inputs overlapping one output block.
+
+    block -- (xoff, yoff, xsize, ysize) in output pixels.
+    sources -- {file index: (filename, windows)} of the overlapping inputs,
+    windows as returned by file_info.windows().
+    band_map -- per output band, list of (file index, source band) in input order.
+    method -- 'first' (first valid input wins), 'last' (last valid input wins,
+    as the classic copy) or 'mean' (mean of the valid inputs).
+    init -- per output band start value, base -- block already in the output or None.
+
+    Returns (block, array of shape (bands, ysize, xsize)).
+    """
+    import numpy
+
+    bw, bh = block[2], block[3]
+    if base is not None:
+        out = numpy.array( base, dtype=dtype )
+    else:
+        out = numpy.empty( (len(band_map), bh, bw), dtype=dtype )
+        for b in range(len(band_map)):
+            out[b] = init[b]
+
+    for b, contributors in enumerate(band_map):
+        filled = numpy.zeros( (bh, bw), dtype=bool )
+        if method == 'mean':
+            total = numpy.zeros( (bh, bw), dtype=numpy.float64 )
+            count = numpy.zeros( (bh, bw), dtype=numpy.int32 )
+        for fi_index, s_band_n in contributors:
+            if fi_index not in sources:
+                continue
+            filename, windows = sources[fi_index]
+            res = _read_window( filename, s_band_n, windows, block, nodata )
+            if res is None:
+                continue
+            x0, y0, data, valid = res
+            win = (slice(y0, y0 + data.shape[0]), slice(x0, x0 + data.shape[1]))
+            if method == 'mean':
+                total[win][valid] += data[valid]
+                count[win][valid] += 1
+                continue
+            if method == 'first':
+                valid = valid & ~filled[win]
+                filled[win] |= valid
+            out[b][win][valid] = data[valid]
+        if method == 'mean':
+            has = count > 0
+            mean = total[has] / count[has]
+            if numpy.dtype(dtype).kind in 'iu':
+                mean = numpy.round( mean )
+            out[b][has] = mean
+    return block, out
+
+def merge_blocks( t_fh, file_infos, band_map, nodata, method, init,
+                  block=512, jobs=1, existing=False ):
+    """
+    Copy the inputs into t_fh block by block, compositing overlaps with method.
+    Blocks are computed by up to jobs worker processes, at most 2 * jobs
+    blocks are in flight so memory stays bounded whatever the output size.
+    """
+    from osgeo import gdal_array
+
+    t_geotransform = t_fh.GetGeoTransform()
+    footprints = {}
+    for i, fi in enumerate(file_infos):
+        windows = fi.windows( t_geotransform, t_fh.RasterXSize, t_fh.RasterYSize )
+        if windows is not None:
+            footprints[i] = (fi.filename, windows)
+    dtype = gdal_array.GDALTypeCodeToNumericTypeCode(
+        t_fh.GetRasterBand(1).DataType )
+
+    tasks = []
+    for blk in block_windows( t_fh.RasterXSize, t_fh.RasterYSize, block ):
+        bx, by, bw, bh = blk
+        sources = {}
+        for i, (filename, windows) in footprints.items():
+            (tw_xoff, tw_yoff, tw_xsize, tw_ysize), sw = windows
+            if tw_xoff < bx + bw and bx < tw_xoff + tw_xsize \
+               and tw_yoff < by + bh and by < tw_yoff + tw_ysize:
+                sources[i] = (filename, windows)
+        if sources:
+            tasks.append( (blk, sources) )
+
+    def write( result ):
+        (bx, by, bw, bh), out = result
+        for b in range(out.shape[0]):
+            t_fh.GetRasterBand(b + 1).WriteArray( out[b], bx, by )
+
+    def base_of( blk ):
+        if not existing:
+            return None
+        return [t_fh.GetRasterBand(b + 1).ReadAsArray( blk[0], blk[1], blk[2], blk[3] )
+                for b in range(len(band_map))]
+
+    if quiet == 0 and verbose == 0:
+        progress( 0.0 )
+    if jobs <= 1:
+        for i, (blk, sources) in enumerate(tasks):
+            write( composite_block( blk, sources, band_map, dtype, nodata,
+                                    method, init, base_of( blk ) ) )
+            if quiet == 0 and verbose == 0:
+                progress( (i + 1) / float(len(tasks)) )
+        return
+
+    with ProcessPoolExecutor( max_workers=jobs ) as pool:
+        pending = []
+        done = 0
+        for blk, sources in tasks:
+            pending.append( pool.submit( composite_block, blk, sources, band_map,
+                                         dtype, nodata, method, init,
+                                         base_of( blk ) ) )
+            # write finished blocks in order, keeping 2 * jobs in flight
+            while len(pending) >= 2 * jobs or (pending and pending[0].done()):
+                write( pending.pop(0).result() )
+                done += 1
+                if quiet == 0 and verbose == 0:
+                    progress( done / float(len(tasks)) )
+        for future in pending:
+            write( future.result() )
+            done += 1
+            if quiet == 0 and verbose == 0:
+                progress( done / float(len(tasks)) )
+
 # =============================================================================
 def Usage():
     print('Usage: gdal_merge.py [-o out_filename] [-of out_format] [-co NAME=VALUE]*')
     print('                     [-ps pixelsize_x pixelsize_y] [-tap] [-separate] [-q] [-v] [-pct]')
     print('                     [-ul_lr ulx uly lrx lry] [-init "value [value...]"]')
     print('                     [-n nodata_value] [-a_nodata output_nodata_value]')
-    print('                     [-ot datatype] [-createonly] input_files')
+    print('                     [-ot datatype] [-createonly]')
+    print('                     [-jobs n] [-composite first|last|mean] [-block size] input_files')
     print('                     [--help-general]')
     print('')
 
@@ -305,6 +522,9 @@ def main( argv=None ):
     band_type = None
     createonly = 0
     bTargetAlignedPixels = False
+    jobs = None
+    composite = None
+    block = 512
     start_time = time.time()
 
     gdal.AllRegister()
@@ -383,6 +603,21 @@ def main( argv=None ):
         elif arg == '-tap':
             bTargetAlignedPixels = True
 
+        elif arg == '-jobs':
+            i = i + 1
+            jobs = int(argv[i])
+
+        elif arg == '-composite':
+            i = i + 1
+            composite = argv[i]
+            if composite not in COMPOSITE_METHODS:
+                print('Unknown composite method: %s' % composite)
+                sys.exit( 1 )
+
+        elif arg == '-block':
+            i = i + 1
+            block = int(argv[i])
+
         elif arg == '-ul_lr':
             ulx = float(argv[i+1])
             uly = float(argv[i+2])
@@ -418,6 +653,14 @@ def main( argv=None ):
     # Collect information on all the source files.
     file_infos = names_to_fileinfos( names )
 
+    # block mode, with worker processes and/or a compositing method
+    block_mode = jobs is not None or composite is not None
+    if block_mode and not create_options and format == 'GTiff':
+        # GTiff tiles are multiples of 16 pixels
+        tile = max(16, (block + 15) // 16 * 16)
+        create_options = TILED_CREATE_OPTIONS + ['BLOCKXSIZE=%d' % tile,
+                                                 'BLOCKYSIZE=%d' % tile]
+
     if ulx is None:
         ulx = file_infos[0].ulx
         uly = file_infos[0].uly
@@ -443,6 +686,7 @@ def main( argv=None ):
     gdal.PopErrorHandler()
 
     # Create output file if it does not already exist.
+    existing = t_fh is not None
     if t_fh is None:
 
         if bTargetAlignedPixels:
@@ -502,6 +746,29 @@ def main( argv=None ):
             for i in range(t_fh.RasterCount):
                 t_fh.GetRasterBand(i+1).Fill( pre_init[0] )
 
+    if block_mode and createonly == 0:
+        # output band -> (input, input band) list, in input order
+        band_map = [[] for b in range(bands)]
+        t_band = 0
+        for i, fi in enumerate(file_infos):
+            if separate == 0:
+                for band in range(1, bands+1):
+                    band_map[band - 1].append( (i, band) )
+            else:
+                for band in range(1, fi.bands+1):
+                    band_map[t_band].append( (i, band) )
+                    t_band = t_band+1
+        if len(pre_init) >= len(band_map):
+            init = pre_init[:len(band_map)]
+        elif len(pre_init) == 1:
+            init = pre_init * len(band_map)
+        else:
+            init = [a_nodata if a_nodata is not None else 0] * len(band_map)
+        merge_blocks( t_fh, file_infos, band_map, nodata, composite or 'last',
+                      init, block, jobs or 1, existing )
+        t_fh = None
+        return
+
     # Copy data from source files into output file.
     t_band = 1
 
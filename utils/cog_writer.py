@@ -0,0 +1,117 @@
+"""
+Cloud-Optimized GeoTIFF style writer for harmonized rasters.
+- Internal square tiling (256 or 512 px blocks) instead of strips, so windowed readers
+  (scene_tiler.WindowedRaster) only decode the blocks they touch
+- DEFLATE/ZSTD/LZW compression with a horizontal (integer) or floating point predictor
+- Internal overviews, so decimated reads (GUI previews, stretch estimation) read a small level
+  instead of the full-resolution scene
+- Overviews are placed before the full-resolution data, as in a COG, by copying a temporary
+  tiled file (rasterio) or an in-memory dataset (GDAL) with COPY_SRC_OVERVIEWS
+"""
+import os
+import numpy as np
+
+try:
+    import rasterio
+    import rasterio.shutil
+    from rasterio.enums import Resampling
+    from rasterio.transform import Affine
+    _HAS_RASTERIO = True
+except Exception:
+    _HAS_RASTERIO = False
+
+BLOCKSIZE = 256
+COMPRESS = 'DEFLATE'
+OVERVIEW_RESAMPLING = 'average'
+
+
+def predictor(dtype):
+    """TIFF predictor for a dtype: 3 (floating point) for floats, 2 (horizontal) otherwise."""
+    return 3 if np.dtype(dtype).kind == 'f' else 2
+
+
+def overview_levels(rows, cols, blocksize=BLOCKSIZE):
+    """Decimation factors 2, 4, 8, ... until the smallest level fits in one block."""
+    levels = []
+    factor = 2
+    while max(rows, cols) / float(factor // 2) > blocksize:
+        levels.append(factor)
+        factor *= 2
+    return levels
+
+
+def creation_options(dtype, blocksize=BLOCKSIZE, compress=COMPRESS):
+    """GTiff creation options of a tiled, compressed output."""
+    options = {'tiled': True,
+               'blockxsize': blocksize,
+               'blockysize': blocksize,
+               'compress': compress.lower(),
+               'interleave': 'pixel',
+               'bigtiff': 'if_safer'}
+    if compress.upper() in ('DEFLATE', 'ZSTD', 'LZW'):
+        options['predictor'] = predictor(dtype)
+    return options
+
+
+def write_cog(path, arr, georef, projection_wkt, blocksize=BLOCKSIZE, compress=COMPRESS, overviews=None):
+    """
+    Write a multi-band array as a tiled, compressed GeoTIFF with internal overviews.
+    inputs:
+    path: output GeoTIFF (str)
+    arr: (rows, cols, bands) array
+    georef: GDAL geotransform (x0, xres, xskew, y0, yskew, yres)
+    projection_wkt: projection as WKT (str)
+    blocksize: internal tile size, 256 or 512 (int)
+    compress: 'DEFLATE', 'ZSTD', 'LZW' or 'NONE' (str)
+    overviews: overview decimation factors, overview_levels(rows, cols) when None, [] for none (list)
+    outputs:
+    path: the written GeoTIFF (str)
+    """
+    rows, cols, bands = arr.shape
+    if overviews is None:
+        overviews = overview_levels(rows, cols, blocksize)
+    if _HAS_RASTERIO:
+        _write_rasterio(path, arr, georef, projection_wkt, blocksize, compress, overviews)
+    else:
+        _write_gdal(path, arr, georef, projection_wkt, blocksize, compress, overviews)
+    return path
+
+
+def _write_rasterio(path, arr, georef, projection_wkt, blocksize, compress, overviews):
+    rows, cols, bands = arr.shape
+    options = creation_options(arr.dtype, blocksize, compress)
+    transform = Affine.from_gdal(*georef)
+    tmp = path + '.tmp.tif'
+    with rasterio.open(tmp, 'w', driver='GTiff', height=rows, width=cols, count=bands,
+                       dtype=arr.dtype, transform=transform, crs=projection_wkt, **options) as dst:
+        dst.write(np.moveaxis(arr, -1, 0))
+        if overviews:
+            dst.build_overviews(overviews, Resampling[OVERVIEW_RESAMPLING])
+            dst.update_tags(ns='rio_overview', resampling=OVERVIEW_RESAMPLING)
+    try:
+        # rewrite with the overviews ahead of the full-resolution blocks
+        rasterio.shutil.copy(tmp, path, driver='GTiff', copy_src_overviews=True, **options)
+    finally:
+        os.remove(tmp)
+
+
+def _write_gdal(path, arr, georef, projection_wkt, blocksize, compress, overviews):
+    from osgeo import gdal, gdal_array
+    rows, cols, bands = arr.shape
+    gdal_type = gdal_array.NumericTypeCodeToGDALTypeCode(arr.dtype)
+    mem = gdal.GetDriverByName('MEM').Create('', cols, rows, bands, gdal_type)
+    mem.SetGeoTransform(tuple(georef))
+    mem.SetProjection(projection_wkt)
+    for i in range(bands):
+        mem.GetRasterBand(i+1).WriteArray(arr[:, :, i])
+    if overviews:
+        mem.BuildOverviews(OVERVIEW_RESAMPLING.upper(), list(overviews))
+    options = creation_options(arr.dtype, blocksize, compress)
+    co = ['TILED=YES', f'BLOCKXSIZE={blocksize}', f'BLOCKYSIZE={blocksize}',
+          f"COMPRESS={compress.upper()}", 'INTERLEAVE=PIXEL', 'BIGTIFF=IF_SAFER', 'COPY_SRC_OVERVIEWS=YES']
+    if 'predictor' in options:
+        co.append(f"PREDICTOR={options['predictor']}")
+    out = gdal.GetDriverByName('GTiff').CreateCopy(path, mem, options=co)
+    out.FlushCache()
+    out = None
+    mem = None
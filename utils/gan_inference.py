@@ -0,0 +1,447 @@
+"""
+In-process pix2pix generator inference, instead of a conda activate + python test.py shell call.
+- The generator is built and its checkpoint loaded once (ShorelineGenerator) and reused for every batch
+- Tiles come from the pix2pix datasets (single / tile_shard) through a torch DataLoader with a
+  configurable batch size and number of workers; test.py is limited to batch_size=1, num_threads=0
+- Decoding overlaps with the forward passes: loader workers (kept alive between runs) decode and
+  prefetch batches, or a background thread does when num_workers is 0; split_threads shares the cores
+  between the workers and torch's intra-op threads
+- Masks come back to the caller as uint8 arrays, or ResultWriter writes <name>_fake.png masks (and, for
+  the shoreline extraction, <name>_real.png inputs) into the same images folder as test.py, from
+  background threads; the HTML index is built once at the end, if at all
+- Like test.py without --eval, the generator runs in train mode (dropout on), but every BatchNorm layer
+  normalizes each tile with its own statistics, as with batch_size=1, so masks do not depend on the batch
+  size; eval=True uses the running statistics instead, as test.py --eval
+"""
+import os
+import sys
+import queue
+import argparse
+import threading
+import collections
+import numpy as np
+
+PIX2PIX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pix2pix_modules')
+CHECKPOINTS_DIR = os.path.join(PIX2PIX_DIR, 'checkpoints')
+
+BATCH_SIZE = 8
+MAX_WORKERS = 4
+PREFETCH_BATCHES = 2
+MAX_LOADERS = 1  # data loaders whose worker processes are kept between runs
+WRITER_THREADS = 4
+OUTPUT_MODES = ['full', 'masks']
+PNG_COMPRESSION = 1  # fast zlib level, binary-looking masks compress well regardless
+
+
+def _pix2pix_path():
+    """pix2pix modules import each other as top-level packages (data, models, options, util)."""
+    if PIX2PIX_DIR not in sys.path:
+        sys.path.insert(0, PIX2PIX_DIR)
+
+
+def test_options(dataroot, **overrides):
+    """pix2pix test options (as parsed by test.py) with the given overrides, e.g. dataset_mode='tile_shard'."""
+    _pix2pix_path()
+    from options.test_options import TestOptions
+    parser = TestOptions().initialize(argparse.ArgumentParser())
+    parser.add_argument('--model_suffix', type=str, default='')
+    opt = parser.parse_args(['--dataroot', dataroot])
+    opt.isTrain = False
+    # test.py defaults for inference
+    opt.serial_batches = True
+    opt.no_flip = True
+    opt.display_id = -1
+    opt.preprocess = 'none'
+    opt.gpu_ids = []
+    for key, value in overrides.items():
+        setattr(opt, key, value)
+    return opt
+
+
+def split_threads(num_workers=None, cpus=None):
+    """
+    Share the cores between data loader workers and torch's intra-op threads.
+    inputs:
+    num_workers: loader worker processes, None picks one per 4 cores beyond the first, up to MAX_WORKERS (int)
+    cpus: cores to share, os.cpu_count() when None (int)
+    outputs:
+    num_workers: loader worker processes (int)
+    threads: torch intra-op threads for the forward passes (int)
+    """
+    cpus = cpus or os.cpu_count() or 1
+    if num_workers is None:
+        num_workers = min(MAX_WORKERS, (cpus - 1) // 4)
+    return int(num_workers), max(1, cpus - int(num_workers))
+
+
+def prefetch(iterable, depth=PREFETCH_BATCHES):
+    """Iterate over iterable in a background thread, up to depth items ahead of the consumer."""
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def producer():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        items.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        pass
+                if stop.is_set():
+                    return
+            items.put(done)
+        except BaseException as e:
+            items.put(e)
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def _per_sample_norm(bn):
+    """Forward of a BatchNorm2d layer in train mode normalizing every sample of the batch on its own."""
+    import torch.nn.functional as F
+
+    def forward(x):
+        return F.instance_norm(x, weight=bn.weight, bias=bn.bias, eps=bn.eps)
+    return forward
+
+
+def backend_options(backend='eager', quantize=None, eval=False):
+    """
+    ShorelineGenerator options of a pipeline run: the optimized backends fold BatchNorm with its running
+    statistics, so any backend other than eager or any quantization runs the generator in eval mode.
+    Their masks then follow the eval generator rather than the default train-mode one, see
+    scripts/benchmark_generator_backends.py for how far the two are apart.
+    """
+    return {'eval': bool(eval or backend != 'eager' or quantize), 'backend': backend, 'quantize': quantize}
+
+
+def load_generator(model_name, epoch='latest', checkpoints_dir=CHECKPOINTS_DIR, netG='unet_256',
+                   norm='batch', input_nc=3, output_nc=1, ngf=64, no_dropout=False, model_suffix='',
+                   device='cpu'):
+    """Build define_G and load <checkpoints_dir>/<model_name>/<epoch>_net_G<model_suffix>.pth into it."""
+    _pix2pix_path()
+    import torch
+    from models import networks
+    net = networks.define_G(input_nc, output_nc, ngf, netG, norm, not no_dropout, 'normal', 0.02, [])
+    path = os.path.join(checkpoints_dir, model_name, '%s_net_G%s.pth' % (epoch, model_suffix))
+    state_dict = torch.load(path, map_location=str(device), weights_only=True)
+    if hasattr(state_dict, '_metadata'):
+        del state_dict._metadata
+    # InstanceNorm checkpoints prior to pytorch 0.4 carry running stats the layers do not have
+    modules = dict(net.named_modules())
+    for key in list(state_dict.keys()):
+        module_name, _, attr = key.rpartition('.')
+        module = modules.get(module_name)
+        if module is not None and module.__class__.__name__.startswith('InstanceNorm') and \
+                attr in ('running_mean', 'running_var', 'num_batches_tracked') and getattr(module, attr, None) is None:
+            state_dict.pop(key)
+    net.load_state_dict(state_dict)
+    return net.to(device)
+
+
+class ShorelineGenerator():
+    """A loaded pix2pix generator that turns batches of normalized tiles into masks.
+
+    gen = ShorelineGenerator('shoreline_gan_nov')
+    for paths, masks in gen.run(source): ...
+
+    With eval=True, backend ('torchscript', 'onnx') and quantize ('static' with calibration batches, or
+    'dynamic' for onnx) select a faster CPU version of the generator (utils/generator_backend.py).
+    """
+
+    def __init__(self, model_name, epoch='latest', checkpoints_dir=CHECKPOINTS_DIR, netG='unet_256',
+                 norm='batch', input_nc=3, output_nc=1, ngf=64, no_dropout=False, model_suffix='',
+                 eval=False, device=None, backend='eager', quantize=None, calibration=None):
+        import torch
+        if device is None:
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.device = torch.device(device)
+        self.model_name = model_name
+        self.epoch = epoch
+        self.input_nc = input_nc
+        self.output_nc = output_nc
+        self.arch = netG
+        self.ngf = ngf
+        self.netG = load_generator(model_name, epoch, checkpoints_dir, netG, norm, input_nc, output_nc, ngf,
+                                   no_dropout, model_suffix, self.device)
+        self._loaders = collections.OrderedDict()
+        if eval:
+            self.netG.eval()
+        else:
+            self.netG.train()
+            for module in self.netG.modules():
+                if isinstance(module, torch.nn.BatchNorm2d):
+                    module.forward = _per_sample_norm(module)
+        if backend != 'eager' or quantize:
+            # BatchNorm folded, traced / exported and optionally int8, see utils/generator_backend.py
+            if not eval:
+                raise ValueError('optimized backends need eval=True, train-mode BatchNorm and dropout '
+                                 'cannot be folded or quantized')
+            from utils import generator_backend
+            example = calibration[0][:1] if calibration else torch.zeros(1, input_nc, 256, 256)
+            self.netG = generator_backend.compile_generator(self.netG.cpu(), backend, quantize, calibration,
+                                                            example)
+            self.device = torch.device('cpu')
+
+    def predict(self, batch):
+        """
+        Generator outputs of a batch.
+        inputs:
+        batch: (n, input_nc, rows, cols) tensor in [-1, 1]
+        outputs:
+        fake: (n, output_nc, rows, cols) tensor in [-1, 1], on the CPU
+        """
+        import torch
+        with torch.no_grad():
+            return self.netG(batch.to(self.device, non_blocking=True)).cpu()
+
+    def dataloader(self, source, dataset_mode='single', tile_manifest=None, batch_size=BATCH_SIZE,
+                   num_workers=0):
+        """
+        DataLoader over the tiles of a folder (single) or of its tile shards (tile_shard).
+        Loaders with workers are kept, so later runs over the same tiles reuse the worker processes;
+        at most MAX_LOADERS of them, the least recently used one is shut down first.
+        """
+        import torch
+        _pix2pix_path()
+        from data import find_dataset_using_name, loader_kwargs
+        # a folder's mtime changes when tiles are added or removed, which calls for a new dataset
+        stamp = [os.stat(p).st_mtime_ns for p in (source, tile_manifest) if p and os.path.exists(p)]
+        key = (source, dataset_mode, tile_manifest, batch_size, num_workers, tuple(stamp))
+        if key in self._loaders:
+            self._loaders.move_to_end(key)
+            return self._loaders[key]
+        opt = test_options(source, dataset_mode=dataset_mode, input_nc=self.input_nc,
+                           output_nc=self.output_nc, tile_manifest=tile_manifest or '',
+                           batch_size=batch_size, num_threads=num_workers)
+        dataset = find_dataset_using_name(dataset_mode)(opt)
+        loader = torch.utils.data.DataLoader(dataset, batch_size=batch_size, shuffle=False,
+                                             **loader_kwargs(num_workers, pin_memory=self.device.type == 'cuda',
+                                                             prefetch_factor=PREFETCH_BATCHES,
+                                                             persistent_workers=True))
+        if num_workers > 0:
+            while len(self._loaders) >= MAX_LOADERS:
+                _shutdown_loader(self._loaders.popitem(last=False)[1])
+            self._loaders[key] = loader
+        return loader
+
+    def run(self, source, dataset_mode='single', tile_manifest=None, batch_size=BATCH_SIZE, num_workers=None,
+            max_tiles=float('inf'), with_inputs=False):
+        """
+        Yield (paths, masks) per batch, or (paths, masks, inputs) with with_inputs=True.
+        num_workers: loader worker processes, see split_threads; with 0 a background thread decodes ahead
+        paths: A_paths of the tiles (list)
+        masks: (n, rows, cols) uint8 masks, or (n, rows, cols, output_nc) for output_nc > 1
+        inputs: the (n, input_nc, rows, cols) input tensors
+        """
+        import torch
+        num_workers, threads = split_threads(num_workers)
+        # torch's thread count is process wide, it is set back when the run ends
+        previous_threads = torch.get_num_threads()
+        if self.device.type == 'cpu':
+            torch.set_num_threads(threads)
+        batches = None
+        n = 0
+        try:
+            loader = self.dataloader(source, dataset_mode, tile_manifest, batch_size, num_workers)
+            batches = iter(loader) if num_workers > 0 else prefetch(loader)
+            for data in batches:
+                if n >= max_tiles:
+                    break
+                real = data['A'][:int(min(len(data['A']), max_tiles - n))]
+                paths = list(data['A_paths'][:len(real)])
+                masks = to_uint8(self.predict(real))
+                n += len(real)
+                yield (paths, masks, real) if with_inputs else (paths, masks)
+        finally:
+            if hasattr(batches, 'close'):
+                batches.close()
+            torch.set_num_threads(previous_threads)
+
+    def close(self):
+        """Shut down the kept loader workers."""
+        while self._loaders:
+            _shutdown_loader(self._loaders.popitem()[1])
+
+
+def _shutdown_loader(loader):
+    """Stop the persistent worker processes of a DataLoader now rather than when it is collected."""
+    iterator = getattr(loader, '_iterator', None)
+    if iterator is not None and hasattr(iterator, '_shutdown_workers'):
+        iterator._shutdown_workers()
+    loader._iterator = None
+
+
+def tiles_to_batch(tiles):
+    """
+    (n, rows, cols, bands) tiles -> (n, bands, rows, cols) float tensor in [-1, 1], normalized as the
+    pix2pix datasets do: uint8 tiles as ToTensor + Normalize(0.5, 0.5), float tiles in [0, 1] as tile shards.
+    """
+    import torch
+    tiles = np.asarray(tiles)
+    if tiles.dtype == np.uint8:
+        batch = tiles.astype(np.float32) / 255.0
+    else:
+        batch = tiles.astype(np.float32, copy=False)
+    return torch.from_numpy(np.ascontiguousarray(batch.transpose(0, 3, 1, 2))) * 2 - 1
+
+
+def to_uint8(t):
+    """(n, c, rows, cols) tensor in [-1, 1] -> uint8 array, (n, rows, cols) for c == 1 (as tensor2im)."""
+    arr = (np.transpose(t.numpy(), (0, 2, 3, 1)) + 1) / 2.0 * 255.0
+    arr = arr.astype(np.uint8)
+    return arr[..., 0] if arr.shape[-1] == 1 else arr
+
+
+def results_folder(results_dir, model_name, epoch='latest'):
+    """Images folder test.py writes to: <results_dir>/<model_name>/test_<epoch>/images"""
+    return os.path.join(results_dir, model_name, 'test_%s' % epoch, 'images')
+
+
+def save_results(folder, paths, masks, inputs=None, compression=PNG_COMPRESSION):
+    """
+    Write <name>_fake.png masks (and <name>_real.png inputs when given) as test.py does.
+    Single-band masks are written as grayscale PNGs, like util.save_image.
+    outputs:
+    names: the tile names written (list)
+    """
+    import cv2
+    os.makedirs(folder, exist_ok=True)
+    params = [cv2.IMWRITE_PNG_COMPRESSION, compression]
+    names = []
+    for i, path in enumerate(paths):
+        name = os.path.splitext(os.path.basename(path))[0]
+        mask = masks[i]
+        if mask.ndim == 3:
+            mask = np.ascontiguousarray(mask[:, :, ::-1])
+        cv2.imwrite(os.path.join(folder, name + '_fake.png'), mask, params)
+        if inputs is not None:
+            # input tensors in [-1, 1], or the uint8 (rows, cols, bands) tiles themselves
+            real = inputs[i][:, :, :3] if isinstance(inputs, np.ndarray) else to_uint8(inputs[i:i + 1, :3])[0]
+            if real.ndim == 2:
+                real = np.repeat(real[:, :, np.newaxis], 3, axis=2)
+            cv2.imwrite(os.path.join(folder, name + '_real.png'), np.ascontiguousarray(real[:, :, ::-1]), params)
+        names.append(name)
+    return names
+
+
+def write_index(folder, names, output='full', width=256):
+    """Build the test.py HTML page (<folder>/../index.html) of the written results in one go."""
+    _pix2pix_path()
+    from util import html
+    web_dir = os.path.dirname(folder)
+    page = html.HTML(web_dir, 'Experiment = %s' % os.path.basename(os.path.dirname(web_dir)))
+    labels = ['real', 'fake'] if output == 'full' else ['fake']
+    for name in names:
+        page.add_header(name)
+        ims = ['%s_%s.png' % (name, label) for label in labels]
+        page.add_images(ims, labels, ims, width=width)
+    page.save()
+    return os.path.join(web_dir, 'index.html')
+
+
+class ResultWriter():
+    """Writes result batches from a pool of background threads, so the forward passes do not wait on
+    PNG encoding or the disk (OpenCV encodes and writes without holding the GIL).
+
+    with ResultWriter(folder, output='masks') as writer:
+        for paths, masks in gen.run(source):
+            writer.submit(paths, masks)
+
+    output: 'full' writes the masks and the inputs (<name>_real.png, needed by
+            shoreline_extraction_utils.extract_shorelines), 'masks' only the masks
+    max_pending: batches queued at most before submit waits, which bounds the memory held by the queue
+    html: build the HTML index once, when the writer is closed
+    """
+
+    def __init__(self, folder, output='full', threads=None, max_pending=None, html=False,
+                 compression=PNG_COMPRESSION):
+        from concurrent.futures import ThreadPoolExecutor
+        if output not in OUTPUT_MODES:
+            raise ValueError(f"output must be one of {OUTPUT_MODES}, got {output}")
+        self.folder = folder
+        self.output = output
+        self.html = html
+        self.compression = compression
+        threads = threads or min(WRITER_THREADS, os.cpu_count() or 1)
+        self._pool = ThreadPoolExecutor(max_workers=threads)
+        self._slots = threading.BoundedSemaphore(max_pending or 2 * threads)
+        self._futures = []
+        os.makedirs(folder, exist_ok=True)
+
+    def submit(self, paths, masks, inputs=None):
+        """Queue a batch; inputs are only written with output='full'."""
+        self._slots.acquire()
+        future = self._pool.submit(save_results, self.folder, paths, masks,
+                                   inputs if self.output == 'full' else None, self.compression)
+        future.add_done_callback(lambda f: self._slots.release())
+        self._futures.append(future)
+
+    def close(self):
+        """
+        Wait for the queued batches and build the HTML index if asked for.
+        outputs:
+        names: the tile names written, in submission order (list)
+        """
+        self._pool.shutdown(wait=True)
+        names = []
+        for future in self._futures:
+            names.extend(future.result())
+        if self.html:
+            write_index(self.folder, names, self.output)
+        return names
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._pool.shutdown(wait=True)
+        return False
+
+
+def infer(source, model_name, epoch='latest', results_dir=None, dataset_mode='single', tile_manifest=None,
+          batch_size=BATCH_SIZE, num_workers=None, input_nc=3, max_tiles=float('inf'), generator=None,
+          output='full', html=False, **kwargs):
+    """
+    Run a generator over the tiles of source.
+    inputs:
+    source: tile folder, or folder of tile shards (str)
+    results_dir: write the results like test.py under <results_dir>/<model_name>/test_<epoch>/images,
+                 or None to only return the masks (str)
+    generator: a loaded ShorelineGenerator to reuse, built from the other arguments when None
+    output: 'full' writes masks and inputs, 'masks' only the masks (see ResultWriter) (str)
+    html: also build test.py's HTML index of the results (bool)
+    kwargs: further ShorelineGenerator arguments (netG, norm, eval, device, ...)
+    outputs:
+    results: the images folder when results_dir is given (str), otherwise {tile path: mask} (dict)
+    """
+    if generator is None:
+        generator = ShorelineGenerator(model_name, epoch, input_nc=input_nc, **kwargs)
+    batches = generator.run(source, dataset_mode, tile_manifest, batch_size, num_workers, max_tiles,
+                            with_inputs=True)
+    if results_dir is None:
+        masks = {}
+        for paths, batch_masks, _ in batches:
+            masks.update(zip(paths, batch_masks))
+        return masks
+    folder = results_folder(results_dir, model_name, epoch)
+    with ResultWriter(folder, output, html=html) as writer:
+        for paths, batch_masks, inputs in batches:
+            writer.submit(paths, batch_masks, inputs)
+    return folder
@@ -1,54 +1,67 @@
 import os
 import glob
 from utils import shoreline_extraction_utils
+from utils import tile_triage
+from utils import tile_shards
+from utils import gan_inference
+from utils import inference_service
     
 def run_model(site,
               source,
               model_name,
               epoch,
               outputs_dir,
-              num_images):
+              num_images,
+              tile_manifest=None,
+              dataset_mode='single',
+              input_nc=3,
+              batch_size=gan_inference.BATCH_SIZE,
+              num_workers=None,
+              generator=None,
+              output='full',
+              service=None,
+              backend='eager',
+              quantize=None,
+              eval=False):
     """
-    Runs trained pix2pix or cycle-GAN shoreline models
+    Runs trained pix2pix or cycle-GAN shoreline models in this process (utils/gan_inference.py)
     inputs:
     site: name for site (str)
     source: folder with images to run on (str)
     outputs_dir: folder to save outputs to (str, ex : r'./outputs'
     num_images: number of images in source folder (int)
+    tile_manifest: tile triage manifest, only tiles marked for inference are run (str, optional)
+    dataset_mode: 'single' for tile images, 'tile_shard' for tile shards (utils/tile_shards.py) (str)
+    input_nc: generator input channels, e.g. 5 for multispectral float32 shards (int)
+    batch_size: tiles per forward pass (int)
+    num_workers: data loader worker processes, None to size them to the cores (gan_inference.split_threads) (int)
+    generator: an already loaded gan_inference.ShorelineGenerator to reuse (optional)
+    output: 'full' also writes the <name>_real.png inputs the shoreline extraction reads,
+            'masks' only the <name>_fake.png masks (str)
+    service: address of a warm inference service (utils/inference_service.py) to run the generator in,
+             started in the background if none answers there (str, e.g. '127.0.0.1:8765')
+    backend, quantize: optimized CPU generator ('torchscript' / 'onnx', 'dynamic' int8 for onnx), these run
+                       the generator in eval mode, see gan_inference.backend_options (str)
+    eval: use the BatchNorm running statistics instead of the per-tile ones (bool)
     outputs:
     save_folder: directory where generated images are saved (str)
     """
-    root = os.getcwd()
-    pix2pix_detect = os.path.join(root, 'pix2pix_modules', 'test.py')
     results_dir = os.path.join(outputs_dir, 'gan', site)
-    try:
-        os.mkdir(results_dir)
-    except:
-        pass
-    cmd0 = 'conda deactivate & conda activate pix2pix_shoreline & '
-    cmd1 = 'python ' + pix2pix_detect
-    cmd2 = ' --dataroot ' + source
-    cmd3 = ' --model test'
-    cmd4 = ' --name ' + model_name ##change this as input
-    cmd5 = ' --netG unet_256'
-    cmd6 = ' --netD basic'
-    cmd7 = ' --dataset_mode single'
-    cmd8 = ' --norm batch'
-    cmd9 = ' --num_test ' + str(num_images)
-    cmd10 = ' --preprocess none'
-    cmd11 = ' --input_nc 3'
-    cmd12 = ' --output_nc 1'
-    cmd13 = ' --results_dir ' + results_dir
-    cmd14 = ' --checkpoints_dir ' + os.path.join(root, 'pix2pix_modules', 'checkpoints')
-    cmd15 = ' --epoch ' + epoch
-    full_cmd = cmd0+cmd1+cmd2+cmd3+cmd4+cmd5+cmd6+cmd7+cmd8+cmd9+cmd10+cmd11+cmd13+cmd12+cmd13+cmd14+cmd15
-    os.system(full_cmd)
-    save_folder = os.path.join(results_dir,model_name, 'test_latest', 'images') ##change this is input
+    os.makedirs(results_dir, exist_ok=True)
+    options = gan_inference.backend_options(backend, quantize, eval)
+    if service is not None and generator is None:
+        with inference_service.connect(service, start=True) as client:
+            return inference_service.infer_folder(client, source, model_name, epoch, results_dir, dataset_mode,
+                                                  tile_manifest, input_nc, max_tiles=num_images, output=output,
+                                                  **options)
+    if generator is None:
+        generator = gan_inference.ShorelineGenerator(model_name, epoch, input_nc=input_nc, **options)
+    save_folder = gan_inference.infer(source, model_name, epoch, results_dir, dataset_mode, tile_manifest,
+                                      batch_size, num_workers, input_nc, max_tiles=num_images,
+                                      generator=generator, output=output)
     return save_folder
 
 
-
-
 def run_and_process(site,
                     source,
                     model_name,
@@ -57,7 +70,13 @@ def run_and_process(site,
                     reference_shoreline=None,
                     reference_region=None,
                     distance_threshold=250,
-                    clip_length=150):
+                    clip_length=150,
+                    batch_size=gan_inference.BATCH_SIZE,
+                    num_workers=None,
+                    service=None,
+                    backend='eager',
+                    quantize=None,
+                    eval=False):
     """
     Runs trained pix2pix or cycle-GAN model,
     then runs outputs through marching squares to extract shorelines,
@@ -67,6 +86,9 @@ def run_and_process(site,
     source: directory with images to run model on (str)
     model_name: name for trained model (str)
     coords_file: path to the csv containing metadata on images (str)
+    batch_size, num_workers: batched inference settings, see run_model
+    service: run the generator in a warm inference service at this address, see run_model
+    backend, quantize, eval: generator options, see run_model
     """
     root = os.getcwd()
     outputs_dir = os.path.join(root, 'model_outputs')
@@ -78,9 +100,25 @@ def run_and_process(site,
             os.mkdir(dir)
         except:
             pass
-    num_images = len(glob.glob(source+'\*.jpeg'))
+    num_images = len(glob.glob(os.path.join(source, '*.jpeg')))
+    # read memory-mapped tile shards instead of image files when the scenes were sharded
+    shards = tile_shards.find_shards(source)
+    dataset_mode = 'tile_shard' if shards else 'single'
+    input_nc = 3
+    if shards:
+        num_images = sum(len(tile_shards.TileShard(s)) for s in shards)
+        # multispectral float32 shards feed all their bands to the generator
+        input_nc = tile_shards.TileShard(shards[0]).tiles.shape[-1]
+    # skip the tiles the triage pass marked as nodata / all land / all water
+    tile_manifest = tile_triage.manifest_path(source)
+    if os.path.exists(tile_manifest):
+        num_images = len(tile_triage.tiles_to_infer(tile_manifest))
+    else:
+        tile_manifest = None
     print('Running GAN')
-    gan_results = run_model(site, source, model_name, epoch, outputs_dir, num_images)
+    gan_results = run_model(site, source, model_name, epoch, outputs_dir, num_images, tile_manifest,
+                            dataset_mode, input_nc, batch_size, num_workers, service=service,
+                            backend=backend, quantize=quantize, eval=eval)
     print('GAN finished')
     print('Extracting Shorelines')
     shoreline_extraction_utils.process(gan_results,
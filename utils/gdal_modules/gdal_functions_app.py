@@ -158,15 +158,17 @@ def mergeShapes(folder, outShape):
 def delete_empty_images(path_to_folder):
     """
     deletes geotiffs that are all zeros, good for cleaning up tiling results
+    for pix2pix tiles, utils/tile_triage.py writes a tile manifest instead of deleting files
     inputs:
     path_to_folder (str): filepath to the folder with images that you want to delete
     """
+    driver = gdal.GetDriverByName('GTiff')
     for image in glob.glob(path_to_folder + '/*.tif'):
         array = gdal_open(image)[0]
         no_data = len(np.unique(array))
-        if no_data < 5:
-            cmd = 'gdalmanage delete ' + image
-            os.system(cmd)
         array = None
+        if no_data < 5:
+            # same as gdalmanage delete, without a subprocess per file
+            driver.Delete(image)
           
     
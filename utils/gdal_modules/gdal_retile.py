@@ -31,6 +31,8 @@
 
 import os
 import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 from osgeo import gdal
 from osgeo import ogr
@@ -71,32 +73,28 @@ class AffineTransformDecorator(object):
 
 
 class DataSetCache(object):
-    """ A class for caching source tiles """
+    """ A class for caching source tiles, closing the least recently used dataset first """
 
-    def __init__(self):
-        self.cacheSize = 8
-        self.queue = []
-        self.dict = {}
+    def __init__(self, cacheSize=None):
+        self.cacheSize = CacheSize if cacheSize is None else cacheSize
+        self.dict = OrderedDict()
 
     def get(self, name):
 
         if name in self.dict:
+            self.dict.move_to_end(name)
             return self.dict[name]
         result = gdal.Open(name)
         if result is None:
-            print("Error opening: %s" % NameError)
+            print("Error opening: %s" % name)
             sys.exit(1)
-        if len(self.queue) == self.cacheSize:
-            toRemove = self.queue.pop(0)
-            del self.dict[toRemove]
-        self.queue.append(name)
+        if len(self.dict) >= self.cacheSize:
+            self.dict.popitem(last=False)
         self.dict[name] = result
         return result
 
     def __del__(self):
-        for dataset in self.dict.values():
-            del dataset
-        del self.queue
+        self.dict.clear()
         del self.dict
 
 
@@ -331,16 +329,9 @@ def tileImage(minfo, ti):
     LastRowIndx = -1
     OGRDS = createTileIndex("TileResult_0", TileIndexFieldName, Source_SRS, TileIndexDriverTyp)
 
-    yRange = list(range(1, ti.countTilesY + 1))
-    xRange = list(range(1, ti.countTilesX + 1))
-
-    if not Quiet and not Verbose:
-        progress(0.0)
-        processed = 0
-        total = len(xRange) * len(yRange)
-
-    for yIndex in yRange:
-        for xIndex in xRange:
+    specs = []
+    for yIndex in range(1, ti.countTilesY + 1):
+        for xIndex in range(1, ti.countTilesX + 1):
             offsetY = (yIndex - 1) * (ti.tileHeight - ti.overlap)
             offsetX = (xIndex - 1) * (ti.tileWidth - ti.overlap)
             height = ti.tileHeight
@@ -354,12 +345,9 @@ def tileImage(minfo, ti):
                 width = ti.width - offsetX
             if offsetY + height > ti.height:
                 height = ti.height - offsetY
+            specs.append((offsetX, offsetY, width, height, tilename))
 
-            createTile(minfo, offsetX, offsetY, width, height, tilename, OGRDS)
-
-            if not Quiet and not Verbose:
-                processed += 1
-                progress(processed / float(total))
+    createTiles(minfo, specs, OGRDS, 0)
 
     if TileIndexName is not None:
         if UseDirForEachRow and not PyramidOnly:
@@ -378,6 +366,115 @@ def tileImage(minfo, ti):
     return OGRDS
 
 
+def createTiles(minfo, specs, OGRDS, level):
+    """
+
+    Create the tiles (offsetX, offsetY, width, height, tilename) of specs, level 0 tiles
+    from the source mosaic, level > 0 from the level below, and add them to OGRDS.
+    With Jobs > 1 contiguous ranges of tiles are written by worker processes, each
+    with its own source dataset handles.
+
+    """
+
+    create = createTile if level == 0 else createPyramidTile
+    if Jobs <= 1 or len(specs) < 2:
+        if not Quiet and not Verbose:
+            progress(0.0)
+        for i, (offsetX, offsetY, width, height, tilename) in enumerate(specs):
+            create(minfo, offsetX, offsetY, width, height, tilename, OGRDS)
+            if not Quiet and not Verbose:
+                progress((i + 1) / float(len(specs)))
+        return
+
+    features = getIndexFeatures(minfo.ogrTileIndexDS)
+    countChunks = min(len(specs), Jobs * 4)
+    chunkSize = (len(specs) + countChunks - 1) // countChunks
+    chunks = [specs[i:i + chunkSize] for i in range(0, len(specs), chunkSize)]
+    settings = getSettings()
+    if not Quiet and not Verbose:
+        progress(0.0)
+    with ProcessPoolExecutor(max_workers=Jobs) as pool:
+        futures = [pool.submit(createTilesWorker, settings, minfo.filename, features, chunk, level)
+                   for chunk in chunks]
+        # add the created tiles to the index in tile order
+        for i, future in enumerate(futures):
+            for location, xlist, ylist in future.result():
+                addFeature(OGRDS, location, xlist, ylist)
+            if not Quiet and not Verbose:
+                progress((i + 1) / float(len(futures)))
+
+
+def createTilesWorker(settings, filename, features, specs, level):
+    """ Worker process side of createTiles, returns the index features of the created tiles """
+
+    setSettings(settings)
+    minfo = mosaic_info(filename, createTileIndexFromFeatures(features))
+    OGRDS = createTileIndex("TileResult_worker", TileIndexFieldName, Source_SRS, "Memory")
+    create = createTile if level == 0 else createPyramidTile
+    for offsetX, offsetY, width, height, tilename in specs:
+        create(minfo, offsetX, offsetY, width, height, tilename, OGRDS)
+    result = getIndexFeatures(OGRDS)
+    closeTileIndex(OGRDS)
+    return result
+
+
+def getIndexFeatures(OGRDS):
+    """ (location, xlist, ylist) of every feature of a tile index """
+
+    features = []
+    OGRDS.GetLayer().ResetReading()
+    while True:
+        feature = OGRDS.GetLayer().GetNextFeature()
+        if feature is None:
+            break
+        minx, maxx, miny, maxy = feature.GetGeometryRef().GetEnvelope()
+        features.append((feature.GetField(0), [minx, maxx, maxx, minx], [maxy, maxy, miny, miny]))
+    OGRDS.GetLayer().ResetReading()
+    return features
+
+
+def createTileIndexFromFeatures(features):
+    """ Memory tile index from getIndexFeatures output, without opening the tiles """
+
+    OGRDS = createTileIndex("TileIndex", TileIndexFieldName, None, "Memory")
+    for location, xlist, ylist in features:
+        addFeature(OGRDS, location, xlist, ylist)
+    return OGRDS
+
+
+def getSettings():
+    """ Module settings a worker process needs to create tiles like this process """
+
+    return {'Verbose': Verbose, 'Quiet': True, 'CreateOptions': CreateOptions, 'Format': Format,
+            'BandType': BandType, 'TileIndexFieldName': TileIndexFieldName, 'TargetDir': TargetDir,
+            'Source_SRS': Source_SRS.ExportToWkt() if Source_SRS is not None else None,
+            'ResamplingMethod': ResamplingMethod, 'CacheSize': CacheSize}
+
+
+def setSettings(settings):
+    global Verbose, Quiet, CreateOptions, Format, BandType, TileIndexFieldName, TargetDir
+    global Source_SRS, ResamplingMethod, CacheSize, Driver, MemDriver, Jobs
+
+    Verbose = settings['Verbose']
+    Quiet = settings['Quiet']
+    CreateOptions = settings['CreateOptions']
+    Format = settings['Format']
+    BandType = settings['BandType']
+    TileIndexFieldName = settings['TileIndexFieldName']
+    TargetDir = settings['TargetDir']
+    ResamplingMethod = settings['ResamplingMethod']
+    CacheSize = settings['CacheSize']
+    Jobs = 1
+    Source_SRS = None
+    if settings['Source_SRS']:
+        Source_SRS = osr.SpatialReference()
+        Source_SRS.SetFromUserInput(settings['Source_SRS'])
+    Driver = gdal.GetDriverByName(Format)
+    MemDriver = None
+    if 'DCAP_CREATE' not in Driver.GetMetadata():
+        MemDriver = gdal.GetDriverByName("MEM")
+
+
 def copyTileIndexToDisk(OGRDS, fileName):
     SHAPEDS = createTileIndex(fileName, TileIndexFieldName, OGRDS.GetLayer().GetSpatialRef(), "ESRI Shapefile")
     OGRDS.GetLayer().ResetReading()
@@ -630,6 +727,7 @@ def buildPyramidLevel(levelMosaicInfo, levelOutputTileInfo, level):
 
     OGRDS = createTileIndex("TileResult_" + str(level), TileIndexFieldName, Source_SRS, TileIndexDriverTyp)
 
+    specs = []
     for yIndex in yRange:
         for xIndex in xRange:
             offsetY = (yIndex - 1) * (levelOutputTileInfo.tileHeight - levelOutputTileInfo.overlap)
@@ -643,7 +741,9 @@ def buildPyramidLevel(levelMosaicInfo, levelOutputTileInfo, level):
                 height = levelOutputTileInfo.height - offsetY
 
             tilename = getTileName(levelMosaicInfo, levelOutputTileInfo, xIndex, yIndex, level)
-            createPyramidTile(levelMosaicInfo, offsetX, offsetY, width, height, tilename, OGRDS)
+            specs.append((offsetX, offsetY, width, height, tilename))
+
+    createTiles(levelMosaicInfo, specs, OGRDS, level)
 
     if TileIndexName is not None:
         shapeName = getTargetDir(level) + TileIndexName
@@ -835,6 +935,8 @@ def initGlobals():
     global PyramidOnly
     global LastRowIndx
     global UseDirForEachRow
+    global CacheSize
+    global Jobs
 
     Verbose = False
     CreateOptions = []
@@ -860,6 +962,8 @@ def initGlobals():
     PyramidOnly = False
     LastRowIndx = -1
     UseDirForEachRow = False
+    CacheSize = 64
+    Jobs = 1
 
 
 # global vars
@@ -887,6 +991,7 @@ Levels = 0
 PyramidOnly = False
 LastRowIndx = -1
 UseDirForEachRow = False
-
-
-
+# number of open source datasets kept per process
+CacheSize = 64
+# worker processes for tileImage / buildPyramid, 1 creates tiles in this process
+Jobs = 1
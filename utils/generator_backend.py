@@ -0,0 +1,217 @@
+"""
+Faster CPU backends for the pix2pix UnetGenerator, for inference nodes without a GPU.
+- fold_batchnorm folds every eval-mode BatchNorm into the convolution / transposed convolution before it,
+  so the normalization costs nothing at inference time
+- 'torchscript' runs the traced and frozen generator, 'onnx' exports it and runs it with ONNX Runtime
+  (optional dependency, pip install onnx onnxruntime)
+- int8: 'static' quantizes weights and activations with calibration batches (FX graph mode, fbgemm/x86
+  kernels, torch backends), 'dynamic' quantizes the weights of the ONNX model (onnx backend)
+- benchmark reports tiles/sec of a compiled generator and the IoU of its masks with the eager fp32 model,
+  and with the default train-mode generator the pipeline runs without a backend
+All of this needs the generator in eval mode (ShorelineGenerator(eval=True), test.py --eval): train-mode
+BatchNorm and dropout cannot be folded or calibrated.
+"""
+import os
+import copy
+import time
+import tempfile
+import numpy as np
+
+BACKENDS = ['eager', 'torchscript', 'onnx']
+QUANTIZATION = [None, 'static', 'dynamic']
+
+# shoreline_extraction_utils.extract_shorelines keeps mask pixels above 250 as water
+MASK_THRESHOLD = 250
+
+
+def fold_conv_bn(conv, bn):
+    """A copy of conv (Conv2d or ConvTranspose2d) with the eval-mode BatchNorm bn after it folded in."""
+    import torch
+    fused = copy.deepcopy(conv)
+    scale = bn.weight.detach() / torch.sqrt(bn.running_var + bn.eps)
+    bias = conv.bias.detach() if conv.bias is not None else torch.zeros_like(bn.running_mean)
+    # output channels are dim 0 of a Conv2d weight, dim 1 of a ConvTranspose2d weight
+    shape = [1, -1, 1, 1] if isinstance(conv, torch.nn.ConvTranspose2d) else [-1, 1, 1, 1]
+    with torch.no_grad():
+        fused.weight.copy_(conv.weight * scale.reshape(shape))
+        fused.bias = torch.nn.Parameter((bias - bn.running_mean) * scale + bn.bias.detach())
+    return fused
+
+
+def fold_batchnorm(net):
+    """
+    Copy of a generator with every conv -> BatchNorm pair of its nn.Sequential blocks folded into one conv.
+    inputs:
+    net: generator in eval mode (nn.Module)
+    outputs:
+    folded: the folded copy, in eval mode (nn.Module)
+    """
+    import torch
+    if net.training:
+        raise ValueError('BatchNorm can only be folded in eval mode')
+    folded = copy.deepcopy(net).eval()
+    for module in folded.modules():
+        if not isinstance(module, torch.nn.Sequential):
+            continue
+        for i in range(len(module) - 1):
+            conv, bn = module[i], module[i + 1]
+            if isinstance(conv, (torch.nn.Conv2d, torch.nn.ConvTranspose2d)) and \
+                    type(bn) is torch.nn.BatchNorm2d and bn.track_running_stats:
+                module[i] = fold_conv_bn(conv, bn)
+                module[i + 1] = torch.nn.Identity()
+    return folded
+
+
+def quantize_static(net, calibration):
+    """
+    int8 generator (FX graph mode, x86 kernels) with activation ranges observed on calibration batches.
+    inputs:
+    net: generator in eval mode (nn.Module)
+    calibration: (n, input_nc, rows, cols) tensors in [-1, 1], a few representative tile batches (list)
+    """
+    import torch
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+    net = copy.deepcopy(net).eval()
+    for module in net.modules():
+        # quantized activations are not computed in place
+        if isinstance(module, (torch.nn.ReLU, torch.nn.LeakyReLU)):
+            module.inplace = False
+    torch.backends.quantized.engine = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'fbgemm'
+    prepared = prepare_fx(net, get_default_qconfig_mapping(torch.backends.quantized.engine), (calibration[0],))
+    with torch.no_grad():
+        for batch in calibration:
+            prepared(batch)
+    return convert_fx(prepared)
+
+
+class OnnxGenerator():
+    """A generator exported to ONNX and run by ONNX Runtime, called like the torch module: tensor -> tensor."""
+
+    def __init__(self, path, threads=None):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = int(threads)
+        self.path = path
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        import torch
+        feed = {self.input_name: np.ascontiguousarray(batch.cpu().numpy(), dtype=np.float32)}
+        return torch.from_numpy(self.session.run(None, feed)[0])
+
+
+def export_onnx(net, example, path, quantize=None):
+    """Export a generator to path (.onnx), with dynamic batch and tile size; quantize='dynamic' for int8 weights."""
+    import torch
+    torch.onnx.export(net, (example,), path, input_names=['input'], output_names=['output'],
+                      dynamic_axes={'input': {0: 'n', 2: 'rows', 3: 'cols'},
+                                    'output': {0: 'n', 2: 'rows', 3: 'cols'}},
+                      opset_version=17, dynamo=False)
+    if quantize == 'dynamic':
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantized = os.path.splitext(path)[0] + '_int8.onnx'
+        quantize_dynamic(path, quantized, weight_type=QuantType.QUInt8)
+        path = quantized
+    return path
+
+
+def compile_generator(net, backend='torchscript', quantize=None, calibration=None, example=None,
+                      onnx_path=None, threads=None):
+    """
+    Optimized inference version of an eval-mode generator: BatchNorm folded, then traced / exported.
+    inputs:
+    net: generator in eval mode (nn.Module)
+    backend: one of BACKENDS (str)
+    quantize: None, 'static' (eager / torchscript, needs calibration) or 'dynamic' (onnx) (str)
+    calibration: tile batches for static quantization (list of tensors)
+    example: an input batch to trace / export with, (1, 3, 256, 256) zeros by default (tensor)
+    onnx_path: where to write the .onnx file, a temporary file by default (str)
+    threads: ONNX Runtime intra-op threads (int)
+    outputs:
+    generator: callable taking and returning (n, c, rows, cols) tensors
+    """
+    import torch
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}, got {backend}")
+    if quantize not in QUANTIZATION:
+        raise ValueError(f"quantize must be one of {QUANTIZATION}, got {quantize}")
+    if quantize == 'static' and backend == 'onnx':
+        raise ValueError("static int8 runs on the eager / torchscript backends, use quantize='dynamic' for onnx")
+    if quantize == 'dynamic' and backend != 'onnx':
+        raise ValueError("dynamic int8 in torch only covers Linear / LSTM layers, the generator has none; "
+                         "use quantize='static' or the onnx backend")
+    if quantize == 'static' and not calibration:
+        raise ValueError('static quantization needs calibration batches')
+    net = fold_batchnorm(net)
+    if quantize == 'static':
+        net = quantize_static(net, calibration)
+    if backend == 'eager':
+        return net
+    if example is None:
+        example = calibration[0][:1] if calibration else torch.zeros(1, 3, 256, 256)
+    if backend == 'torchscript':
+        with torch.no_grad():
+            return torch.jit.freeze(torch.jit.trace(net, example))
+    if onnx_path is None:
+        onnx_path = os.path.join(tempfile.mkdtemp(prefix='generator_'), 'generator.onnx')
+    return OnnxGenerator(export_onnx(net, example, onnx_path, quantize), threads)
+
+
+def mask_iou(a, b, threshold=MASK_THRESHOLD):
+    """IoU of the water pixels (> threshold) of two uint8 masks; 1 when both are empty."""
+    a, b = np.asarray(a) > threshold, np.asarray(b) > threshold
+    union = np.logical_or(a, b).sum()
+    return float(np.logical_and(a, b).sum() / union) if union else 1.0
+
+
+def benchmark(reference, candidates, batches, repeats=1, baseline=None):
+    """
+    Time generators on the same tile batches and compare their masks with a reference.
+    inputs:
+    reference: the eager fp32 generator (nn.Module, eval mode)
+    candidates: {label: compiled generator} (dict)
+    batches: (n, input_nc, rows, cols) tensors in [-1, 1] (list)
+    repeats: passes over the batches to time (int)
+    baseline: the generator the pipeline runs by default, e.g. the train-mode ShorelineGenerator.predict
+              (callable, optional)
+    outputs:
+    rows: one dict per generator, reference first, with label, tiles_per_sec, speedup,
+          iou (mean mask IoU with the reference), max_abs_diff (of the [-1, 1] outputs) and,
+          with a baseline, baseline_iou (mean mask IoU with the baseline) (list)
+    """
+    import torch
+    from utils.gan_inference import to_uint8
+
+    def run(generator):
+        with torch.no_grad():
+            generator(batches[0])  # warm up (lazy init, graph optimization)
+            start = time.perf_counter()
+            for _ in range(repeats):
+                outputs = [generator(batch) for batch in batches]
+            return time.perf_counter() - start, outputs
+
+    def iou(outputs, masks):
+        return float(np.mean([mask_iou(m, r) for out, ref in zip(outputs, masks)
+                              for m, r in zip(to_uint8(out), ref)]))
+
+    n_tiles = sum(len(batch) for batch in batches) * repeats
+    if baseline is not None:
+        with torch.no_grad():
+            baseline_masks = [to_uint8(baseline(batch)) for batch in batches]
+    ref_seconds, ref_outputs = run(reference)
+    ref_masks = [to_uint8(out) for out in ref_outputs]
+    rows = [{'label': 'eager fp32', 'tiles_per_sec': n_tiles / ref_seconds, 'speedup': 1.0, 'iou': 1.0,
+             'max_abs_diff': 0.0}]
+    if baseline is not None:
+        rows[0]['baseline_iou'] = iou(ref_outputs, baseline_masks)
+    for label, generator in candidates.items():
+        seconds, outputs = run(generator)
+        diff = max(float((out - ref).abs().max()) for out, ref in zip(outputs, ref_outputs))
+        rows.append({'label': label, 'tiles_per_sec': n_tiles / seconds, 'speedup': ref_seconds / seconds,
+                     'iou': iou(outputs, ref_masks), 'max_abs_diff': diff})
+        if baseline is not None:
+            rows[-1]['baseline_iou'] = iou(outputs, baseline_masks)
+    return rows
@@ -0,0 +1,103 @@
+"""
+Content-addressed cache for harmonize_site outputs.
+- A scene's cache key hashes its input file(s), the reference scene key and the harmonization parameters
+- Keys and outputs live in <harmonized folder>/harmonize_manifest.json, along with the hits and misses of the last run
+- File hashes are reused while a file's size and mtime are unchanged, so a rerun does not reread every TIF
+"""
+import os
+import json
+import time
+import hashlib
+
+MANIFEST_NAME = 'harmonize_manifest.json'
+
+# bump when the harmonization output changes for the same inputs
+HARMONIZE_VERSION = 3
+
+_CHUNK = 1 << 20
+
+
+def manifest_path(out_folder):
+    return os.path.join(out_folder, MANIFEST_NAME)
+
+
+def empty_manifest():
+    return {'reference': None, 'files': {}, 'scenes': {}, 'last_run': None}
+
+
+def load_manifest(out_folder):
+    """Load the manifest of a harmonized folder, or an empty one."""
+    path = manifest_path(out_folder)
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+            for key, value in empty_manifest().items():
+                manifest.setdefault(key, value)
+            return manifest
+        except ValueError:
+            print(f"Ignoring unreadable cache manifest {path}")
+    return empty_manifest()
+
+
+def save_manifest(manifest, out_folder):
+    path = manifest_path(out_folder)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+    return path
+
+
+def file_digest(path, manifest=None):
+    """sha256 of a file's contents; cached in manifest['files'] against its size and mtime."""
+    st = os.stat(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    files = manifest['files'] if manifest is not None else {}
+    entry = files.get(path)
+    if entry is not None and entry['stat'] == stamp:
+        return entry['sha256']
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+    files[path] = {'stat': stamp, 'sha256': digest}
+    return digest
+
+
+def scene_key(inputs, params, reference_key=None, manifest=None):
+    """Cache key of one harmonized scene.
+    inputs: input file path(s) of the scene (str or list)
+    params: harmonization parameters (dict, JSON serializable)
+    reference_key: key of the reference scene, None for the reference itself
+    """
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    hashes = [file_digest(p, manifest) for p in inputs if os.path.exists(p)]
+    payload = json.dumps({'inputs': hashes,
+                          'reference': reference_key,
+                          'params': params,
+                          'version': HARMONIZE_VERSION}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def lookup(manifest, tif, key):
+    """Manifest entry of a cached scene, or None on a miss (unknown key or missing output)."""
+    entry = manifest['scenes'].get(tif)
+    if entry is None or entry['key'] != key:
+        return None
+    if entry['output'] is not None and not os.path.exists(entry['output']):
+        return None
+    return entry
+
+
+def record(manifest, tif, key, output, status):
+    """Store a scene result; output None records a scene that was skipped (too few bands)."""
+    manifest['scenes'][tif] = {'key': key, 'output': output, 'status': status}
+
+
+def record_run(manifest, hits, misses):
+    manifest['last_run'] = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                            'hits': sorted(hits),
+                            'misses': sorted(misses)}
@@ -0,0 +1,140 @@
+"""
+Histogram matching with precomputed reference CDFs and lookup tables.
+- The reference CDF of every band is computed once (HistogramMatcher) and reused for every scene of a site
+- Integer bands with a range below 2**16 use exact per-value histograms, giving the same result as
+  SDS_preprocess.hist_match; float/reflectance bands use fixed-width bins
+- Histograms are built with np.bincount and the mapping is applied as one lookup table index per pixel,
+  so there is no np.unique sort of the source or reference band
+"""
+import numpy as np
+
+DEFAULT_BINS = 16384
+
+# integer bands spanning fewer values than this get one bin per value
+EXACT_INT_RANGE = 1 << 16
+
+
+class BandHistogram():
+    """Histogram of the finite values of one band.
+
+    values holds the value of each bin (the integer value, or the bin centre for
+    float data) and index holds the bin of every pixel (-1 for non-finite pixels).
+    """
+
+    def __init__(self, band, bins=DEFAULT_BINS):
+        band = np.asarray(band)
+        flat = band.ravel()
+        if flat.dtype.kind in 'iub':
+            finite = None
+            lo, hi = int(flat.min()), int(flat.max())
+            self.exact = hi - lo < EXACT_INT_RANGE
+        else:
+            finite = np.isfinite(flat)
+            if finite.all():
+                finite = None
+            sample = flat if finite is None else flat[finite]
+            if sample.size == 0:
+                raise ValueError('band has no finite values')
+            lo, hi = float(sample.min()), float(sample.max())
+            self.exact = False
+
+        if self.exact:
+            self.nbins = hi - lo + 1
+            self.index = (flat.astype(np.int64) - lo).astype(np.int32)
+            self.values = lo + np.arange(self.nbins, dtype=np.float64)
+        else:
+            self.nbins = int(bins)
+            width = (hi - lo) / self.nbins
+            if width <= 0:
+                width = 1.0
+            scaled = (flat - lo) * (1.0 / width)
+            if finite is not None:
+                scaled[~finite] = 0
+            # truncation after clipping to >= 0 is the floor, i.e. the bin number
+            self.index = np.clip(scaled, 0, self.nbins - 1).astype(np.int32)
+            if finite is not None:
+                self.index[~finite] = -1
+            self.values = lo + (np.arange(self.nbins, dtype=np.float64) + 0.5) * width
+
+        valid = self.index if finite is None else self.index[finite]
+        self.counts = np.bincount(valid, minlength=self.nbins)
+        self.shape = band.shape
+        self.has_nonfinite = finite is not None
+
+    def cdf(self):
+        """Empirical CDF at each bin (maps bin -> quantile)."""
+        cdf = np.cumsum(self.counts).astype(np.float64)
+        cdf /= cdf[-1]
+        return cdf
+
+
+class HistogramMatcher():
+    """Match bands of any number of scenes to the histograms of one reference.
+
+    Only the occupied bins of the reference are kept (values and CDF per band), so a
+    matcher is small and cheap to send to worker processes.
+    """
+
+    def __init__(self, reference, bins=DEFAULT_BINS):
+        reference = np.asarray(reference)
+        if reference.ndim == 2:
+            reference = reference[:, :, np.newaxis]
+        self.bins = bins
+        self.ref_values = []
+        self.ref_cdfs = []
+        for b in range(reference.shape[2]):
+            hist = BandHistogram(reference[:, :, b], bins)
+            occupied = hist.counts > 0
+            cdf = np.cumsum(hist.counts[occupied]).astype(np.float64)
+            cdf /= cdf[-1]
+            self.ref_values.append(hist.values[occupied])
+            self.ref_cdfs.append(cdf)
+
+    @property
+    def nbands(self):
+        return len(self.ref_cdfs)
+
+    def lut(self, hist, b):
+        """Lookup table mapping each bin of a source histogram to a reference value."""
+        # interpolate linearly to find the pixel values in the reference image
+        # that correspond most closely to the quantiles in the source image
+        return np.interp(hist.cdf(), self.ref_cdfs[b], self.ref_values[b]).astype(np.float32)
+
+    def match_band(self, band, b, out=None):
+        """Match a 2D band to reference band b; non-finite pixels stay NaN."""
+        hist = BandHistogram(band, self.bins)
+        lut = self.lut(hist, b)
+        if out is None:
+            out = np.empty(hist.shape, dtype=np.float32)
+        flat = out.reshape(-1) if out.flags.c_contiguous else None
+        if hist.has_nonfinite:
+            lut = np.append(lut, np.float32(np.nan))
+        # index -1 (non-finite) picks the NaN appended at the end of the table
+        if flat is not None:
+            np.take(lut, hist.index, out=flat)
+        else:
+            out[...] = lut[hist.index].reshape(hist.shape)
+        return out
+
+    def match(self, im, out=None):
+        """Match every band of a (rows, cols, bands) image, or a single 2D band to band 0."""
+        im = np.asarray(im)
+        if im.ndim == 2:
+            return self.match_band(im, 0, out)
+        if im.shape[2] > self.nbands:
+            raise ValueError(f'image has {im.shape[2]} bands, reference has {self.nbands}')
+        if out is None:
+            out = np.empty(im.shape, dtype=np.float32)
+        for b in range(im.shape[2]):
+            self.match_band(im[:, :, b], b, out[:, :, b])
+        return out
+
+    def match_many(self, scenes):
+        """Match a batch of scenes against the same reference, yielding one result per scene."""
+        for im in scenes:
+            yield self.match(im)
+
+
+def hist_match(source, template, bins=DEFAULT_BINS):
+    """Drop-in for SDS_preprocess.hist_match using the lookup-table engine."""
+    return HistogramMatcher(template, bins).match_band(source, 0)
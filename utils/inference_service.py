@@ -0,0 +1,648 @@
+"""
+Warm local inference service: a long-lived process that keeps generators loaded, so GUI actions and
+scripted runs do not pay for importing torch and loading a checkpoint every time.
+- Listens on localhost TCP (DEFAULT_ADDRESS) or a Unix socket path; one thread per connection
+- Generators are loaded on first use and kept per (model, epoch, input_nc, eval, backend, quantize, ...);
+  one whose checkpoint file changed (a retrained latest_net_G.pth) is loaded again on its next request
+- Requests carry tile paths (decoded by the service) or tile arrays (uint8, or float in [0, 1])
+- Tiles of concurrent requests for the same generator are coalesced into batches of up to max_batch,
+  waiting at most max_wait seconds for more tiles to arrive
+- Masks are streamed back chunk by chunk as their batches finish
+- With --idle-timeout the service exits after that many seconds without a request; services started
+  in the background by connect(start=True) use IDLE_TIMEOUT and log to SERVICE_LOG in the checkpoints dir
+- Frames are a JSON header plus raw array bytes. Requests can only pick checkpoints under the service's
+  --checkpoints-dir, with the model options of MODEL_OPTIONS, and checkpoints are loaded with
+  torch.load(weights_only=True), so a client cannot make the service unpickle arbitrary objects
+
+Start it with
+    python -m utils.inference_service --preload shoreline_gan_nov
+and use it with
+    client = InferenceClient()
+    for paths, masks in client.infer('shoreline_gan_nov', paths=tile_paths): ...
+"""
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import struct
+import argparse
+import threading
+import subprocess
+import socketserver
+import numpy as np
+
+DEFAULT_ADDRESS = ('127.0.0.1', 8765)
+MAX_BATCH = 16
+MAX_WAIT = 0.005  # seconds to wait for more tiles before running a partial batch
+CHUNK = 8         # tiles per request chunk: decoded, queued and streamed back together
+CONNECT_TIMEOUT = 60
+IDLE_TIMEOUT = 15 * 60  # seconds without requests before a background service exits
+SERVICE_LOG = 'inference_service.log'
+
+IMG_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.tif', '.tiff']
+
+# model options a client may set, with their types; the checkpoints directory is the service's own
+MODEL_OPTIONS = {'model': str, 'epoch': (str, int), 'input_nc': int, 'output_nc': int, 'ngf': int, 'eval': bool,
+                 'backend': str, 'quantize': (str, type(None)), 'netG': str, 'norm': str, 'no_dropout': bool,
+                 'model_suffix': str}
+
+_HEADER = struct.Struct('!II')
+
+
+def parse_address(address):
+    """'host:port' or (host, port) -> (host, port); anything else is a Unix socket path."""
+    if address is None:
+        return DEFAULT_ADDRESS
+    if isinstance(address, (tuple, list)):
+        return (address[0], int(address[1]))
+    host, sep, port = str(address).rpartition(':')
+    if sep and port.isdigit() and os.sep not in host:
+        return (host or DEFAULT_ADDRESS[0], int(port))
+    return str(address)
+
+
+def send_frame(sock, header, array=None):
+    """Send a JSON header and, optionally, an array (shape / dtype go in the header)."""
+    payload = b''
+    if array is not None:
+        array = np.ascontiguousarray(array)
+        header = dict(header, shape=list(array.shape), dtype=array.dtype.str)
+        payload = array.tobytes()
+    head = json.dumps(header).encode()
+    sock.sendall(_HEADER.pack(len(head), len(payload)) + head + payload)
+
+
+def _recv_exactly(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:], n - got)
+        if k == 0:
+            raise ConnectionError('connection closed')
+        got += k
+    return bytes(buf)
+
+
+def recv_frame(sock):
+    """Receive (header, array or None)."""
+    head_len, payload_len = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    header = json.loads(_recv_exactly(sock, head_len).decode())
+    array = None
+    if 'shape' in header:
+        array = np.frombuffer(_recv_exactly(sock, payload_len), dtype=np.dtype(header['dtype']))
+        array = array.reshape(header['shape'])
+    return header, array
+
+
+def list_tiles(folder, tile_manifest=None):
+    """Sorted image tiles of a folder, like the pix2pix single dataset (and its tile manifest filter)."""
+    paths = sorted(os.path.join(root, f) for root, _, files in os.walk(folder) for f in files
+                   if os.path.splitext(f)[1].lower() in IMG_EXTENSIONS)
+    if tile_manifest:
+        from utils import tile_triage
+        keep = set(tile_triage.tiles_to_infer(tile_manifest))
+        paths = [p for p in paths if os.path.basename(p) in keep]
+    return paths
+
+
+def read_tiles(paths):
+    """(n, rows, cols, 3) uint8 RGB tiles, decoded like the pix2pix single dataset."""
+    from PIL import Image
+    return np.stack([np.asarray(Image.open(p).convert('RGB')) for p in paths])
+
+
+class _Job():
+    """A chunk of one request's tiles, waiting for its masks."""
+
+    def __init__(self, batch):
+        self.batch = batch
+        self.masks = [None] * len(batch)
+        self.remaining = len(batch)
+        self.done = threading.Event()
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return np.stack(self.masks)
+
+
+class ModelWorker():
+    """Runs one generator on a thread, coalescing the tiles of the queued jobs into batches."""
+
+    def __init__(self, generator, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        self.generator = generator
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.jobs = queue.Queue()
+        self.batches_run = 0
+        self.tiles_run = 0
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop the thread once the jobs queued so far are done."""
+        self.jobs.put(None)
+
+    def submit(self, batch):
+        """Queue a (n, bands, rows, cols) tensor; returns a job whose wait() gives the uint8 masks."""
+        job = _Job(batch)
+        self.jobs.put(job)
+        return job
+
+    def _collect(self, pending):
+        """Pieces (job, start, stop) of the pending jobs filling up to max_batch tiles of one tile shape."""
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            size = sum(stop - start for _, start, stop in pending)
+            timeout = deadline - time.monotonic()
+            if size >= self.max_batch or timeout <= 0:
+                break
+            try:
+                job = self.jobs.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if job is None:
+                # closed: run what is pending, the loop stops on the marker afterwards
+                self.jobs.put(None)
+                break
+            pending.extend((job, i, min(i + self.max_batch, len(job.batch)))
+                           for i in range(0, len(job.batch), self.max_batch))
+        shape = pending[0][0].batch.shape[1:]
+        pieces, rest, size = [], [], 0
+        for job, start, stop in pending:
+            if job.batch.shape[1:] != shape or size >= self.max_batch:
+                rest.append((job, start, stop))
+                continue
+            take = min(stop - start, self.max_batch - size)
+            pieces.append((job, start, start + take))
+            if start + take < stop:
+                rest.append((job, start + take, stop))
+            size += take
+        pending[:] = rest
+        return pieces
+
+    def _loop(self):
+        import torch
+        from utils.gan_inference import to_uint8
+        pending = []
+        while True:
+            if not pending:
+                job = self.jobs.get()
+                if job is None:
+                    return
+                pending.extend((job, i, min(i + self.max_batch, len(job.batch)))
+                               for i in range(0, len(job.batch), self.max_batch))
+            pieces = self._collect(pending)
+            try:
+                batch = torch.cat([job.batch[start:stop] for job, start, stop in pieces])
+                masks = to_uint8(self.generator.predict(batch))
+            except Exception as e:
+                for job, _, _ in pieces:
+                    job.error = e
+                    job.done.set()
+                continue
+            self.batches_run += 1
+            self.tiles_run += len(batch)
+            i = 0
+            for job, start, stop in pieces:
+                job.masks[start:stop] = list(masks[i:i + stop - start])
+                i += stop - start
+                job.remaining -= stop - start
+                if job.remaining == 0:
+                    job.done.set()
+
+
+class ModelRegistry():
+    """Generators loaded on first request and kept, one ModelWorker each.
+
+    Checkpoints are loaded outside the registry lock, so a slow load only holds up the requests for that
+    generator; a generator is loaded again when the modification time of its checkpoint changes.
+    """
+
+    def __init__(self, checkpoints_dir=None, device=None, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        from utils import gan_inference
+        self.checkpoints_dir = checkpoints_dir or gan_inference.CHECKPOINTS_DIR
+        self.device = device
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.workers = {}
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def checkpoint_path(self, model, epoch='latest', model_suffix=''):
+        return os.path.join(self.checkpoints_dir, model, '%s_net_G%s.pth' % (epoch, model_suffix))
+
+    def get(self, model, epoch='latest', input_nc=3, eval=False, backend='eager', quantize=None, **kwargs):
+        from utils import gan_inference
+        key = (model, epoch, int(input_nc), bool(eval), backend, quantize, tuple(sorted(kwargs.items())))
+        mtime = os.stat(self.checkpoint_path(model, epoch, kwargs.get('model_suffix', ''))).st_mtime_ns
+        while True:
+            with self._lock:
+                worker = self.workers.get(key)
+                if worker is not None and worker.checkpoint_mtime == mtime:
+                    return worker
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    break
+            # another request is loading this generator, use it once it is there
+            loading.wait()
+        try:
+            generator = gan_inference.ShorelineGenerator(model, epoch, self.checkpoints_dir, input_nc=input_nc,
+                                                         eval=eval, backend=backend, quantize=quantize,
+                                                         device=self.device, **kwargs)
+            worker = ModelWorker(generator, self.max_batch, self.max_wait)
+            worker.checkpoint_mtime = mtime
+            with self._lock:
+                stale = self.workers.get(key)
+                self.workers[key] = worker
+            if stale is not None:
+                stale.close()
+            return worker
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+
+    def stats(self):
+        with self._lock:
+            workers = list(self.workers.items())
+        return [{'checkpoints_dir': self.checkpoints_dir, 'model': k[0], 'epoch': k[1], 'input_nc': k[2],
+                 'eval': k[3], 'backend': k[4], 'quantize': k[5], 'batches': w.batches_run, 'tiles': w.tiles_run}
+                for k, w in workers]
+
+
+def model_options(options):
+    """
+    Check the model options of a request against MODEL_OPTIONS.
+    Names that end up in the checkpoint path (model, epoch, model_suffix) have to be plain file names,
+    so every checkpoint the service loads is under its own checkpoints_dir.
+    outputs:
+    options: the options, for ModelRegistry.get (dict)
+    """
+    if not isinstance(options, dict) or 'model' not in options:
+        raise ValueError('model options must be a dict with a model name')
+    for name, value in options.items():
+        if name not in MODEL_OPTIONS:
+            raise ValueError('model option %r is not allowed' % name)
+        if not isinstance(value, MODEL_OPTIONS[name]):
+            raise ValueError('model option %r has the wrong type' % name)
+    for name in ('model', 'epoch', 'model_suffix'):
+        value = str(options.get(name, ''))
+        if '/' in value or os.sep in value or (os.altsep and os.altsep in value) or value in ('.', '..'):
+            raise ValueError('model option %r must be a plain name, got %r' % (name, value))
+    return options
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        while True:
+            try:
+                header, array = recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            self.server.activity.begin()
+            try:
+                if not self.dispatch(header, array):
+                    return
+            except Exception as e:
+                send_frame(self.request, {'error': '%s: %s' % (type(e).__name__, e)})
+            finally:
+                self.server.activity.end()
+
+    def dispatch(self, header, array):
+        op = header.get('op')
+        registry = self.server.registry
+        if op == 'ping':
+            send_frame(self.request, {'ok': True, 'pid': os.getpid()})
+        elif op == 'stats':
+            send_frame(self.request, {'ok': True, 'models': registry.stats()})
+        elif op == 'load':
+            registry.get(**model_options(header.get('model')))
+            send_frame(self.request, {'ok': True})
+        elif op == 'infer':
+            self.infer(registry.get(**model_options(header.get('model'))), header.get('paths'), array)
+        elif op == 'shutdown':
+            send_frame(self.request, {'ok': True})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return False
+        else:
+            raise ValueError('unknown op %r' % op)
+        return True
+
+    def infer(self, worker, paths, tiles):
+        from utils.gan_inference import tiles_to_batch
+        n = len(paths) if paths is not None else len(tiles)
+        chunks = [(i, min(i + CHUNK, n)) for i in range(0, n, CHUNK)]
+        # decode and queue every chunk up front, so they coalesce with other requests' tiles,
+        # then stream the masks back in order
+        jobs = []
+        for start, stop in chunks:
+            chunk = read_tiles(paths[start:stop]) if paths is not None else tiles[start:stop]
+            jobs.append(worker.submit(tiles_to_batch(chunk)))
+        for (start, stop), job in zip(chunks, jobs):
+            send_frame(self.request, {'start': start, 'stop': stop}, job.wait())
+        send_frame(self.request, {'ok': True, 'done': True, 'tiles': n})
+
+
+class _Activity():
+    """Requests in progress and the time the last one ended, for the idle timeout."""
+
+    def __init__(self):
+        self.busy = 0
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def begin(self):
+        with self._lock:
+            self.busy += 1
+
+    def end(self):
+        with self._lock:
+            self.busy -= 1
+            self.last = time.monotonic()
+
+    def idle_for(self):
+        """Seconds since the last request ended, 0 while one is running."""
+        with self._lock:
+            return 0.0 if self.busy else time.monotonic() - self.last
+
+
+class InferenceServer():
+    """The service: a threading TCP (or Unix socket) server around a ModelRegistry.
+    idle_timeout: seconds without requests after which serve_forever returns (None: never)
+    preload: model[:epoch] specs loaded before the address is bound, so clients never reach a service
+    that is still loading (or failing to load) them"""
+
+    def __init__(self, address=None, checkpoints_dir=None, device=None, max_batch=MAX_BATCH, max_wait=MAX_WAIT,
+                 idle_timeout=None, preload=()):
+        registry = ModelRegistry(checkpoints_dir, device, max_batch, max_wait)
+        for spec in preload:
+            model, _, epoch = spec.partition(':')
+            registry.get(model, epoch or 'latest')
+        address = parse_address(address)
+        if isinstance(address, str):
+            if os.path.exists(address):
+                os.remove(address)
+            server_class = socketserver.ThreadingUnixStreamServer
+        else:
+            server_class = socketserver.ThreadingTCPServer
+        server_class.allow_reuse_address = True
+        server_class.daemon_threads = True
+        self.server = server_class(address, _Handler)
+        self.server.registry = registry
+        self.server.activity = _Activity()
+        self.idle_timeout = idle_timeout
+        self.address = self.server.server_address
+
+    @property
+    def registry(self):
+        return self.server.registry
+
+    def _watch_idle(self, stopped):
+        while not stopped.wait(min(1.0, self.idle_timeout / 4)):
+            if self.server.activity.idle_for() > self.idle_timeout:
+                print('inference service idle for %gs, exiting' % self.idle_timeout, flush=True)
+                self.server.shutdown()
+                return
+
+    def serve_forever(self):
+        stopped = threading.Event()
+        if self.idle_timeout:
+            threading.Thread(target=self._watch_idle, args=(stopped,), daemon=True).start()
+        try:
+            self.server.serve_forever()
+        finally:
+            stopped.set()
+            self.server.server_close()
+            if isinstance(self.address, str) and os.path.exists(self.address):
+                os.remove(self.address)
+
+    def start(self):
+        """Serve from a background thread (tests, or embedding in another process)."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+class InferenceClient():
+    """Connection to a running InferenceServer.
+
+    model options (see MODEL_OPTIONS: model, epoch, input_nc, eval, backend, quantize, ...) select the
+    generator among the checkpoints of the service's checkpoints_dir; each distinct set is loaded once by the
+    service and kept.
+    """
+
+    def __init__(self, address=None, timeout=None):
+        address = parse_address(address)
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+
+    def _call(self, header, array=None):
+        send_frame(self.sock, header, array)
+        reply, _ = recv_frame(self.sock)
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply
+
+    def ping(self):
+        return self._call({'op': 'ping'})
+
+    def stats(self):
+        return self._call({'op': 'stats'})['models']
+
+    def load(self, model, **options):
+        """Load a generator ahead of the first request."""
+        return self._call({'op': 'load', 'model': dict(options, model=model)})
+
+    def infer(self, model, paths=None, tiles=None, **options):
+        """
+        Yield (indices, masks) chunks as the service streams them back.
+        inputs:
+        paths: tile image paths, decoded by the service (list)
+        tiles: (n, rows, cols, bands) uint8 tiles, or float tiles in [0, 1] (array)
+        outputs:
+        indices: positions of the chunk's tiles in paths / tiles (range)
+        masks: (k, rows, cols) uint8 masks
+        """
+        header = {'op': 'infer', 'model': dict(options, model=model)}
+        if paths is not None:
+            header['paths'] = [os.path.abspath(p) for p in paths]
+        send_frame(self.sock, header, None if paths is not None else np.asarray(tiles))
+        while True:
+            reply, masks = recv_frame(self.sock)
+            if 'error' in reply:
+                raise RuntimeError(reply['error'])
+            if reply.get('done'):
+                return
+            yield range(reply['start'], reply['stop']), masks
+
+    def shutdown(self):
+        return self._call({'op': 'shutdown'})
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def source_tiles(source, dataset_mode='single', tile_manifest=None):
+    """
+    Tiles of a tile folder or tile shard folder, for sending to the service.
+    outputs:
+    paths: tile paths, as A_paths of the pix2pix datasets (list)
+    read: read(start, stop) -> (k, rows, cols, bands) tiles of paths[start:stop] (callable)
+    """
+    if dataset_mode != 'tile_shard':
+        paths = list_tiles(source, tile_manifest)
+        return paths, lambda start, stop: read_tiles(paths[start:stop])
+    from utils import tile_shards, tile_triage
+    keep = set(tile_triage.tiles_to_infer(tile_manifest)) if tile_manifest else None
+    items, paths = [], []
+    shards = [tile_shards.TileShard(p) for p in tile_shards.find_shards(source)]
+    for shard in shards:
+        for i, name in enumerate(shard.names):
+            if keep is None or name in keep:
+                items.append((shard, i))
+                paths.append(os.path.join(os.path.dirname(shard.path), name))
+    return paths, lambda start, stop: np.stack([shard[i] for shard, i in items[start:stop]])
+
+
+def infer_folder(client, source, model_name, epoch='latest', results_dir=None, dataset_mode='single',
+                 tile_manifest=None, input_nc=3, max_tiles=float('inf'), output='full', request_size=256,
+                 **options):
+    """
+    gan_inference.infer through the service: same arguments and outputs, but the generator is the
+    service's warm one. Tiles are sent request_size at a time.
+    """
+    from utils import gan_inference
+    paths, read = source_tiles(source, dataset_mode, tile_manifest)
+    paths = paths[:int(min(len(paths), max_tiles))]
+    model = dict(options, epoch=epoch, input_nc=input_nc)
+    folder = gan_inference.results_folder(results_dir, model_name, epoch) if results_dir is not None else None
+    writer = gan_inference.ResultWriter(folder, output) if folder is not None else None
+    masks = {}
+    try:
+        for start in range(0, len(paths), request_size):
+            stop = min(start + request_size, len(paths))
+            tiles = read(start, stop)
+            for indices, chunk in client.infer(model_name, tiles=tiles, **model):
+                names = [paths[start + i] for i in indices]
+                if writer is None:
+                    masks.update(zip(names, chunk))
+                    continue
+                inputs = tiles[indices.start:indices.stop]
+                if inputs.dtype != np.uint8:
+                    inputs = np.round(np.clip(inputs, 0, 1) * 255).astype(np.uint8)
+                writer.submit(names, chunk, inputs)
+    finally:
+        if writer is not None:
+            writer.close()
+    return folder if folder is not None else masks
+
+
+def _log_tail(path, lines=20):
+    try:
+        with open(path, errors='replace') as f:
+            return ''.join(f.readlines()[-lines:])
+    except OSError:
+        return ''
+
+
+def connect(address=None, start=False, timeout=CONNECT_TIMEOUT, **serve_args):
+    """
+    Client of the service at address; with start=True a service is started in the background
+    when none answers (serve_args: see start_service). A service that exits before it answers, or does
+    not answer within timeout seconds, raises RuntimeError with the end of its log.
+    """
+    try:
+        return InferenceClient(address)
+    except (ConnectionError, FileNotFoundError, OSError):
+        if not start:
+            raise
+    proc = start_service(address, **serve_args)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return InferenceClient(address)
+        except (ConnectionError, FileNotFoundError, OSError):
+            if proc.poll() is not None:
+                raise RuntimeError('inference service exited with code %d, see %s:\n%s'
+                                   % (proc.returncode, proc.log_path, _log_tail(proc.log_path)))
+            if time.monotonic() > deadline:
+                raise RuntimeError('inference service did not answer within %gs, see %s:\n%s'
+                                   % (timeout, proc.log_path, _log_tail(proc.log_path)))
+            time.sleep(0.2)
+
+
+def start_service(address=None, checkpoints_dir=None, device=None, max_batch=MAX_BATCH, preload=(),
+                  idle_timeout=IDLE_TIMEOUT, log_path=None):
+    """
+    Start `python -m utils.inference_service` as a detached background process.
+    inputs:
+    idle_timeout: seconds without requests after which the service exits, None to keep it running (float)
+    log_path: file the service's output is appended to, <checkpoints_dir>/SERVICE_LOG by default (str)
+    outputs:
+    proc: the subprocess.Popen, with the log path as proc.log_path
+    """
+    from utils import gan_inference
+    address = parse_address(address)
+    cmd = [sys.executable, '-m', 'utils.inference_service',
+           '--address', address if isinstance(address, str) else '%s:%d' % address,
+           '--max-batch', str(max_batch)]
+    if checkpoints_dir:
+        cmd += ['--checkpoints-dir', checkpoints_dir]
+    if device:
+        cmd += ['--device', device]
+    if idle_timeout:
+        cmd += ['--idle-timeout', str(idle_timeout)]
+    for model in preload:
+        cmd += ['--preload', model]
+    if log_path is None:
+        log_path = os.path.join(checkpoints_dir or gan_inference.CHECKPOINTS_DIR, SERVICE_LOG)
+    os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    kwargs = {'start_new_session': True} if os.name == 'posix' else \
+        {'creationflags': getattr(subprocess, 'DETACHED_PROCESS', 0)}
+    with open(log_path, 'ab') as log:
+        proc = subprocess.Popen(cmd, cwd=root, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                                **kwargs)
+    proc.log_path = log_path
+    return proc
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Warm local GAN inference service')
+    parser.add_argument('--address', default='%s:%d' % DEFAULT_ADDRESS, help='host:port or Unix socket path')
+    parser.add_argument('--checkpoints-dir', default=None)
+    parser.add_argument('--device', default=None, help='cpu / cuda, default: cuda when available')
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH, help='Tiles per coalesced batch')
+    parser.add_argument('--max-wait', type=float, default=MAX_WAIT, help='Seconds to wait to fill a batch')
+    parser.add_argument('--preload', action='append', default=[], help='model[:epoch] to load at start')
+    parser.add_argument('--idle-timeout', type=float, default=None,
+                        help='Exit after this many seconds without requests (default: never)')
+    args = parser.parse_args()
+    server = InferenceServer(args.address, args.checkpoints_dir, args.device, args.max_batch, args.max_wait,
+                             args.idle_timeout, args.preload)
+    print('inference service listening on', server.address, flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,153 +2,295 @@
 Lightweight Landsat preprocessing and harmonization utilities.
 - Uses existing CoastSat preprocess functions where possible
 - Produces harmonized GeoTIFFs with consistent bands: B,G,R,NIR,SWIR1
-- Tries to use rasterio to write outputs, falls back to GDAL-based writer
+- Writes tiled, compressed GeoTIFFs with overviews (utils/cog_writer.py), rasterio or GDAL
 """
 import os
 import glob
+import collections
 import numpy as np
 from pathlib import Path
 
-try:
-    import rasterio
-    from rasterio.transform import Affine
-    _HAS_RASTERIO = True
-except Exception:
-    _HAS_RASTERIO = False
-
 from utils.coastsat import SDS_preprocess2
+from utils import cog_writer
+from utils import harmonize_cache
+from utils import hist_matching
 from utils.gdal_modules import gdal_functions_app as gda
 
 
-def write_geotiff(path, arr, georef, projection_wkt):
-    """Write a multi-band GeoTIFF using rasterio if available, else GDAL."""
+def write_geotiff(path, arr, georef, projection_wkt, blocksize=cog_writer.BLOCKSIZE,
+                  compress=cog_writer.COMPRESS, overviews=None):
+    """Write a multi-band GeoTIFF, tiled and compressed with internal overviews
+    (see utils/cog_writer.py), using rasterio if available, else GDAL."""
     # arr shape: (rows, cols, bands)
-    rows, cols, bands = arr.shape
-    if _HAS_RASTERIO:
-        transform = Affine(georef[1], georef[2], georef[0], georef[3], georef[4], georef[5])
-        crs = projection_wkt
-        with rasterio.open(
-            path,
-            'w',
-            driver='GTiff',
-            height=rows,
-            width=cols,
-            count=bands,
-            dtype=arr.dtype,
-            transform=transform,
-            crs=crs,
-        ) as dst:
-            for i in range(bands):
-                dst.write(arr[:,:,i], i+1)
+    return cog_writer.write_cog(path, arr, georef, projection_wkt, blocksize, compress, overviews)
+
+
+def _scene_inputs(tif):
+    """Guess the satellite from the file/folder name and build the preprocess_single input."""
+    # Heuristic: find sensor from filename
+    basename = os.path.basename(tif)
+    if '_L8_' in basename or '_L8' in basename:
+        sat = 'L8'
+    elif '_L7_' in basename or '_L7' in basename:
+        sat = 'L7'
+    elif '_L5_' in basename or '_L5' in basename:
+        sat = 'L5'
     else:
-        # Fall back to GDAL
-        driver = gda.gdal.GetDriverByName('GTiff')
-        out_ds = driver.Create(path, cols, rows, bands, gda.gdal.GDT_Float32)
-        out_ds.SetGeoTransform(tuple(georef))
-        out_ds.SetProjection(projection_wkt)
-        for i in range(bands):
-            out_ds.GetRasterBand(i+1).WriteArray(arr[:,:,i])
-        out_ds.FlushCache()
-        out_ds = None
-
-
-def harmonize_site(site_folder, out_folder=None, target_bands=5):
-    """Process images in a site folder and save harmonized GeoTIFFs.
-    - Looks for geotiffs in L5, L7, L8 subfolders
-    - Uses SDS_preprocess2.preprocess_single to get band arrays
-    - Performs per-band histogram matching to the first valid image (reference)
-    """
-    if out_folder is None:
-        out_folder = os.path.join(site_folder, 'harmonized')
-    Path(out_folder).mkdir(parents=True, exist_ok=True)
+        # Try to infer from folder names
+        if '/L8/' in tif.replace('\\','/'):
+            sat = 'L8'
+        elif '/L7/' in tif.replace('\\','/'):
+            sat = 'L7'
+        elif '/L5/' in tif.replace('\\','/'):
+            sat = 'L5'
+        else:
+            sat = None
 
-    # search for tif files recursively
-    tifs = glob.glob(os.path.join(site_folder, '**', '*.tif'), recursive=True)
-    processed = []
-    ref = None
+    # Construct input for preprocess_single depending on satellite
+    if sat in ['L7', 'L8']:
+        # Expect pan and ms naming convention from SDS_download
+        # e.g., ..._pan.tif and ..._ms.tif
+        if tif.endswith('_pan.tif'):
+            # find corresponding ms file by name
+            ms_candidate = tif.replace('_pan.tif', '_ms.tif')
+            if not os.path.exists(ms_candidate):
+                # try alternate pattern
+                ms_candidate = tif.replace('_pan.tif', '.tif')
+            fn = [tif, ms_candidate]
+        elif tif.endswith('_ms.tif'):
+            pan_candidate = tif.replace('_ms.tif', '_pan.tif')
+            fn = [pan_candidate, tif]
+        else:
+            # fallback: try using tif as ms only
+            fn = [tif]
+    else:
+        fn = tif
+    return fn, sat
+
+
+def load_scene_bands(tif, target_bands=5):
+    """Run preprocess_single on a scene and return (B,G,R,NIR,SWIR) bands and georef, or (None, None)."""
+    fn, sat = _scene_inputs(tif)
+    # preprocess_single returns im_ms (rows, cols, bands), georef, cloud_mask, im_extra, im_QA, im_nodata
+    im_ms, georef, cloud_mask, im_extra, im_QA, im_nodata = SDS_preprocess2.preprocess_single(fn, sat if sat else 'L8', False)
+
+    # select first 5 bands (B,G,R,NIR,SWIR) if available
+    if im_ms.ndim == 3 and im_ms.shape[2] >= target_bands:
+        return im_ms[:,:,:target_bands], georef
+    return None, None
 
+
+def harmonized_name(tif, out_folder):
+    return os.path.join(out_folder, os.path.basename(tif).replace('.tif', '_harm.tif'))
+
+
+# reference histograms built from a reference file, kept per process so each
+# reference is only read once however many scenes are matched to it; bounded (least
+# recently used evicted) and keyed on the file's size and mtime, so a rewritten
+# reference is read again
+REFERENCE_CACHE_SIZE = 4
+_REFERENCE_CACHE = collections.OrderedDict()
+
+
+def clear_reference_cache():
+    """Drop the reference histograms kept by reference_matcher."""
+    _REFERENCE_CACHE.clear()
+
+
+def reference_matcher(ref):
+    """HistogramMatcher for the site reference.
+    ref: a HistogramMatcher, the reference bands array or the path of the written reference GeoTIFF"""
+    if isinstance(ref, hist_matching.HistogramMatcher):
+        return ref
+    if not isinstance(ref, str):
+        return hist_matching.HistogramMatcher(ref)
+    st = os.stat(ref)
+    key = (ref, st.st_size, st.st_mtime_ns)
+    if key in _REFERENCE_CACHE:
+        _REFERENCE_CACHE.move_to_end(key)
+        return _REFERENCE_CACHE[key]
+    ds = gda.gdal.Open(ref)
+    bands = [ds.GetRasterBand(i+1).ReadAsArray() for i in range(ds.RasterCount)]
+    ds = None
+    _REFERENCE_CACHE[key] = hist_matching.HistogramMatcher(np.stack(bands, 2))
+    while len(_REFERENCE_CACHE) > REFERENCE_CACHE_SIZE:
+        _REFERENCE_CACHE.popitem(last=False)
+    return _REFERENCE_CACHE[key]
+
+
+def harmonize_reference(tifs, out_folder, target_bands=5):
+    """Write the first valid scene of tifs as the site reference.
+    Returns (reference bands, projection wkt, reference tif, reference output path);
+    all None when no scene could be preprocessed."""
     for tif in tifs:
         try:
-            # Heuristic: find sensor from filename
-            basename = os.path.basename(tif)
-            if '_L8_' in basename or '_L8' in basename:
-                sat = 'L8'
-            elif '_L7_' in basename or '_L7' in basename:
-                sat = 'L7'
-            elif '_L5_' in basename or '_L5' in basename:
-                sat = 'L5'
-            else:
-                # Try to infer from folder names
-                if '/L8/' in tif.replace('\\','/'):
-                    sat = 'L8'
-                elif '/L7/' in tif.replace('\\','/'):
-                    sat = 'L7'
-                elif '/L5/' in tif.replace('\\','/'):
-                    sat = 'L5'
-                else:
-                    sat = None
-
-            # Construct input for preprocess_single depending on satellite
-            if sat in ['L7', 'L8']:
-                # Expect pan and ms naming convention from SDS_download
-                # e.g., ..._pan.tif and ..._ms.tif
-                if tif.endswith('_pan.tif'):
-                    # find corresponding ms file by name
-                    ms_candidate = tif.replace('_pan.tif', '_ms.tif')
-                    if not os.path.exists(ms_candidate):
-                        # try alternate pattern
-                        ms_candidate = tif.replace('_pan.tif', '.tif')
-                    fn = [tif, ms_candidate]
-                elif tif.endswith('_ms.tif'):
-                    pan_candidate = tif.replace('_ms.tif', '_pan.tif')
-                    fn = [pan_candidate, tif]
-                else:
-                    # fallback: try using tif as ms only
-                    fn = [tif]
-            else:
-                fn = tif
-
-            # preprocess_single returns im_ms (rows, cols, bands), georef, cloud_mask, im_extra, im_QA, im_nodata
-            im_ms, georef, cloud_mask, im_extra, im_QA, im_nodata = SDS_preprocess2.preprocess_single(fn, sat if sat else 'L8', False)
-
-            # select first 5 bands (B,G,R,NIR,SWIR) if available
-            if im_ms.ndim == 3 and im_ms.shape[2] >= 5:
-                arr = im_ms[:,:,:5]
-            else:
-                # pad or skip
+            arr, georef = load_scene_bands(tif, target_bands)
+            if arr is None:
                 continue
+            # determine projection from file using GDAL
+            ds = gda.gdal.Open(tif)
+            ref_proj = ds.GetProjection()
+            ds = None
 
-            # set reference
-            if ref is None:
-                ref = arr.copy()
-                ref_georef = georef
-                # determine projection from file using GDAL
-                ds = gda.gdal.Open(tif)
-                proj = ds.GetProjection()
-                ds = None
-                ref_proj = proj
-
-                # write ref directly
-                outname = os.path.join(out_folder, os.path.basename(tif).replace('.tif', '_harm.tif'))
-                write_geotiff(outname, arr.astype('float32'), georef, ref_proj)
-                processed.append(outname)
-                continue
+            # write ref directly
+            outname = harmonized_name(tif, out_folder)
+            write_geotiff(outname, arr.astype('float32'), georef, ref_proj)
+            return arr, ref_proj, tif, outname
+        except Exception as e:
+            print(f"Skipping {tif}: preprocess failed with {e}")
+            continue
+    return None, None, None, None
 
-            # histogram match each band to the reference
-            matched = np.zeros_like(arr, dtype='float32')
-            for b in range(arr.shape[2]):
-                try:
-                    matched[:,:,b] = SDS_preprocess2.hist_match(arr[:,:,b], ref[:,:,b])
-                except Exception:
-                    matched[:,:,b] = arr[:,:,b]
 
-            outname = os.path.join(out_folder, os.path.basename(tif).replace('.tif', '_harm.tif'))
-            write_geotiff(outname, matched.astype('float32'), georef, ref_proj)
-            processed.append(outname)
+def harmonize_scene(tif, out_folder, ref, ref_proj, target_bands=5):
+    """Histogram match one scene to the site reference and write it.
+    ref: HistogramMatcher, reference bands array or path to the reference _harm.tif
+    Returns the output path, or None when the scene has too few bands."""
+    arr, georef = load_scene_bands(tif, target_bands)
+    if arr is None:
+        return None
+    matcher = reference_matcher(ref)
 
-        except Exception as e:
-            print(f"Skipping {tif}: preprocess failed with {e}")
+    # histogram match each band to the precomputed reference CDFs
+    matched = np.zeros_like(arr, dtype='float32')
+    for b in range(arr.shape[2]):
+        try:
+            matcher.match_band(arr[:,:,b], b, out=matched[:,:,b])
+        except Exception:
+            matched[:,:,b] = arr[:,:,b]
+
+    outname = harmonized_name(tif, out_folder)
+    write_geotiff(outname, matched.astype('float32'), georef, ref_proj)
+    return outname
+
+
+def find_site_tifs(site_folder, exclude=None):
+    """All GeoTIFFs below a site folder, sorted so the reference scene is deterministic.
+    Files below exclude (e.g. the harmonized output folder) are left out."""
+    # search for tif files recursively
+    tifs = sorted(glob.glob(os.path.join(site_folder, '**', '*.tif'), recursive=True))
+    if exclude is not None:
+        exclude = os.path.normpath(exclude) + os.sep
+        tifs = [t for t in tifs if not os.path.normpath(t).startswith(exclude)]
+    return tifs
+
+
+def _input_files(tif):
+    fn, sat = _scene_inputs(tif)
+    return fn
+
+
+def plan_site(site_folder, out_folder=None, target_bands=5, use_cache=True):
+    """Pick the site reference and split the other scenes into cache hits and scenes to process.
+    - A cached reference is reused while its inputs are unchanged, so new scenes never move it
+    - Otherwise the first valid scene becomes the reference and is written straight away
+    Returns a plan dict used by harmonize_site / finish_site."""
+    if out_folder is None:
+        out_folder = os.path.join(site_folder, 'harmonized')
+    Path(out_folder).mkdir(parents=True, exist_ok=True)
+    manifest = harmonize_cache.load_manifest(out_folder) if use_cache else harmonize_cache.empty_manifest()
+    params = {'target_bands': target_bands, 'cloud_mask_issue': False,
+              'hist_bins': hist_matching.DEFAULT_BINS}
+
+    tifs = find_site_tifs(site_folder, exclude=out_folder)
+    plan = {'out_folder': out_folder, 'manifest': manifest, 'use_cache': use_cache,
+            'tifs': tifs, 'ref': None, 'ref_proj': None, 'ref_tif': None, 'ref_out': None,
+            'ref_key': None, 'hits': [], 'misses': [], 'todo': [], 'target_bands': target_bands}
+
+    prev = manifest['reference']
+    if prev is not None and prev['tif'] in tifs:
+        key = harmonize_cache.scene_key(_input_files(prev['tif']), params, None, manifest)
+        entry = harmonize_cache.lookup(manifest, prev['tif'], key)
+        if entry is not None:
+            plan.update(ref=entry['output'], ref_proj=prev['projection'], ref_tif=prev['tif'],
+                        ref_out=entry['output'], ref_key=key)
+            plan['hits'].append(prev['tif'])
+            remaining = [t for t in tifs if t != prev['tif']]
+
+    if plan['ref_out'] is None:
+        ref, ref_proj, ref_tif, ref_out = harmonize_reference(tifs, out_folder, target_bands)
+        if ref_out is None:
+            return plan
+        key = harmonize_cache.scene_key(_input_files(ref_tif), params, None, manifest)
+        harmonize_cache.record(manifest, ref_tif, key, ref_out, 'miss')
+        manifest['reference'] = {'tif': ref_tif, 'projection': ref_proj}
+        # reference CDFs are computed once here and shared by every scene of the site
+        plan.update(ref=hist_matching.HistogramMatcher(ref), ref_proj=ref_proj, ref_tif=ref_tif,
+                    ref_out=ref_out, ref_key=key)
+        plan['misses'].append(ref_tif)
+        # scenes sorted before a fresh reference already failed to preprocess
+        remaining = tifs[tifs.index(ref_tif)+1:]
+
+    for tif in remaining:
+        key = harmonize_cache.scene_key(_input_files(tif), params, plan['ref_key'], manifest)
+        if harmonize_cache.lookup(manifest, tif, key) is not None:
+            plan['hits'].append(tif)
+        else:
+            plan['todo'].append((tif, key))
+    return plan
+
+
+def finish_site(plan, results):
+    """Record processed scenes in the manifest and return the harmonized files in scene order.
+    results: (tif, key, output, error) for every scene in plan['todo']"""
+    manifest = plan['manifest']
+    for tif, key, output, error in results:
+        if error:
+            print(f"Skipping {tif}: preprocess failed with {error}")
+            continue
+        harmonize_cache.record(manifest, tif, key, output, 'miss')
+        plan['misses'].append(tif)
+
+    for tif in plan['hits']:
+        manifest['scenes'][tif]['status'] = 'hit'
+
+    done = set(plan['hits']) | set(plan['misses'])
+    processed = []
+    for tif in plan['tifs']:
+        if tif not in done:
             continue
+        output = manifest['scenes'][tif]['output']
+        if output is not None:
+            processed.append(output)
+
+    harmonize_cache.record_run(manifest, plan['hits'], plan['misses'])
+    if plan['use_cache']:
+        harmonize_cache.save_manifest(manifest, plan['out_folder'])
+    print(f"Harmonize cache: {len(plan['hits'])} hits, {len(plan['misses'])} misses")
+    return processed
+
+
+def harmonize_site(site_folder, out_folder=None, target_bands=5, jobs=1, use_cache=True):
+    """Process images in a site folder and save harmonized GeoTIFFs.
+    - Looks for geotiffs in L5, L7, L8 subfolders
+    - Uses SDS_preprocess2.preprocess_single to get band arrays
+    - Performs per-band histogram matching to the first valid image (reference),
+      using reference CDFs computed once per site (utils/hist_matching.py)
+    - Skips scenes whose inputs, reference and parameters match harmonize_manifest.json
+    - jobs > 1 matches the non-reference scenes on a process pool
+    """
+    plan = plan_site(site_folder, out_folder, target_bands, use_cache)
+    out_folder = plan['out_folder']
+    ref_proj = plan['ref_proj']
+    if plan['todo']:
+        ref = reference_matcher(plan['ref'])
+
+    results = []
+    if jobs is not None and jobs > 1 and len(plan['todo']) > 1:
+        from utils import parallel_utils
+        # workers get the reference CDFs, not the reference raster
+        tasks = [(tif, harmonize_scene, (tif, out_folder, ref, ref_proj, target_bands))
+                 for tif, key in plan['todo']]
+        timings = parallel_utils.run_tasks(tasks, jobs=jobs)
+        for (tif, key), t in zip(plan['todo'], timings):
+            results.append((tif, key, t['result'], t['error']))
+    else:
+        for tif, key in plan['todo']:
+            try:
+                results.append((tif, key, harmonize_scene(tif, out_folder, ref, ref_proj, target_bands), None))
+            except Exception as e:
+                results.append((tif, key, None, e))
 
+    processed = finish_site(plan, results)
     print(f"Harmonization complete. {len(processed)} files written to {out_folder}")
     return processed
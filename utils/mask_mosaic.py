@@ -0,0 +1,235 @@
+"""
+Scene-level mosaicking of per-tile GAN masks.
+- Tile outputs are placed back on the scene grid using the tile index CSV written by scene_tiler.tile_scene
+- Overlapping tiles are blended by weighted averaging, with weights that ramp down towards tile edges
+  (where the generator has the least context), so seams between tiles disappear
+- Tiles the triage pass skipped (utils/tile_triage.py) can be filled with a constant per reason
+- The result is one georeferenced probability raster (and thresholded mask) per scene,
+  so shoreline extraction runs once per scene instead of once per tile
+"""
+import os
+import numpy as np
+import cv2
+
+from utils import scene_tiler
+from utils import tile_triage
+
+try:
+    import rasterio
+    from affine import Affine
+    _HAS_RASTERIO = True
+except Exception:
+    _HAS_RASTERIO = False
+
+MASK_SUFFIX = '_fake_B.png'
+
+# weight of the outermost pixel of a tile, so every covered pixel keeps a nonzero weight
+MIN_WEIGHT = 1e-3
+
+# probability for tiles the triage skipped, per reason, in the generator's convention (water is 1);
+# 'nodata' and 'uniform' tiles stay uncovered and are no data for the shoreline extraction
+DEFAULT_FILL_VALUES = {'water': 1.0, 'land': 0.0}
+
+
+def blend_weights(rows, cols, overlap=0):
+    """2D blending weights of a tile: 1 in the interior, ramping linearly to ~0
+    over the `overlap` pixels along each edge (all ones when overlap is 0)."""
+    def ramp(n):
+        if overlap <= 0:
+            return np.ones(n, dtype=np.float32)
+        i = np.arange(n, dtype=np.float32)
+        w = np.minimum(np.minimum(i + 1, n - i) / float(overlap + 1), 1.0)
+        return np.maximum(w, MIN_WEIGHT).astype(np.float32)
+    return np.outer(ramp(rows), ramp(cols))
+
+
+class MaskMosaic():
+    """Weighted-average accumulator of tile predictions on a scene grid.
+
+    geotransform uses the GDAL ordering (x0, xres, xskew, y0, yskew, yres).
+    Pixels no tile covers are NaN in probability() and 0 in mask().
+    """
+
+    def __init__(self, height, width, geotransform=None, epsg=None):
+        self.height = int(height)
+        self.width = int(width)
+        self.geotransform = geotransform
+        self.epsg = epsg
+        self.total = np.zeros((self.height, self.width), dtype=np.float32)
+        self.weight = np.zeros((self.height, self.width), dtype=np.float32)
+
+    def add(self, tile, row_off, col_off, weights=None):
+        """Add a 2D tile prediction in [0, 1] with its top-left corner at (row_off, col_off)."""
+        tile = np.asarray(tile, dtype=np.float32)
+        rows = min(tile.shape[0], self.height - row_off)
+        cols = min(tile.shape[1], self.width - col_off)
+        if rows <= 0 or cols <= 0:
+            return
+        if weights is None:
+            weights = np.ones(tile.shape, dtype=np.float32)
+        w = weights[:rows, :cols]
+        self.total[row_off:row_off + rows, col_off:col_off + cols] += tile[:rows, :cols] * w
+        self.weight[row_off:row_off + rows, col_off:col_off + cols] += w
+
+    def probability(self):
+        """Blended probability, float32 in [0, 1], NaN where no tile was added."""
+        prob = np.full((self.height, self.width), np.nan, dtype=np.float32)
+        covered = self.weight > 0
+        prob[covered] = self.total[covered] / self.weight[covered]
+        return prob
+
+    def covered(self):
+        """True where at least one tile was added."""
+        return self.weight > 0
+
+    def mask(self, threshold=0.5):
+        """Binary uint8 mask (0/255) of the blended probability."""
+        prob = self.probability()
+        return np.where(np.nan_to_num(prob, nan=0.0) >= threshold, 255, 0).astype(np.uint8)
+
+
+def read_mask_tile(mask_path, rows, cols):
+    """Read a grayscale mask tile as float32 in [0, 1], resized to (rows, cols) if needed."""
+    mask = cv2.imread(mask_path, cv2.IMREAD_GRAYSCALE)
+    if mask is None:
+        return None
+    if mask.shape != (rows, cols):
+        mask = cv2.resize(mask, (cols, rows), interpolation=cv2.INTER_LINEAR)
+    return mask.astype(np.float32) / 255.0
+
+
+def scene_grid(records):
+    """(height, width, geotransform, epsg) of the scene covered by tile index records.
+    The origin is recovered from any tile, so the scene raster itself is not needed."""
+    height = max(rec['row_off'] + rec['rows'] for rec in records)
+    width = max(rec['col_off'] + rec['cols'] for rec in records)
+    rec = records[0]
+    x0 = rec['xmin'] - rec['col_off'] * rec['xres']
+    y0 = rec['ymax'] + rec['row_off'] * rec['yres']
+    geotransform = (x0, rec['xres'], 0.0, y0, 0.0, -rec['yres'])
+    return height, width, geotransform, rec['epsg']
+
+
+class SceneMosaicBuilder():
+    """Builds the MaskMosaic of one scene tile by tile, as the tile masks become available
+    (read from files, or straight from the generator outputs).
+
+    Tiles skipped by triage are filled from fill_values (DEFAULT_FILL_VALUES when None, {} to
+    fill none) up front; pending holds the names of the tiles still expected, so the scene is
+    complete once it is empty.
+    """
+
+    def __init__(self, records, overlap=None, manifest=None, fill_values=None):
+        if overlap is None:
+            overlap = infer_overlap(records)
+        height, width, geotransform, epsg = scene_grid(records)
+        self.mosaic = MaskMosaic(height, width, geotransform, epsg)
+        self.overlap = overlap
+        self.records = {rec['tile']: rec for rec in records}
+        self.pending = set()
+        self.found = 0
+        self._weights = {}
+        triage = tile_triage.read_manifest(manifest) if manifest else {}
+        fill_values = DEFAULT_FILL_VALUES if fill_values is None else fill_values
+        for rec in records:
+            row = triage.get(rec['tile'])
+            if row is not None and not row['infer']:
+                if row['reason'] in fill_values:
+                    tile = np.full((rec['rows'], rec['cols']), fill_values[row['reason']], dtype=np.float32)
+                    self._add(rec, tile)
+            else:
+                self.pending.add(rec['tile'])
+
+    @property
+    def complete(self):
+        return not self.pending
+
+    def _add(self, rec, tile):
+        shape = (rec['rows'], rec['cols'])
+        if shape not in self._weights:
+            self._weights[shape] = blend_weights(rec['rows'], rec['cols'], self.overlap)
+        self.mosaic.add(tile, rec['row_off'], rec['col_off'], self._weights[shape])
+
+    def add(self, name, tile):
+        """Add the mask of tile `name`, in [0, 1], resized to the tile's size in the index if needed."""
+        rec = self.records[name]
+        tile = np.asarray(tile, dtype=np.float32)
+        if tile.shape != (rec['rows'], rec['cols']):
+            tile = cv2.resize(tile, (rec['cols'], rec['rows']), interpolation=cv2.INTER_LINEAR)
+        self._add(rec, tile)
+        self.pending.discard(name)
+        self.found += 1
+
+
+def mosaic_from_index(index_csv, mask_dir, overlap=None, suffix=MASK_SUFFIX, manifest=None, fill_values=None):
+    """
+    Blend the mask tiles of one scene into a MaskMosaic.
+    inputs:
+    index_csv: tile index CSV of the scene (str)
+    mask_dir: folder with one mask per tile, named <tile stem><suffix> (str)
+    overlap: tile overlap in pixels used for the blending ramp; inferred from the
+             tile offsets when None (int)
+    suffix: mask file suffix, pix2pix test.py writes <name>_fake_B.png (str)
+    manifest: tile triage manifest CSV; tiles skipped by triage are filled from fill_values (str)
+    fill_values: probability to use for skipped tiles per triage reason, DEFAULT_FILL_VALUES
+                 ({'water': 1.0, 'land': 0.0}) when None; skipped tiles with no fill value stay uncovered (dict)
+    outputs:
+    mosaic: MaskMosaic, or None if no mask tile was found
+    """
+    records = scene_tiler.read_tile_index(index_csv)
+    if not records:
+        return None
+    builder = SceneMosaicBuilder(records, overlap, manifest, fill_values)
+    for rec in records:
+        if rec['tile'] not in builder.pending:
+            continue
+        stem = os.path.splitext(rec['tile'])[0]
+        tile = read_mask_tile(os.path.join(mask_dir, stem + suffix), rec['rows'], rec['cols'])
+        if tile is not None:
+            builder.add(rec['tile'], tile)
+    if builder.found == 0:
+        return None
+    return builder.mosaic
+
+
+def infer_overlap(records):
+    """Tile overlap in pixels from the spacing of the tile origins (0 if a single tile)."""
+    overlaps = [0]
+    for key, size in [('row_off', 'rows'), ('col_off', 'cols')]:
+        offs = sorted({rec[key] for rec in records})
+        if len(offs) > 1:
+            step = min(b - a for a, b in zip(offs[:-1], offs[1:]))
+            overlaps.append(max(records[0][size] - step, 0))
+    return max(overlaps)
+
+
+def pixel_to_map(coords, geotransform):
+    """(N, 2) pixel (col, row) coordinates to map (x, y) coordinates."""
+    x0, xres, xskew, y0, yskew, yres = geotransform
+    coords = np.asarray(coords, dtype=np.float64)
+    x = x0 + coords[:, 0] * xres + coords[:, 1] * xskew
+    y = y0 + coords[:, 0] * yskew + coords[:, 1] * yres
+    return np.column_stack([x, y])
+
+
+def write_mosaic(path, array, geotransform, epsg=None):
+    """Write a mosaic array. .tif goes through rasterio with the scene georeferencing
+    (float probabilities kept as float32); other extensions are written with OpenCV
+    (as uint8) plus a world file."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ['.tif', '.tiff'] and _HAS_RASTERIO:
+        profile = {'driver': 'GTiff', 'height': array.shape[0], 'width': array.shape[1],
+                   'count': 1, 'dtype': array.dtype.name, 'transform': Affine.from_gdal(*geotransform),
+                   'tiled': True, 'blockxsize': 256, 'blockysize': 256, 'compress': 'deflate'}
+        if epsg:
+            profile['crs'] = f'EPSG:{epsg}'
+        if array.dtype.kind == 'f':
+            profile['nodata'] = np.nan
+        with rasterio.open(path, 'w', **profile) as dst:
+            dst.write(array, 1)
+        return path
+    if array.dtype != np.uint8:
+        array = (np.clip(np.nan_to_num(array, nan=0.0), 0, 1) * 255).astype(np.uint8)
+    cv2.imwrite(path, array)
+    scene_tiler.write_world_file(scene_tiler.world_file_path(path), geotransform)
+    return path
@@ -0,0 +1,103 @@
+"""
+Memory-bounded PCA pansharpening (the algorithm of SDS_preprocess.pansharpen).
+- The PCA is fitted on a random subsample of the cloud-free pixels ('subsample')
+  or block by block with sklearn IncrementalPCA ('incremental'), never on every pixel at once
+- Projection, replacement of the 1st PC by the histogram-matched pan band and the inverse
+  transform run one row block at a time into a preallocated float32 output
+- Peak memory is the inputs plus about three float32 single-band arrays, instead of
+  several full float64 (pixels x bands) copies
+"""
+import numpy as np
+import sklearn.decomposition as decomposition
+
+from utils import hist_matching
+
+METHODS = ['subsample', 'incremental']
+
+
+def _blocks(rows, block_rows):
+    for y in range(0, rows, block_rows):
+        yield y, min(y + block_rows, rows)
+
+
+def fit_pca(im_ms, valid, method='subsample', n_samples=200000, block_rows=256, random_state=0):
+    """Fit the PCA of the valid pixels of a (rows, cols, bands) image without a full pixel matrix."""
+    nbands = im_ms.shape[2]
+    if method == 'subsample':
+        rng = np.random.default_rng(random_state)
+        n_valid = int(valid.sum())
+        flat_idx = np.flatnonzero(valid)
+        if n_valid > n_samples:
+            flat_idx = np.sort(rng.choice(flat_idx, n_samples, replace=False))
+        sample = im_ms.reshape(-1, nbands)[flat_idx].astype(np.float64)
+        pca = decomposition.PCA()
+        pca.fit(sample)
+    elif method == 'incremental':
+        pca = decomposition.IncrementalPCA(n_components=nbands)
+        pending = np.empty((0, nbands))
+        for y0, y1 in _blocks(im_ms.shape[0], block_rows):
+            vec = im_ms[y0:y1][valid[y0:y1]].astype(np.float64)
+            pending = np.concatenate([pending, vec]) if len(pending) else vec
+            # IncrementalPCA needs at least n_components samples per batch
+            if len(pending) >= max(nbands, 1024):
+                pca.partial_fit(pending)
+                pending = np.empty((0, nbands))
+        if len(pending) >= nbands:
+            pca.partial_fit(pending)
+        if not hasattr(pca, 'mean_'):
+            raise ValueError(f"incremental PCA needs at least {nbands} valid pixels")
+    else:
+        raise ValueError(f"unknown pansharpening method {method}, expected one of {METHODS}")
+    return pca
+
+
+def pansharpen_blockwise(im_ms, im_pan, cloud_mask, method='subsample', n_samples=200000,
+                         block_rows=256, random_state=0):
+    """
+    Pansharpens a multispectral image, using the panchromatic band and a cloud mask.
+    Same steps as SDS_preprocess.pansharpen (PCA, replace the 1st PC with the pan band
+    histogram-matched to it, invert the PCA) with a bounded-memory fit and apply.
+    inputs:
+    im_ms: multispectral image to pansharpen (rows, cols, bands)
+    im_pan: panchromatic band (rows, cols)
+    cloud_mask: 2D cloud mask with True where cloud pixels are
+    method: 'subsample' or 'incremental' PCA fit (str)
+    n_samples: pixels used to fit the PCA with 'subsample' (int)
+    block_rows: rows per block for the incremental fit and the apply (int)
+    outputs:
+    im_ms_ps: pansharpened image, float32, NaN on cloud pixels (rows, cols, bands)
+    """
+    # check that cloud cover is not too high otherwise pansharpening fails
+    if cloud_mask.sum() > 0.95*cloud_mask.shape[0]*cloud_mask.shape[1]:
+        return im_ms
+
+    valid = ~cloud_mask
+    # fewer valid pixels than bands leave no principal components to replace
+    if valid.sum() < im_ms.shape[2]:
+        return im_ms
+    pca = fit_pca(im_ms, valid, method, n_samples, block_rows, random_state)
+    mean = pca.mean_.astype(np.float32)
+    components = pca.components_.astype(np.float32)
+
+    # 1st PC of every valid pixel, the template for the pan band histogram
+    pc1 = np.full(cloud_mask.shape, np.nan, dtype=np.float32)
+    for y0, y1 in _blocks(im_ms.shape[0], block_rows):
+        vec = im_ms[y0:y1].astype(np.float32) - mean
+        pc1[y0:y1] = vec @ components[0]
+    matcher = hist_matching.HistogramMatcher(pc1[valid][:, np.newaxis])
+
+    # pan band matched to the 1st PC, reusing the pc1 buffer
+    pan_matched = pc1
+    pan_matched[valid] = matcher.match_band(im_pan[valid], 0)
+
+    im_ms_ps = np.full(im_ms.shape, np.nan, dtype=np.float32)
+    for y0, y1 in _blocks(im_ms.shape[0], block_rows):
+        block_valid = valid[y0:y1]
+        vec = im_ms[y0:y1][block_valid].astype(np.float32)
+        vec -= mean
+        vec_pcs = vec @ components.T
+        # replace 1st PC with pan band (after matching histograms)
+        vec_pcs[:, 0] = pan_matched[y0:y1][block_valid]
+        out = im_ms_ps[y0:y1]
+        out[block_valid] = vec_pcs @ components + mean
+    return im_ms_ps
@@ -0,0 +1,107 @@
+"""
+Process-pool helpers for the preprocessing scripts.
+- A task is a (name, func, args) tuple; func must be a module-level function so it can be pickled
+- Results come back in submission order, whatever order the workers finish in
+- Every task is timed inside its worker and failures are reported instead of raised
+"""
+import os
+import csv
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# keep numpy/OpenCV from starting one thread per core inside every worker
+_THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']
+
+
+def default_jobs():
+    """Number of worker processes to use when none is given."""
+    return os.cpu_count() or 1
+
+
+def _init_worker(initializer, initargs):
+    for var in _THREAD_ENV_VARS:
+        os.environ[var] = '1'
+    try:
+        import cv2
+        cv2.setNumThreads(1)
+    except Exception:
+        pass
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _timed_call(func, args):
+    start = time.perf_counter()
+    try:
+        result = func(*args)
+        error = None
+    except Exception as e:
+        result = None
+        error = f'{type(e).__name__}: {e}'
+    return result, time.perf_counter() - start, error
+
+
+def run_tasks(tasks, jobs=1, initializer=None, initargs=()):
+    """
+    Run tasks on a process pool.
+    inputs:
+    tasks: list of (name, func, args) tuples
+    jobs: number of worker processes, <= 1 runs everything in this process (int)
+    initializer: optional function run once in each worker
+    initargs: arguments for initializer (tuple)
+    outputs:
+    timings: one dict per task with keys name, result, seconds, error, in task order (list)
+    """
+    tasks = list(tasks)
+    if jobs is None:
+        jobs = default_jobs()
+    jobs = min(jobs, len(tasks)) if tasks else 1
+
+    if jobs <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        outcomes = [_timed_call(func, args) for name, func, args in tasks]
+    else:
+        saved = {var: os.environ.get(var) for var in _THREAD_ENV_VARS}
+        # spawned workers (Windows) pick the limits up from the environment at import time
+        for var in _THREAD_ENV_VARS:
+            os.environ[var] = '1'
+        try:
+            with ProcessPoolExecutor(max_workers=jobs,
+                                     initializer=_init_worker,
+                                     initargs=(initializer, initargs)) as pool:
+                futures = [pool.submit(_timed_call, func, args) for name, func, args in tasks]
+                outcomes = [f.result() for f in futures]
+        finally:
+            for var, value in saved.items():
+                if value is None:
+                    os.environ.pop(var, None)
+                else:
+                    os.environ[var] = value
+
+    timings = []
+    for (name, func, args), (result, seconds, error) in zip(tasks, outcomes):
+        timings.append({'name': name, 'result': result, 'seconds': seconds, 'error': error})
+    return timings
+
+
+def print_timings(timings, title='Tasks'):
+    """Print a per-task timing summary."""
+    total = sum(t['seconds'] for t in timings)
+    failed = [t for t in timings if t['error']]
+    print(f"{title}: {len(timings)} tasks, {total:.1f} s of task time, {len(failed)} failed")
+    for t in timings:
+        status = 'ERROR ' + t['error'] if t['error'] else 'ok'
+        print(f"  {t['seconds']:8.2f} s  {t['name']}  {status}")
+
+
+def write_timings(timings, path):
+    """Append per-task timings to a CSV (name, seconds, error)."""
+    new_file = not os.path.exists(path)
+    with open(path, 'a', newline='') as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(['name', 'seconds', 'error'])
+        for t in timings:
+            writer.writerow([t['name'], '%.4f' % t['seconds'], t['error'] or ''])
+    return path
@@ -0,0 +1,89 @@
+"""
+Cache of CoastSat preprocessed scene products (the SDS_preprocess.preprocess_single outputs).
+- save_jpg, extract_shorelines and get_reference_sl all preprocess the same images; with the cache
+  the cloud masking and pansharpening run once per image and settings
+- Entries are compressed .npz files in <filepath>/<sitename>/preprocessed_cache/, named by a key hashing
+  the input files (path, size, mtime), the satellite, the preprocessing settings and PREPROCESS_VERSION
+- The cache is bounded: after each save the least recently used entries are removed until the
+  directory holds at most MAX_BYTES (see prune)
+"""
+import os
+import json
+import hashlib
+import numpy as np
+
+CACHE_DIR = 'preprocessed_cache'
+PRODUCTS = ['im_ms', 'georef', 'cloud_mask', 'im_extra', 'im_QA', 'im_nodata']
+MAX_BYTES = 20 * 2**30
+
+# bump when preprocess_single output changes for the same inputs and settings
+PREPROCESS_VERSION = 1
+
+
+def cache_dir(settings):
+    return os.path.join(settings['inputs']['filepath'], settings['inputs']['sitename'], CACHE_DIR)
+
+
+def cache_key(fn, satname, params):
+    """Key of one preprocessed scene.
+    fn: input file(s) of the scene (str or list)
+    params: preprocessing settings (dict, JSON serializable)
+    """
+    files = [fn] if isinstance(fn, str) else list(fn)
+    stamps = []
+    for path in files:
+        st = os.stat(path)
+        stamps.append([os.path.abspath(path), st.st_size, st.st_mtime_ns])
+    payload = json.dumps({'files': stamps,
+                          'satname': satname,
+                          'params': params,
+                          'version': PREPROCESS_VERSION}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def entry_path(settings, key):
+    return os.path.join(cache_dir(settings), key + '.npz')
+
+
+def load(path):
+    """Products tuple of a cache entry, or None on a miss; empty products come back as []."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            products = tuple(data[name] if data[name].size else [] for name in PRODUCTS)
+    except Exception:
+        print(f"Ignoring unreadable preprocessing cache entry {path}")
+        return None
+    # mark the entry as recently used for prune
+    os.utime(path)
+    return products
+
+
+def save(path, products):
+    """Store a products tuple (im_ms, georef, cloud_mask, im_extra, im_QA, im_nodata)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(f, **{name: np.asarray(value) for name, value in zip(PRODUCTS, products)})
+    os.replace(tmp, path)
+    return path
+
+
+def prune(directory, max_bytes=MAX_BYTES):
+    """Remove the least recently used entries of a cache directory until it holds at most
+    max_bytes; returns the removed paths."""
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith('.npz'):
+            st = os.stat(os.path.join(directory, name))
+            entries.append((st.st_mtime_ns, st.st_size, os.path.join(directory, name)))
+    total = sum(size for _, size, _ in entries)
+    removed = []
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+        removed.append(path)
+    return removed
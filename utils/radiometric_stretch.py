@@ -0,0 +1,276 @@
+"""
+Shared percentile stretch to uint8 for JPEG/tiling outputs.
+- Percentiles come from single-pass streaming histograms, one per band, fed block by block
+  (from an array, from windowed reads of a GeoTIFF, or from several scenes to stretch a stack consistently)
+- Integer data keeps one bin per value, so percentiles match np.percentile exactly while the range
+  fits in max_bins; wider or float data falls back to adaptive fixed-width bins
+- The stretch is applied block by block into a preallocated uint8 output, never a full float copy
+"""
+import numpy as np
+
+DEFAULT_BINS = 65536
+DEFAULT_BLOCK = 512
+
+
+class StreamingHistogram():
+    """Histogram that grows with the data range, built in a single pass over blocks.
+
+    Bins have width `width` starting at `lo`. When a block falls outside the current
+    range, neighbouring bins are merged by a power of two so the bin count stays
+    below max_bins and earlier blocks never need to be revisited.
+    Float blocks holding a single value (e.g. a zero-filled nodata border) say nothing
+    about the bin width: they are kept as a point mass until a block with a spread arrives.
+    """
+
+    def __init__(self, max_bins=DEFAULT_BINS):
+        self.max_bins = int(max_bins)
+        self.lo = None
+        self.width = None
+        self.counts = None
+        self.integer = True
+        self.point = None  # [value, count] of constant float data seen before any bins exist
+
+    @property
+    def total(self):
+        if self.point is not None:
+            return self.point[1]
+        return 0 if self.counts is None else int(self.counts.sum())
+
+    def _start(self, vmin, vmax, integer):
+        self.integer = integer
+        if integer:
+            self.lo = float(vmin)
+            self.width = 1.0
+            span = vmax - vmin + 1
+            if span > self.max_bins:
+                self.width = float(2 ** int(np.ceil(np.log2(span / float(self.max_bins)))))
+        else:
+            self.lo = float(vmin)
+            self.width = (vmax - vmin) / float(self.max_bins - 1) if vmax > vmin else 1.0
+        n = int(np.floor((vmax - self.lo) / self.width)) + 1
+        self.counts = np.zeros(n, dtype=np.int64)
+
+    def _grow(self, i_min, i_max):
+        """Extend the bins to cover old bin numbers i_min..i_max (may be outside 0..n-1)."""
+        n = len(self.counts)
+        lo_i = min(i_min, 0)
+        hi_i = max(i_max, n - 1)
+        f = 1
+        while (hi_i // f) - (lo_i // f) + 1 > self.max_bins:
+            f *= 2
+        first = lo_i // f
+        new_n = (hi_i // f) - first + 1
+        if f == 1:
+            counts = np.zeros(new_n, dtype=np.int64)
+            counts[-first:-first + n] = self.counts
+        else:
+            old = np.arange(n) // f - first
+            counts = np.bincount(old, weights=self.counts, minlength=new_n).astype(np.int64)
+        self.lo = self.lo + first * f * self.width
+        self.width = self.width * f
+        self.counts = counts
+
+    def update(self, values):
+        """Add the finite values of an array of any shape."""
+        values = np.asarray(values).ravel()
+        if values.dtype.kind not in 'iub':
+            values = values[np.isfinite(values)]
+        if values.size == 0:
+            return self
+        vmin, vmax = values.min(), values.max()
+        integer = values.dtype.kind in 'iub'
+        if self.counts is None and self.point is None and not integer and vmin == vmax:
+            self.integer = False
+            self.point = [float(vmin), int(values.size)]
+            return self
+        if self.point is not None:
+            value, count = self.point
+            if vmin == vmax == value:
+                self.point[1] += int(values.size)
+                return self
+            # the first block with a spread fixes the bins, the point mass goes into its bin
+            self.point = None
+            self._start(min(float(vmin), value), max(float(vmax), value), False)
+            self.counts[min(int(np.floor((value - self.lo) / self.width)), len(self.counts) - 1)] += count
+        elif self.counts is None:
+            self._start(vmin, vmax, integer)
+        i_min = int(np.floor((float(vmin) - self.lo) / self.width))
+        i_max = int(np.floor((float(vmax) - self.lo) / self.width))
+        if i_min < 0 or i_max >= len(self.counts):
+            self._grow(i_min, i_max)
+        idx = np.subtract(values, self.lo, dtype=np.float64)
+        idx /= self.width
+        idx = np.clip(np.floor(idx), 0, len(self.counts) - 1).astype(np.intp)
+        self.counts += np.bincount(idx, minlength=len(self.counts))
+        return self
+
+    def percentile(self, q):
+        """Approximate np.percentile (linear interpolation between order statistics).
+        Exact while the histogram holds integer data with one bin per value."""
+        total = self.total
+        if total == 0:
+            return 0.0
+        if self.point is not None:
+            return self.point[0]
+        cum = np.cumsum(self.counts)
+        exact = self.integer and self.width == 1.0
+
+        def order_stat(k):
+            i = int(np.searchsorted(cum, k, side='right'))
+            if exact:
+                return self.lo + i
+            before = cum[i - 1] if i > 0 else 0
+            frac = (k - before + 0.5) / self.counts[i]
+            return self.lo + (i + frac) * self.width
+
+        rank = q / 100.0 * (total - 1)
+        k = int(np.floor(rank))
+        v0 = order_stat(k)
+        if rank == k or k + 1 >= total:
+            return float(v0)
+        v1 = order_stat(k + 1)
+        return float(v0 + (rank - k) * (v1 - v0))
+
+
+def _row_blocks(rows, block_rows):
+    for y in range(0, rows, block_rows):
+        yield y, min(y + block_rows, rows)
+
+
+def _clean(block, nan_to_zero):
+    """Non-finite values as 0 (the behaviour of scale_to_uint8), or dropped."""
+    if block.dtype.kind in 'iub':
+        return block
+    if nan_to_zero:
+        return np.nan_to_num(block, nan=0.0, posinf=0.0, neginf=0.0)
+    return block
+
+
+def array_histograms(im, hists=None, mask=None, nan_to_zero=True, block_rows=DEFAULT_BLOCK):
+    """Per-band streaming histograms of a (rows, cols) or (rows, cols, bands) array.
+    mask: optional 2D array, True for pixels to leave out (e.g. a cloud mask)
+    hists: histograms to add to, to accumulate several scenes into one stack"""
+    im = np.asarray(im)
+    nbands = 1 if im.ndim == 2 else im.shape[2]
+    if hists is None:
+        hists = [StreamingHistogram() for b in range(nbands)]
+    for y0, y1 in _row_blocks(im.shape[0], block_rows):
+        keep = None if mask is None else ~mask[y0:y1]
+        for b in range(nbands):
+            block = im[y0:y1] if im.ndim == 2 else im[y0:y1, :, b]
+            block = _clean(block, nan_to_zero)
+            hists[b].update(block if keep is None else block[keep])
+    return hists
+
+
+def raster_histograms(rasters, bands, hists=None, nan_to_zero=True, window=DEFAULT_BLOCK):
+    """Per-band streaming histograms over one or more open WindowedRasters,
+    read in window x window blocks so memory does not depend on scene size.
+    Passing several rasters gives one stretch for the whole stack (e.g. all years)."""
+    bands = list(bands)
+    if hists is None:
+        hists = [StreamingHistogram() for b in bands]
+    for raster in rasters:
+        for y in range(0, raster.height, window):
+            rows = min(window, raster.height - y)
+            for x in range(0, raster.width, window):
+                cols = min(window, raster.width - x)
+                block = raster.read(bands, y, x, rows, cols)
+                for i in range(len(bands)):
+                    hists[i].update(_clean(block[i], nan_to_zero))
+    return hists
+
+
+def stretch_limits(hists, percentiles=(2, 98)):
+    """(low, high) per band from streaming histograms."""
+    return [(h.percentile(percentiles[0]), h.percentile(percentiles[1])) for h in hists]
+
+
+def apply_stretch(block, limits, out=None):
+    """Linearly map a (rows, cols) or (rows, cols, bands) block to uint8 with per-band limits.
+    Values below/above the limits clip to 0/255, bands with no spread become 0."""
+    block = np.asarray(block)
+    squeeze = block.ndim == 2
+    if squeeze:
+        block = block[:, :, np.newaxis]
+    if out is None:
+        out = np.empty(block.shape, dtype='uint8')
+    out3 = out[:, :, np.newaxis] if out.ndim == 2 else out
+    for b, (lo, hi) in enumerate(limits):
+        if hi - lo <= 0:
+            out3[:, :, b] = 0
+            continue
+        band = np.nan_to_num(block[:, :, b].astype('float32'), nan=0.0, posinf=0.0, neginf=0.0)
+        band -= lo
+        band *= 255.0 / (hi - lo)
+        np.clip(band, 0, 255, out=band)
+        out3[:, :, b] = band
+    return out
+
+
+def apply_stretch_float(block, limits, out=None):
+    """Linearly map a (rows, cols) or (rows, cols, bands) block to float32 in [0, 1] with per-band limits,
+    like apply_stretch without the quantization to uint8."""
+    block = np.asarray(block)
+    squeeze = block.ndim == 2
+    if squeeze:
+        block = block[:, :, np.newaxis]
+    if out is None:
+        out = np.empty(block.shape, dtype='float32')
+    out3 = out[:, :, np.newaxis] if out.ndim == 2 else out
+    for b, (lo, hi) in enumerate(limits):
+        if hi - lo <= 0:
+            out3[:, :, b] = 0
+            continue
+        band = np.nan_to_num(block[:, :, b].astype('float32'), nan=0.0, posinf=0.0, neginf=0.0)
+        band -= lo
+        band *= 1.0 / (hi - lo)
+        np.clip(band, 0, 1, out=band)
+        out3[:, :, b] = band
+    return out
+
+
+def stretch_to_uint8(im, percentiles=(2, 98), limits=None, out=None, block_rows=DEFAULT_BLOCK):
+    """Percentile stretch a (rows, cols[, bands]) array to uint8, one row block at a time.
+    limits: precomputed per-band limits, e.g. shared by all scenes of a stack"""
+    im = np.asarray(im)
+    if limits is None:
+        limits = stretch_limits(array_histograms(im, block_rows=block_rows), percentiles)
+    if out is None:
+        out = np.empty(im.shape, dtype='uint8')
+    for y0, y1 in _row_blocks(im.shape[0], block_rows):
+        apply_stretch(im[y0:y1], limits, out[y0:y1])
+    return out
+
+
+def scale_to_uint8(data, percentiles=(2, 98)):
+    """Normalize data to 0-255 uint8 range with a 2-98 percentile stretch
+    (NaN and infinities count as 0), as previously done in the preprocessing scripts."""
+    data = np.asarray(data)
+    if data.size == 0:
+        return np.zeros_like(data, dtype='uint8')
+    if data.ndim == 1:
+        return stretch_to_uint8(data[:, np.newaxis], percentiles)[:, 0]
+    return stretch_to_uint8(data, percentiles)
+
+
+def rescale_image_intensity(im, cloud_mask, prob_high, block_rows=DEFAULT_BLOCK):
+    """Histogram-based equivalent of SDS_preprocess.rescale_image_intensity:
+    stretch [0, prob_high percentile of the cloud-free pixels] to [0, 1] per band,
+    float32 output with NaN on cloud pixels."""
+    im = np.asarray(im)
+    squeeze = im.ndim == 2
+    if squeeze:
+        im = im[:, :, np.newaxis]
+    hists = array_histograms(im, mask=cloud_mask, nan_to_zero=False, block_rows=block_rows)
+    highs = [h.percentile(prob_high) for h in hists]
+    out = np.empty(im.shape, dtype='float32')
+    for y0, y1 in _row_blocks(im.shape[0], block_rows):
+        for b, high in enumerate(highs):
+            band = out[y0:y1, :, b]
+            band[...] = im[y0:y1, :, b]
+            if high > 0:
+                band /= high
+            np.clip(band, 0, 1, out=band)
+        out[y0:y1][cloud_mask[y0:y1]] = np.nan
+    return out[:, :, 0] if squeeze else out
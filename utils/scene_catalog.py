@@ -0,0 +1,209 @@
+"""
+Scene metadata catalog in an embedded SQLite database (data/scene_catalog.sqlite).
+- One row per scene: path, site, year/date, sensor, footprint bbox (scene CRS and lon/lat), CRS,
+  cloud fraction, sha256 checksum and processing status
+- Indexed queries such as "scenes intersecting this bbox between two dates with cloud < X",
+  so stages select their inputs without globbing data/Mombasa_* and parsing file names
+- Footprints are read from the raster header only (scene_tiler.WindowedRaster), checksums reuse
+  harmonize_cache.file_digest
+"""
+import os
+import re
+import time
+import sqlite3
+
+from utils import harmonize_cache
+from utils import scene_tiler
+
+try:
+    from rasterio.warp import transform_bounds
+    _HAS_RASTERIO = True
+except Exception:
+    _HAS_RASTERIO = False
+
+CATALOG_NAME = 'scene_catalog.sqlite'
+COLUMNS = ['path', 'site', 'year', 'date', 'sensor', 'xmin', 'ymin', 'xmax', 'ymax', 'epsg', 'crs',
+           'lon_min', 'lat_min', 'lon_max', 'lat_max', 'cols', 'rows', 'cloud_fraction', 'checksum',
+           'status', 'updated']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenes (
+    path TEXT PRIMARY KEY,
+    site TEXT,
+    year INTEGER,
+    date TEXT,
+    sensor TEXT,
+    xmin REAL, ymin REAL, xmax REAL, ymax REAL,
+    epsg INTEGER,
+    crs TEXT,
+    lon_min REAL, lat_min REAL, lon_max REAL, lat_max REAL,
+    cols INTEGER,
+    rows INTEGER,
+    cloud_fraction REAL,
+    checksum TEXT,
+    status TEXT,
+    updated TEXT
+);
+CREATE INDEX IF NOT EXISTS scenes_site_year ON scenes (site, year);
+CREATE INDEX IF NOT EXISTS scenes_date ON scenes (date);
+CREATE INDEX IF NOT EXISTS scenes_lon ON scenes (lon_min, lon_max);
+CREATE INDEX IF NOT EXISTS scenes_status ON scenes (status);
+"""
+
+_DATE = re.compile(r'(?P<year>(19|20)\d{2})-(?P<month>\d{2})-(?P<day>\d{2})')
+_YEAR = re.compile(r'(?<!\d)(?P<year>(19|20)\d{2})(?!\d)')
+_SENSOR = re.compile(r'(?<![A-Za-z0-9])(?P<sensor>L[5789]|S2)(?![A-Za-z0-9])')
+
+
+def catalog_path(base='data'):
+    return os.path.join(base, CATALOG_NAME)
+
+
+def scene_date(path):
+    """(date 'YYYY-MM-DD' or None, year or None) from a scene file name,
+    e.g. 2014-01-02-07-23-45_L8_site_ms.tif or mombasa_1994_RGB.tif"""
+    name = os.path.basename(path)
+    m = _DATE.search(name)
+    if m:
+        return m.group(0), int(m.group('year'))
+    m = _YEAR.search(name)
+    if m:
+        return None, int(m.group('year'))
+    return None, None
+
+
+def scene_sensor(path):
+    """Sensor (L5, L7, L8, L9, S2) from the file name or folder, None for e.g. GEE RGB exports."""
+    for part in [os.path.basename(path)] + path.replace('\\', '/').split('/')[::-1][1:]:
+        m = _SENSOR.search(part.replace('_', ' '))
+        if m:
+            return m.group('sensor')
+    return None
+
+
+def scene_footprint(path):
+    """Header metadata of a raster: bounds in its CRS, EPSG, CRS WKT, lon/lat bounds and size."""
+    with scene_tiler.WindowedRaster(path) as raster:
+        gt = raster.geotransform
+        xs = [gt[0], gt[0] + raster.width * gt[1]]
+        ys = [gt[3], gt[3] + raster.height * gt[5]]
+        info = {'xmin': min(xs), 'ymin': min(ys), 'xmax': max(xs), 'ymax': max(ys),
+                'epsg': raster.epsg, 'crs': raster.projection,
+                'cols': raster.width, 'rows': raster.height,
+                'lon_min': None, 'lat_min': None, 'lon_max': None, 'lat_max': None}
+    if _HAS_RASTERIO and info['crs']:
+        lonlat = transform_bounds(info['crs'], 'EPSG:4326',
+                                  info['xmin'], info['ymin'], info['xmax'], info['ymax'])
+        info.update(zip(['lon_min', 'lat_min', 'lon_max', 'lat_max'], lonlat))
+    return info
+
+
+class SceneCatalog():
+    """SQLite scene catalog; also usable as a context manager.
+
+    rows are returned as dicts with the COLUMNS keys.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or catalog_path()
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._db = sqlite3.connect(self.path)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, path, **fields):
+        """Insert or update the row of a scene; fields are COLUMNS values."""
+        row = {key: fields.get(key) for key in COLUMNS}
+        row['path'] = path
+        row['updated'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        with self._db:
+            self._db.execute(f"INSERT OR REPLACE INTO scenes ({', '.join(COLUMNS)}) "
+                             f"VALUES ({', '.join(':' + c for c in COLUMNS)})", row)
+        return row
+
+    def register(self, path, site=None, status='ingested', cloud_fraction=None, checksum=True,
+                 sensor=None, date=None):
+        """
+        Add a scene from its file: footprint from the raster header, date and sensor from the
+        file name unless given, sha256 checksum when checksum is True.
+        outputs:
+        row: the catalog row (dict)
+        """
+        fields = scene_footprint(path)
+        file_date, year = scene_date(path)
+        if checksum is True:
+            checksum = harmonize_cache.file_digest(path)
+        fields.update({'site': site,
+                       'year': int(date[:4]) if date else year,
+                       'date': date or file_date,
+                       'sensor': sensor or scene_sensor(path),
+                       'cloud_fraction': cloud_fraction,
+                       'checksum': checksum or None,
+                       'status': status})
+        return self.add(path, **fields)
+
+    def set_status(self, path, status):
+        with self._db:
+            self._db.execute("UPDATE scenes SET status = ?, updated = ? WHERE path = ?",
+                             (status, time.strftime('%Y-%m-%dT%H:%M:%S'), path))
+
+    def get(self, path):
+        row = self._db.execute("SELECT * FROM scenes WHERE path = ?", (path,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def query(self, bbox=None, epsg=None, start=None, end=None, years=None, max_cloud=None,
+              site=None, sensor=None, status=None):
+        """
+        Scenes matching all the given filters, ordered by date/year and path.
+        inputs:
+        bbox: (xmin, ymin, xmax, ymax) the footprint must intersect; lon/lat unless epsg is given (tuple)
+        epsg: EPSG code of bbox; only scenes in that CRS are matched (int)
+        start, end: inclusive 'YYYY-MM-DD' dates; scenes with a year only are compared by year (str)
+        years: list of years (list)
+        max_cloud: keep scenes with cloud_fraction < max_cloud; unknown cloud fractions are kept (float)
+        site, sensor, status: exact matches, or lists of allowed values
+        outputs:
+        rows: list of dicts
+        """
+        where = []
+        args = []
+        if bbox is not None:
+            if epsg is None:
+                cols = ('lon_min', 'lat_min', 'lon_max', 'lat_max')
+            else:
+                cols = ('xmin', 'ymin', 'xmax', 'ymax')
+                where.append('epsg = ?')
+                args.append(epsg)
+            where.append(f'{cols[0]} <= ? AND {cols[2]} >= ? AND {cols[1]} <= ? AND {cols[3]} >= ?')
+            args.extend([bbox[2], bbox[0], bbox[3], bbox[1]])
+        if start is not None:
+            where.append('(date >= ? OR (date IS NULL AND year >= ?))')
+            args.extend([start, int(start[:4])])
+        if end is not None:
+            where.append('(date <= ? OR (date IS NULL AND year <= ?))')
+            args.extend([end, int(end[:4])])
+        if max_cloud is not None:
+            where.append('(cloud_fraction IS NULL OR cloud_fraction < ?)')
+            args.append(max_cloud)
+        for column, value in [('year', years), ('site', site), ('sensor', sensor), ('status', status)]:
+            if value is None:
+                continue
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            where.append(f"{column} IN ({', '.join('?' * len(values))})")
+            args.extend(values)
+        sql = 'SELECT * FROM scenes'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY COALESCE(date, CAST(year AS TEXT)), path'
+        return [dict(row) for row in self._db.execute(sql, args)]
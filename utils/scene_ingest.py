@@ -0,0 +1,170 @@
+"""
+Checksummed, resumable scene ingest.
+- Sources are hashed (sha256) on a thread pool; hashlib releases the GIL, so hashing runs in parallel
+- Files already at the destination with the same checksum are not copied again, and files whose source
+  and destination are unchanged (size, mtime) since the last recorded ingest are not even re-hashed,
+  so re-running over an unchanged archive only stats the files
+- Copies are streamed to <dest>.part on a thread pool, verified against the source checksum and renamed
+  into place, so an interrupted ingest never leaves a truncated file under the final name
+- Every finished file is appended to a JSON-lines manifest (data/ingest_manifest.jsonl); a rerun
+  resumes from it, the last record of a destination wins
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import harmonize_cache
+
+MANIFEST_NAME = 'ingest_manifest.jsonl'
+PART_SUFFIX = '.part'
+
+_CHUNK = 1 << 20
+
+
+def manifest_path(base='data'):
+    return os.path.join(base, MANIFEST_NAME)
+
+
+def default_jobs():
+    return min(32, (os.cpu_count() or 1) * 2)
+
+
+def load_manifest(path):
+    """Last manifest record of every destination; unreadable (e.g. half-written) lines are ignored."""
+    state = {}
+    if not os.path.exists(path):
+        return state
+    with open(path) as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            state[rec['dest']] = rec
+    return state
+
+
+class ManifestWriter():
+    """Append-only, thread-safe manifest writer; every record is flushed as soon as it is written."""
+
+    def __init__(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._f = open(path, 'a')
+        self._lock = threading.Lock()
+
+    def write(self, rec):
+        with self._lock:
+            self._f.write(json.dumps(rec, sort_keys=True) + '\n')
+            self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def unchanged(rec, src, dest):
+    """True if src and dest still have the size and mtime recorded at their last ingest."""
+    if rec is None or rec.get('status') == 'failed' or not os.path.exists(dest) or not os.path.exists(src):
+        return False
+    return (list(_stamp(src)) == [rec['size'], rec['src_mtime']] and
+            list(_stamp(dest)) == [rec['size'], rec['dest_mtime']])
+
+
+def copy_verified(src, dest, sha256):
+    """Copy src to dest through dest.part, hashing the bytes written; raises IOError on a mismatch."""
+    os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+    part = dest + PART_SUFFIX
+    h = hashlib.sha256()
+    with open(src, 'rb') as fin, open(part, 'wb') as fout:
+        for chunk in iter(lambda: fin.read(_CHUNK), b''):
+            h.update(chunk)
+            fout.write(chunk)
+    if h.hexdigest() != sha256:
+        os.remove(part)
+        raise IOError(f"checksum mismatch copying {src}")
+    shutil.copystat(src, part)
+    os.replace(part, dest)
+
+
+def _rename(src, dest):
+    """Move src to dest by renaming it; False when they are on different file systems."""
+    os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+    try:
+        os.replace(src, dest)
+    except OSError:
+        return False
+    return True
+
+
+def ingest_files(pairs, manifest=None, jobs=None, move=False):
+    """
+    Copy (or move) source files to their destinations, skipping files already in place.
+    inputs:
+    pairs: (src, dest) paths (list)
+    manifest: manifest path, defaults to data/ingest_manifest.jsonl (str)
+    jobs: hashing/copy threads (int)
+    move: remove the source once its destination is verified (bool)
+    outputs:
+    records: one dict per pair with src, dest, size, src_mtime, dest_mtime, sha256 and status
+             'unchanged' (nothing re-read), 'skipped' (same checksum), 'copied' or 'failed' (list)
+    """
+    manifest = manifest or manifest_path()
+    jobs = jobs or default_jobs()
+    state = load_manifest(manifest)
+    writer = ManifestWriter(manifest)
+    records = [None] * len(pairs)
+
+    def finish(i, src, dest, sha256, status, error=None):
+        size, src_mtime = _stamp(src) if os.path.exists(src) else (None, None)
+        dest_mtime = None
+        if os.path.exists(dest):
+            size, dest_mtime = _stamp(dest)
+        rec = {'src': src, 'dest': dest, 'size': size, 'src_mtime': src_mtime, 'dest_mtime': dest_mtime,
+               'sha256': sha256, 'status': status, 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        if error:
+            rec['error'] = error
+        if status != 'unchanged':
+            writer.write(rec)
+        records[i] = rec
+
+    def process(i):
+        src, dest = pairs[i]
+        try:
+            sha256 = harmonize_cache.file_digest(src)
+            if os.path.exists(dest) and os.path.getsize(dest) == os.path.getsize(src) \
+                    and harmonize_cache.file_digest(dest) == sha256:
+                status = 'skipped'
+            elif move and _rename(src, dest):
+                status = 'copied'
+            else:
+                copy_verified(src, dest, sha256)
+                status = 'copied'
+            if move and os.path.exists(src):
+                os.remove(src)
+            finish(i, src, dest, sha256, status)
+        except Exception as e:
+            finish(i, src, dest, None, 'failed', f'{type(e).__name__}: {e}')
+
+    try:
+        todo = []
+        for i, (src, dest) in enumerate(pairs):
+            rec = state.get(dest)
+            if unchanged(rec, src, dest) and rec['src'] == src:
+                finish(i, src, dest, rec['sha256'], 'unchanged')
+            else:
+                todo.append(i)
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            list(pool.map(process, todo))
+    finally:
+        writer.close()
+    return records
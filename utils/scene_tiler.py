@@ -0,0 +1,278 @@
+"""
+Windowed, block-streaming scene tiler for pix2pix_ready generation.
+- Reads GeoTIFFs one tile window at a time (rasterio, falls back to GDAL), never the full scene
+- Stretch limits come from streaming histograms read window by window, so peak memory depends on tile size only
+- Writes a world file (.jgw) next to every tile and a per-scene tile index CSV
+  with the same columns as the site metadata CSVs (xmin, ymin, xmax, ymax, xres, yres, epsg, cols, rows)
+"""
+import os
+import csv
+import numpy as np
+import cv2
+
+from utils import radiometric_stretch
+
+try:
+    import rasterio
+    from rasterio.windows import Window
+    _HAS_RASTERIO = True
+except Exception:
+    _HAS_RASTERIO = False
+
+TILE_INDEX_COLUMNS = ['tile', 'scene', 'row_off', 'col_off',
+                      'xmin', 'ymin', 'xmax', 'ymax', 'xres', 'yres', 'epsg', 'cols', 'rows']
+
+
+class WindowedRaster():
+    """Read-only raster handle that only ever reads pixel windows.
+
+    Uses rasterio when available, else GDAL. Geotransforms follow the GDAL
+    ordering used everywhere else in the repo (x0, xres, xskew, y0, yskew, yres).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if _HAS_RASTERIO:
+            self._src = rasterio.open(path)
+            self.width = self._src.width
+            self.height = self._src.height
+            self.count = self._src.count
+            self.dtype = np.dtype(self._src.dtypes[0])
+            self.geotransform = tuple(self._src.transform.to_gdal())
+            crs = self._src.crs
+            self.projection = crs.to_wkt() if crs else ''
+            self.epsg = crs.to_epsg() if crs else None
+            self.nodata = self._src.nodata
+        else:
+            from osgeo import gdal, gdal_array, osr
+            self._src = gdal.Open(path)
+            if self._src is None:
+                raise IOError(f"Could not open {path}")
+            self.width = self._src.RasterXSize
+            self.height = self._src.RasterYSize
+            self.count = self._src.RasterCount
+            band = self._src.GetRasterBand(1)
+            self.dtype = np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(band.DataType))
+            self.geotransform = tuple(self._src.GetGeoTransform())
+            self.projection = self._src.GetProjection()
+            srs = osr.SpatialReference(wkt=self.projection) if self.projection else None
+            epsg = srs.GetAttrValue('AUTHORITY', 1) if srs else None
+            self.epsg = int(epsg) if epsg else None
+            self.nodata = band.GetNoDataValue()
+
+    def read(self, bands, row_off, col_off, rows, cols, out=None):
+        """Read a (rows, cols) window of the given 1-based bands.
+        Returns a (len(bands), rows, cols) array; pass out to reuse a buffer."""
+        bands = list(bands)
+        if out is None:
+            out = np.empty((len(bands), rows, cols), dtype=self.dtype)
+        if _HAS_RASTERIO:
+            self._src.read(indexes=bands, window=Window(col_off, row_off, cols, rows), out=out)
+        else:
+            for i, b in enumerate(bands):
+                self._src.GetRasterBand(b).ReadAsArray(col_off, row_off, cols, rows, buf_obj=out[i])
+        return out
+
+    def read_decimated(self, bands, max_size=1024):
+        """Read the whole extent of the given bands resampled so the longest side is <= max_size."""
+        bands = list(bands)
+        factor = max(1, int(np.ceil(max(self.width, self.height) / float(max_size))))
+        out_rows = max(1, self.height // factor)
+        out_cols = max(1, self.width // factor)
+        if _HAS_RASTERIO:
+            return self._src.read(indexes=bands, out_shape=(len(bands), out_rows, out_cols))
+        out = np.empty((len(bands), out_rows, out_cols), dtype=self.dtype)
+        for i, b in enumerate(bands):
+            self._src.GetRasterBand(b).ReadAsArray(0, 0, self.width, self.height,
+                                                   buf_xsize=out_cols, buf_ysize=out_rows,
+                                                   buf_obj=out[i])
+        return out
+
+    def window_geotransform(self, row_off, col_off):
+        """Geotransform of the window whose upper-left pixel is (row_off, col_off)."""
+        x0, xres, xskew, y0, yskew, yres = self.geotransform
+        return (x0 + col_off * xres + row_off * xskew, xres, xskew,
+                y0 + col_off * yskew + row_off * yres, yskew, yres)
+
+    def close(self):
+        if _HAS_RASTERIO:
+            self._src.close()
+        self._src = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def tile_offsets(rows, cols, tile_size=256, overlap=0):
+    """Upper-left (row_off, col_off) of every full tile, in row-major order.
+    Partial tiles at the right/bottom edges are dropped, as in split_and_resize_simple."""
+    stride = tile_size - overlap
+    if stride <= 0:
+        raise ValueError('overlap must be smaller than tile_size')
+    for y in range(0, rows - tile_size + 1, stride):
+        for x in range(0, cols - tile_size + 1, stride):
+            yield y, x
+
+
+def stretch_limits(raster, bands, percentiles=(2, 98)):
+    """Per-band percentile limits from streaming histograms of the whole scene,
+    read window by window (see utils/radiometric_stretch.py)."""
+    hists = radiometric_stretch.raster_histograms([raster], bands)
+    return radiometric_stretch.stretch_limits(hists, percentiles)
+
+
+def stack_stretch_limits(tif_paths, bands, percentiles=(2, 98)):
+    """Per-band percentile limits shared by several scenes, e.g. every year of a site,
+    so the tiles of all of them are stretched the same way."""
+    hists = None
+    for path in tif_paths:
+        with WindowedRaster(path) as raster:
+            hists = radiometric_stretch.raster_histograms([raster], bands, hists)
+    return radiometric_stretch.stretch_limits(hists, percentiles)
+
+
+def iter_tiles(raster, tile_size=256, overlap=0, bands=(1, 2, 3), limits=None, row_range=None, dtype='uint8'):
+    """Yield (row_off, col_off, tile) for every tile of an open WindowedRaster.
+
+    tile is a (tile_size, tile_size, len(bands)) uint8 array in the order of bands,
+    or with dtype='float32' the same stretch as floats in [0, 1], without quantization.
+    The same buffer is reused between iterations, copy it if it must outlive the loop.
+    row_range=(start, stop) only yields tiles with start <= row_off < stop, so several
+    workers can split one scene; pass the same limits to each of them.
+    """
+    bands = list(bands)
+    if limits is None:
+        limits = stretch_limits(raster, bands)
+    stretch = radiometric_stretch.apply_stretch if np.dtype(dtype) == np.uint8 \
+        else radiometric_stretch.apply_stretch_float
+    block = np.empty((len(bands), tile_size, tile_size), dtype=raster.dtype)
+    tile = np.empty((tile_size, tile_size, len(bands)), dtype=dtype)
+    for row_off, col_off in tile_offsets(raster.height, raster.width, tile_size, overlap):
+        if row_range is not None and not (row_range[0] <= row_off < row_range[1]):
+            continue
+        raster.read(bands, row_off, col_off, tile_size, tile_size, out=block)
+        yield row_off, col_off, stretch(np.moveaxis(block, 0, -1), limits, tile)
+
+
+def write_world_file(path, geotransform):
+    """Write an ESRI world file; world files reference the centre of the upper-left pixel."""
+    x0, xres, xskew, y0, yskew, yres = geotransform
+    lines = [xres, yskew, xskew, yres,
+             x0 + 0.5 * xres + 0.5 * xskew,
+             y0 + 0.5 * yskew + 0.5 * yres]
+    with open(path, 'w') as f:
+        f.write('\n'.join(repr(float(v)) for v in lines) + '\n')
+
+
+def world_file_path(image_path):
+    """foo.jpeg -> foo.jgw, foo.png -> foo.pgw, foo.tif -> foo.tfw"""
+    root, ext = os.path.splitext(image_path)
+    ext = ext.lstrip('.').lower()
+    if not ext:
+        return root + '.wld'
+    return root + '.' + ext[0] + ext[-1] + 'w'
+
+
+def tile_filename(basename, row_off, col_off, ext='.jpeg'):
+    """Tile name, same pattern as split_and_resize_simple: <basename>_<row>_<col><ext>"""
+    return f"{basename}_{row_off:04d}_{col_off:04d}{ext}"
+
+
+def tile_record(raster, tif_path, tile_name, row_off, col_off, tile_size):
+    """Tile index record (TILE_INDEX_COLUMNS) of the tile_size window at (row_off, col_off)."""
+    gt = raster.window_geotransform(row_off, col_off)
+    xs = [gt[0], gt[0] + tile_size * gt[1]]
+    ys = [gt[3], gt[3] + tile_size * gt[5]]
+    return {'tile': tile_name,
+            'scene': tif_path,
+            'row_off': row_off,
+            'col_off': col_off,
+            'xmin': min(xs),
+            'ymin': min(ys),
+            'xmax': max(xs),
+            'ymax': max(ys),
+            'xres': abs(gt[1]),
+            'yres': abs(gt[5]),
+            'epsg': raster.epsg,
+            'cols': tile_size,
+            'rows': tile_size}
+
+
+def tile_scene(tif_path,
+               output_dir,
+               tile_size=256,
+               overlap=0,
+               bands=(1, 2, 3),
+               ext='.jpeg',
+               basename=None,
+               world_files=True,
+               index_csv=None,
+               limits=None,
+               row_range=None):
+    """
+    Cut a GeoTIFF into georeferenced uint8 tiles without loading the scene.
+    inputs:
+    tif_path: path to input GeoTIFF (str)
+    output_dir: folder to write tiles to (str)
+    tile_size: tile width/height in pixels (int)
+    overlap: overlap between neighbouring tiles in pixels (int)
+    bands: 1-based band indices written as the R,G,B channels of the tile (tuple)
+    ext: tile extension, '.jpeg', '.jpg' or '.png' (str)
+    basename: tile name prefix, defaults to the tif name (str)
+    world_files: write a world file next to every tile (bool)
+    index_csv: path to the tile index CSV, defaults to <output_dir>/<basename>_tiles.csv,
+               False to skip writing it (str or bool)
+    limits: per-band (low, high) stretch limits, estimated from the scene when None (list)
+    row_range: (start, stop) pixel rows of the tile origins to cut, all tiles when None (tuple)
+    outputs:
+    records: one dict per tile with the TILE_INDEX_COLUMNS keys (list)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if basename is None:
+        basename = os.path.splitext(os.path.basename(tif_path))[0]
+    if index_csv is None:
+        index_csv = os.path.join(output_dir, basename + '_tiles.csv')
+
+    records = []
+    with WindowedRaster(tif_path) as raster:
+        bgr = np.empty((tile_size, tile_size, len(bands)), dtype='uint8')
+        for row_off, col_off, tile in iter_tiles(raster, tile_size, overlap, bands,
+                                                 limits=limits, row_range=row_range):
+            tile_name = tile_filename(basename, row_off, col_off, ext)
+            tile_path = os.path.join(output_dir, tile_name)
+            # OpenCV expects BGR channel order
+            bgr[...] = tile[:, :, ::-1]
+            cv2.imwrite(tile_path, bgr)
+
+            if world_files:
+                write_world_file(world_file_path(tile_path), raster.window_geotransform(row_off, col_off))
+            records.append(tile_record(raster, tif_path, tile_name, row_off, col_off, tile_size))
+
+    if index_csv is not False:
+        write_tile_index(records, index_csv)
+    return records
+
+
+def write_tile_index(records, index_csv):
+    """Write tile records (see tile_scene) to a tile index CSV."""
+    with open(index_csv, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=TILE_INDEX_COLUMNS)
+        writer.writeheader()
+        writer.writerows(records)
+    return index_csv
+
+
+def read_tile_index(index_csv):
+    """Read a tile index CSV written by tile_scene into a list of dicts."""
+    with open(index_csv, newline='') as f:
+        records = list(csv.DictReader(f))
+    for rec in records:
+        for key in ['row_off', 'col_off', 'cols', 'rows']:
+            rec[key] = int(rec[key])
+        for key in ['xmin', 'ymin', 'xmax', 'ymax', 'xres', 'yres']:
+            rec[key] = float(rec[key])
+        rec['epsg'] = int(rec['epsg']) if rec['epsg'] else None
+    return records
@@ -0,0 +1,161 @@
+"""
+Generator outputs straight into shoreline extraction, without writing mask PNGs and reading them back.
+- The forward passes and the extraction are two stages joined by a bounded queue: the generator runs
+  at most queue_size batches ahead and waits when the extraction falls behind
+- Masks stay uint8 arrays in memory and reach the extraction as generated, like the mask PNGs the
+  file-based extraction reads back (binarize thresholds them, > MASK_THRESHOLD as
+  shoreline_extraction_utils.extract_shorelines, for callers that want that)
+- Tiles listed in a scene tile index are blended into the scene's MaskMosaic as they arrive
+  (mask_mosaic.SceneMosaicBuilder); a scene is handed on as soon as its last tile is in, then dropped
+- Mask images are written only on request, by a gan_inference.ResultWriter passed in as writer
+"""
+import os
+import queue
+import threading
+import numpy as np
+
+from utils import mask_mosaic
+from utils import scene_tiler
+from utils import tile_triage
+
+MASK_THRESHOLD = 250
+QUEUE_SIZE = 4
+
+
+def binarize(mask, threshold=MASK_THRESHOLD):
+    """0 / 255 uint8 mask of the pixels above threshold."""
+    return np.where(np.asarray(mask) > threshold, 255, 0).astype(np.uint8)
+
+
+def run_stages(batches, consume, queue_size=QUEUE_SIZE, threads=1):
+    """
+    Pass (paths, masks) batches from the calling thread to consume(paths, masks) on background threads.
+    inputs:
+    batches: iterable of (paths, masks), e.g. gan_inference.ShorelineGenerator.run (iterable)
+    consume: called once per batch, from one of the threads (callable)
+    queue_size: batches waiting for consume at most (int)
+    threads: consumer threads (int)
+    An error in consume stops the producer and is raised here.
+    """
+    items = queue.Queue(maxsize=queue_size)
+    errors = []
+    done = object()
+
+    def worker():
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if errors:
+                continue  # keep draining so the producer is not left blocked on a full queue
+            try:
+                consume(*item)
+            except BaseException as e:
+                errors.append(e)
+
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(threads)]
+    for w in workers:
+        w.start()
+    try:
+        for paths, masks in batches:
+            if errors:
+                break
+            items.put((paths, masks))
+    finally:
+        if hasattr(batches, 'close'):
+            batches.close()
+        for _ in workers:
+            items.put(done)
+        for w in workers:
+            w.join()
+    if errors:
+        raise errors[0]
+
+
+def stream_tiles(batches, on_tile, threshold=None, queue_size=QUEUE_SIZE, threads=1, writer=None):
+    """
+    Call on_tile(name, mask) for every tile of batches, on the extraction threads.
+    inputs:
+    batches: (paths, masks) batches from the generator (iterable)
+    on_tile: takes the tile name (stem of its path) and its uint8 mask (callable)
+    threshold: binarize the masks to 0 / 255 at this value, None (default) to pass them on as generated,
+               as process_gan_outputs reads them from the mask PNGs (int)
+    writer: a gan_inference.ResultWriter to also write the masks with (optional)
+    outputs:
+    n: number of tiles handed to on_tile (int)
+    """
+    count = [0]
+    lock = threading.Lock()
+
+    def consume(paths, masks):
+        if writer is not None:
+            writer.submit(paths, masks)
+        for path, mask in zip(paths, masks):
+            on_tile(os.path.splitext(os.path.basename(path))[0],
+                    binarize(mask, threshold) if threshold is not None else mask)
+        with lock:
+            count[0] += len(paths)
+
+    run_stages(batches, consume, queue_size, threads)
+    return count[0]
+
+
+def scene_builders(index_csvs, overlap=None, fill_values=None):
+    """{scene name: SceneMosaicBuilder} for tile index CSVs, with the triage manifest next to each index."""
+    builders = {}
+    for index_csv in index_csvs:
+        records = scene_tiler.read_tile_index(index_csv)
+        if not records:
+            continue
+        manifest = tile_triage.manifest_path(os.path.dirname(index_csv))
+        scene = os.path.basename(index_csv).replace('_tiles.csv', '')
+        builders[scene] = mask_mosaic.SceneMosaicBuilder(records, overlap,
+                                                        manifest if os.path.exists(manifest) else None,
+                                                        fill_values)
+    return builders
+
+
+def stream_scenes(batches, index_csvs, on_scene, queue_size=QUEUE_SIZE, threads=1, writer=None, overlap=None,
+                  fill_values=None):
+    """
+    Blend generator outputs into their scene mosaics and call on_scene(scene, mosaic) once per scene,
+    as soon as all of its tiles are in (scenes some tiles never came for are handed on at the end).
+    inputs:
+    batches: (paths, masks) batches from the generator (iterable)
+    index_csvs: tile index CSVs written by scene_tiler.tile_scene / tile_shards, one per scene (list)
+    on_scene: takes the scene name and its mask_mosaic.MaskMosaic (callable)
+    writer, overlap, fill_values: see stream_tiles and mask_mosaic.mosaic_from_index
+    outputs:
+    scenes: names of the scenes handed to on_scene, in that order (list)
+    """
+    builders = scene_builders(index_csvs, overlap, fill_values)
+    owner = {name: scene for scene, builder in builders.items() for name in builder.records}
+    lock = threading.Lock()
+    scenes = []
+
+    def finish(scene, builder):
+        on_scene(scene, builder.mosaic)
+        with lock:
+            scenes.append(scene)
+
+    def consume(paths, masks):
+        if writer is not None:
+            writer.submit(paths, masks)
+        for path, mask in zip(paths, masks):
+            name = os.path.basename(path)
+            with lock:
+                builder = builders.get(owner.get(name))
+                if builder is None:
+                    continue
+                builder.add(name, np.asarray(mask, dtype=np.float32) / 255.0)
+                complete = builder.complete
+                if complete:
+                    del builders[owner[name]]
+            if complete:
+                finish(owner[name], builder)
+
+    run_stages(batches, consume, queue_size, threads)
+    for scene, builder in list(builders.items()):
+        if builder.found:
+            finish(scene, builder)
+    return scenes
@@ -0,0 +1,145 @@
+"""
+Memory-mapped tile shards, an alternative to writing every pix2pix tile as its own JPEG.
+- One shard per scene: a (n, tile_size, tile_size, channels) uint8 .npy with the raw tiles
+  in R,G,B band order, no lossy re-encoding and one file instead of thousands
+- float shards keep the stretched bands in [0, 1] without 8-bit quantization and can hold any number
+  of bands, e.g. MULTISPECTRAL_BANDS of a harmonized scene for generators with input_nc=5; float16
+  (~3 significant digits, well below the sensor noise) takes half the disk and I/O of float32, which
+  is only worth keeping for tiles that are reused for training
+- For inference alone the scenes do not need to be persisted at all: window_inference.predict_raster
+  reads and stretches the harmonized bands straight from the GeoTIFF (dtype='float32')
+- Tile i of the shard is row i of the scene's tile index CSV (<basename>_tiles.csv, same columns
+  as scene_tiler.tile_scene writes), so tile names, offsets and geotransforms are unchanged
+  and triage manifests / mask mosaics work the same for both formats
+- Readers memory-map the .npy, so shard[i] and shard[i:j] are zero-copy views
+- The shard is allocated up front, so several workers can fill disjoint tile rows of one scene
+"""
+import os
+import glob
+import numpy as np
+
+from utils import scene_tiler
+
+SHARD_SUFFIX = '_tiles.npy'
+SHARD_DTYPES = ['uint8', 'float16', 'float32']
+
+# R, G, B, NIR, SWIR1 of a harmonized (B, G, R, NIR, SWIR1) scene
+MULTISPECTRAL_BANDS = (3, 2, 1, 4, 5)
+
+
+def shard_path(output_dir, basename):
+    return os.path.join(output_dir, basename + SHARD_SUFFIX)
+
+
+def index_for_shard(path):
+    """<basename>_tiles.npy -> <basename>_tiles.csv"""
+    return os.path.splitext(path)[0] + '.csv'
+
+
+def shard_for_index(index_csv):
+    """<basename>_tiles.csv -> <basename>_tiles.npy"""
+    return os.path.splitext(index_csv)[0] + '.npy'
+
+
+def find_shards(folder):
+    """Shards in a folder that have a tile index next to them."""
+    return [p for p in sorted(glob.glob(os.path.join(folder, '*' + SHARD_SUFFIX)))
+            if os.path.exists(index_for_shard(p))]
+
+
+def create_scene_shard(tif_path, output_dir, tile_size=256, overlap=0, bands=(1, 2, 3),
+                       ext='.jpeg', basename=None, dtype='uint8'):
+    """
+    Allocate the shard of a scene and write its tile index, without reading any pixels.
+    inputs:
+    tif_path: path to input GeoTIFF (str)
+    output_dir: folder to write the shard and tile index to (str)
+    tile_size, overlap, bands: as for scene_tiler.tile_scene
+    ext: extension of the tile names in the index, kept so outputs are named as for tile files (str)
+    basename: shard / tile name prefix, defaults to the tif name (str)
+    dtype: 'uint8' tiles, or 'float16' / 'float32' tiles in [0, 1] (str)
+    outputs:
+    path: path of the .npy shard (str)
+    """
+    if dtype not in SHARD_DTYPES:
+        raise ValueError(f"shard dtype must be one of {SHARD_DTYPES}, got {dtype}")
+    os.makedirs(output_dir, exist_ok=True)
+    if basename is None:
+        basename = os.path.splitext(os.path.basename(tif_path))[0]
+    with scene_tiler.WindowedRaster(tif_path) as raster:
+        records = [scene_tiler.tile_record(raster, tif_path,
+                                           scene_tiler.tile_filename(basename, row_off, col_off, ext),
+                                           row_off, col_off, tile_size)
+                   for row_off, col_off in scene_tiler.tile_offsets(raster.height, raster.width,
+                                                                    tile_size, overlap)]
+    path = shard_path(output_dir, basename)
+    tiles = np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                      shape=(len(records), tile_size, tile_size, len(bands)))
+    tiles.flush()
+    del tiles
+    scene_tiler.write_tile_index(records, index_for_shard(path))
+    return path
+
+
+def fill_scene_shard(tif_path, path, tile_size=256, overlap=0, bands=(1, 2, 3), limits=None, row_range=None):
+    """
+    Write the tiles of a scene into a shard allocated by create_scene_shard.
+    limits and row_range work as for scene_tiler.tile_scene; workers filling different
+    row ranges of one shard must be given the same limits. Tiles are written in the shard's dtype.
+    outputs:
+    n: number of tiles written (int)
+    """
+    tiles = np.load(path, mmap_mode='r+')
+    n = 0
+    with scene_tiler.WindowedRaster(tif_path) as raster:
+        position = {off: i for i, off in enumerate(scene_tiler.tile_offsets(raster.height, raster.width,
+                                                                            tile_size, overlap))}
+        for row_off, col_off, tile in scene_tiler.iter_tiles(raster, tile_size, overlap, bands,
+                                                             limits=limits, row_range=row_range,
+                                                             dtype=tiles.dtype):
+            tiles[position[(row_off, col_off)]] = tile
+            n += 1
+    tiles.flush()
+    del tiles
+    return n
+
+
+def tile_scene_shard(tif_path, output_dir, tile_size=256, overlap=0, bands=(1, 2, 3),
+                     ext='.jpeg', basename=None, limits=None, dtype='uint8'):
+    """Cut a GeoTIFF into one tile shard plus tile index, see scene_tiler.tile_scene for the inputs.
+    Returns the shard path."""
+    path = create_scene_shard(tif_path, output_dir, tile_size, overlap, bands, ext, basename, dtype)
+    with scene_tiler.WindowedRaster(tif_path) as raster:
+        if limits is None:
+            limits = scene_tiler.stretch_limits(raster, bands)
+    fill_scene_shard(tif_path, path, tile_size, overlap, bands, limits)
+    return path
+
+
+class TileShard():
+    """Read-only, memory-mapped view of one shard and its tile index.
+
+    shard[i] is the (tile_size, tile_size, channels) tile of index row i (uint8, or float in [0, 1]),
+    shard.tile(name) looks a tile up by its tile index name.
+    """
+
+    def __init__(self, path, mmap_mode='r'):
+        self.path = path
+        self.tiles = np.load(path, mmap_mode=mmap_mode)
+        self.records = scene_tiler.read_tile_index(index_for_shard(path))
+        if len(self.records) != len(self.tiles):
+            raise ValueError(f"{path} holds {len(self.tiles)} tiles but its index lists {len(self.records)}")
+        self.names = [rec['tile'] for rec in self.records]
+        self._position = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def __getitem__(self, index):
+        return self.tiles[index]
+
+    def tile(self, name):
+        return self.tiles[self._position[name]]
+
+    def record(self, name):
+        return self.records[self._position[name]]
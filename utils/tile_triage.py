@@ -0,0 +1,230 @@
+"""
+Tile triage before GAN inference.
+- Cheap per-tile statistics computed on batches of tiles at once: nodata fraction, intensity spread,
+  edge density, and the water fraction (NDWI > 0) when green/NIR bands of the source scene are available
+- Tiles that are (almost) all nodata, all water, all land or featureless are marked as not needing inference
+- Results go to a tile manifest CSV next to the tiles (tile_manifest.csv); the inference dataset
+  (--tile_manifest), gan_inference_utils.run_model and mask_mosaic read it
+"""
+import os
+import csv
+import glob
+import numpy as np
+import cv2
+
+from utils import scene_tiler
+from utils import tile_shards
+
+MANIFEST_NAME = 'tile_manifest.csv'
+MANIFEST_COLUMNS = ['tile', 'nodata_frac', 'intensity_std', 'edge_density', 'water_frac', 'infer', 'reason']
+TILE_EXTENSIONS = ['.jpeg', '.jpg', '.png']
+
+# default thresholds, intensities in uint8 tile units
+MAX_NODATA = 0.9
+MIN_STD = 4.0
+MIN_EDGE_DENSITY = 0.01
+EDGE_THRESHOLD = 20
+MIN_MIXED = 0.01
+
+# harmonized stacks are B,G,R,NIR,SWIR
+HARMONIZED_WATER_BANDS = (2, 4)
+
+
+def manifest_path(tile_dir):
+    return os.path.join(tile_dir, MANIFEST_NAME)
+
+
+def tile_stats(stack, nodata=None, water=None, edge_threshold=EDGE_THRESHOLD):
+    """
+    Statistics of a batch of uint8 tiles, vectorized over the batch.
+    inputs:
+    stack: tiles, (n, rows, cols) or (n, rows, cols, channels) uint8 array, or float array in [0, 1]
+    nodata: (n, rows, cols) bool array, True on nodata pixels; all-zero pixels when None
+    water: (n, rows, cols) bool array, True on water pixels, or None
+    edge_threshold: gradient magnitude (uint8 units) counted as an edge (int)
+    outputs:
+    stats: dict of (n,) arrays nodata_frac, intensity_std, edge_density, water_frac
+           (water_frac is NaN without a water mask)
+    """
+    stack = np.asarray(stack)
+    gray = stack.astype(np.float32)
+    if stack.dtype.kind == 'f':
+        # float shard tiles are in [0, 1]
+        gray *= 255.0
+    if stack.ndim == 4:
+        if nodata is None:
+            nodata = ~stack.any(axis=3)
+        gray = gray.mean(axis=3)
+    elif nodata is None:
+        nodata = stack == 0
+    n = gray.shape[0]
+    valid = ~nodata
+    n_valid = valid.reshape(n, -1).sum(axis=1)
+    nodata_frac = 1.0 - n_valid / float(gray[0].size)
+
+    # spread of the valid pixels
+    denom = np.maximum(n_valid, 1)
+    g = np.where(valid, gray, 0.0)
+    mean = g.reshape(n, -1).sum(axis=1) / denom
+    sq = (g * g).reshape(n, -1).sum(axis=1) / denom
+    intensity_std = np.sqrt(np.maximum(sq - mean * mean, 0.0))
+
+    # edges between neighbouring valid pixels
+    dx = np.abs(np.diff(gray, axis=2)) > edge_threshold
+    dy = np.abs(np.diff(gray, axis=1)) > edge_threshold
+    dx &= valid[:, :, 1:] & valid[:, :, :-1]
+    dy &= valid[:, 1:, :] & valid[:, :-1, :]
+    edges = dx.reshape(n, -1).sum(axis=1) + dy.reshape(n, -1).sum(axis=1)
+    edge_density = edges / np.maximum(2.0 * n_valid, 1.0)
+
+    if water is None:
+        water_frac = np.full(n, np.nan)
+    else:
+        water_frac = (water & valid).reshape(n, -1).sum(axis=1) / denom
+    return {'nodata_frac': nodata_frac, 'intensity_std': intensity_std,
+            'edge_density': edge_density, 'water_frac': water_frac}
+
+
+def classify(stats, max_nodata=MAX_NODATA, min_std=MIN_STD, min_edge_density=MIN_EDGE_DENSITY,
+             min_mixed=MIN_MIXED):
+    """Reason per tile: 'nodata', 'water', 'land', 'uniform' (skip) or 'infer'."""
+    reasons = []
+    for i in range(len(stats['nodata_frac'])):
+        water_frac = stats['water_frac'][i]
+        if stats['nodata_frac'][i] >= max_nodata:
+            reasons.append('nodata')
+        elif not np.isnan(water_frac) and water_frac >= 1.0 - min_mixed:
+            reasons.append('water')
+        elif not np.isnan(water_frac) and water_frac <= min_mixed:
+            reasons.append('land')
+        elif np.isnan(water_frac) and (stats['intensity_std'][i] < min_std
+                                       and stats['edge_density'][i] < min_edge_density):
+            reasons.append('uniform')
+        else:
+            reasons.append('infer')
+    return reasons
+
+
+def water_masks(raster, records, water_bands=HARMONIZED_WATER_BANDS):
+    """(n, rows, cols) NDWI > 0 masks of tile windows read from the source scene."""
+    green, nir = water_bands
+    masks = []
+    for rec in records:
+        block = raster.read([green, nir], rec['row_off'], rec['col_off'], rec['rows'], rec['cols'])
+        block = block.astype(np.float32)
+        total = block[0] + block[1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ndwi = (block[0] - block[1]) / total
+        masks.append(np.nan_to_num(ndwi, nan=-1.0) > 0)
+    return np.stack(masks)
+
+
+def triage_folder(tile_dir,
+                  manifest_csv=None,
+                  index_csv=None,
+                  scene_tif=None,
+                  water_bands=None,
+                  batch_size=64,
+                  max_nodata=MAX_NODATA,
+                  min_std=MIN_STD,
+                  min_edge_density=MIN_EDGE_DENSITY,
+                  min_mixed=MIN_MIXED):
+    """
+    Triage the tiles of a folder and write the tile manifest.
+    inputs:
+    tile_dir: folder with the tiles (str)
+    manifest_csv: manifest path, defaults to <tile_dir>/tile_manifest.csv, False to skip writing it (str or bool)
+    index_csv: tile index CSV from scene_tiler.tile_scene; limits triage to its tiles and
+               gives the tile windows for water_bands. When the scene was cut into a tile shard
+               (utils/tile_shards.py) the tiles are read from the shard instead of image files (str)
+    scene_tif: source GeoTIFF of index_csv, read for the water mask (str)
+    water_bands: 1-based (green, nir) bands of scene_tif, e.g. (2, 4) for harmonized scenes (tuple)
+    batch_size: tiles processed per vectorized batch (int)
+    outputs:
+    rows: one dict per tile with the MANIFEST_COLUMNS keys (list)
+    """
+    if manifest_csv is None:
+        manifest_csv = manifest_path(tile_dir)
+    if index_csv is not None:
+        records = scene_tiler.read_tile_index(index_csv)
+    else:
+        records = [{'tile': os.path.basename(p)} for p in sorted(glob.glob(os.path.join(tile_dir, '*')))
+                   if os.path.splitext(p)[1].lower() in TILE_EXTENSIONS]
+    shard = None
+    if index_csv is not None and os.path.exists(tile_shards.shard_for_index(index_csv)):
+        shard = tile_shards.TileShard(tile_shards.shard_for_index(index_csv))
+        records = shard.records
+    raster = None
+    if scene_tif is not None and water_bands is not None and index_csv is not None:
+        raster = scene_tiler.WindowedRaster(scene_tif)
+
+    rows = []
+    try:
+        for start in range(0, len(records), batch_size):
+            batch = records[start:start + batch_size]
+            if shard is not None:
+                stack = shard[start:start + len(batch)]
+            else:
+                tiles = [cv2.imread(os.path.join(tile_dir, rec['tile'])) for rec in batch]
+                batch = [rec for rec, tile in zip(batch, tiles) if tile is not None]
+                tiles = [tile for tile in tiles if tile is not None]
+                if not tiles:
+                    continue
+                stack = np.stack(tiles)
+            water = water_masks(raster, batch, water_bands) if raster is not None else None
+            stats = tile_stats(stack, water=water)
+            reasons = classify(stats, max_nodata, min_std, min_edge_density, min_mixed)
+            for i, rec in enumerate(batch):
+                rows.append({'tile': rec['tile'],
+                             'nodata_frac': round(float(stats['nodata_frac'][i]), 4),
+                             'intensity_std': round(float(stats['intensity_std'][i]), 3),
+                             'edge_density': round(float(stats['edge_density'][i]), 4),
+                             'water_frac': '' if np.isnan(stats['water_frac'][i])
+                                           else round(float(stats['water_frac'][i]), 4),
+                             'infer': int(reasons[i] == 'infer'),
+                             'reason': reasons[i]})
+    finally:
+        if raster is not None:
+            raster.close()
+
+    if manifest_csv is not False:
+        write_manifest(rows, manifest_csv)
+        n_infer = sum(r['infer'] for r in rows)
+        print(f"[INFO] Triage: {n_infer} of {len(rows)} tiles need inference ({manifest_csv})")
+    return rows
+
+
+def triage_scenes(tile_dir, scenes, water_bands=None, manifest_csv=None, **thresholds):
+    """Triage several scenes tiled into the same folder into one manifest.
+    scenes: list of (index_csv, scene_tif) pairs"""
+    rows = []
+    for index_csv, scene_tif in scenes:
+        rows.extend(triage_folder(tile_dir, False, index_csv, scene_tif, water_bands, **thresholds))
+    if manifest_csv is None:
+        manifest_csv = manifest_path(tile_dir)
+    write_manifest(rows, manifest_csv)
+    n_infer = sum(r['infer'] for r in rows)
+    print(f"[INFO] Triage: {n_infer} of {len(rows)} tiles need inference ({manifest_csv})")
+    return rows
+
+
+def write_manifest(rows, manifest_csv):
+    with open(manifest_csv, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return manifest_csv
+
+
+def read_manifest(manifest_csv):
+    """Tile manifest as a dict tile name -> row (infer as int)."""
+    with open(manifest_csv, newline='') as f:
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        row['infer'] = int(row['infer'])
+    return {row['tile']: row for row in rows}
+
+
+def tiles_to_infer(manifest_csv):
+    """Sorted names of the tiles the manifest marks for inference."""
+    return sorted(tile for tile, row in read_manifest(manifest_csv).items() if row['infer'])
@@ -0,0 +1,178 @@
+"""
+Sliding-window inference over whole scenes with the fully convolutional generator.
+- Instead of independent 256x256 tiles, the generator runs on large windows (WINDOW_SIZE, e.g. 1024-4096 px)
+  padded to a multiple of 2^num_downs (256 for unet_256), so there are far fewer forward passes, no tile
+  files and no per-tile loader overhead
+- Neighbouring windows overlap by 2 * margin pixels; only the interior of each window (margin pixels away
+  from its edges, where the generator lacks context) is kept, so the stitched mask has no seams
+- Windows are sized by pixels or by memory: window_memory estimates the forward pass memory of a window,
+  window_for_memory picks the largest window that fits a budget
+- Windows are read (and stretched, for GeoTIFF scenes) on a background thread while the generator runs
+The generator normalizes over the whole window: with the default train-mode generator (per-sample
+BatchNorm, see gan_inference.py) the statistics are those of the window rather than of a 256 px tile;
+eval=True uses the running statistics, the same for every window and tile size.
+"""
+import numpy as np
+
+from utils import gan_inference
+from utils import mask_mosaic
+from utils import radiometric_stretch
+from utils import scene_tiler
+
+WINDOW_SIZE = 1024
+MARGIN = 64
+
+# input sizes each generator architecture needs to be a multiple of: 2^num_downs for the U-Nets,
+# the two stride-2 downsamplings of the ResNet generators
+SIZE_MULTIPLE = {'unet_256': 256, 'unet_128': 128, 'resnet_9blocks': 4, 'resnet_6blocks': 4}
+
+# forward pass memory of unet_256 in eval / no_grad mode, measured on CPU:
+# ~5.5 bytes per input pixel per generator filter (ngf), plus a fixed workspace
+BYTES_PER_PIXEL_PER_FILTER = 5.5
+WORKSPACE_BYTES = 64 * 1024 ** 2
+
+
+def round_up(n, multiple):
+    """Smallest multiple of multiple that is >= n."""
+    return -(-int(n) // multiple) * multiple
+
+
+def window_memory(rows, cols, ngf=64, batch_size=1):
+    """Estimated peak memory in bytes of a forward pass over batch_size (rows, cols) windows."""
+    return int(rows * cols * batch_size * ngf * BYTES_PER_PIXEL_PER_FILTER + WORKSPACE_BYTES)
+
+
+def window_for_memory(max_memory_mb, ngf=64, batch_size=1, multiple=256):
+    """Largest square window (a multiple of multiple) whose forward pass fits in max_memory_mb,
+    at least multiple."""
+    budget = max_memory_mb * 1024 ** 2
+    window = multiple
+    while window_memory(window + multiple, window + multiple, ngf, batch_size) <= budget:
+        window += multiple
+    return window
+
+
+def window_offsets(size, window, margin=MARGIN):
+    """
+    Windows along one axis of length size.
+    outputs:
+    windows: (offset, valid_start, valid_stop) per window; the valid ranges, in scene pixels, tile
+             [0, size) exactly and keep margin pixels away from every window edge inside the scene (list)
+    """
+    if size <= window:
+        return [(0, 0, size)]
+    stride = window - 2 * margin
+    if stride <= 0:
+        raise ValueError('margin must be smaller than half the window')
+    windows = []
+    offset, valid_start = 0, 0
+    while True:
+        last = offset + window >= size
+        valid_stop = size if last else offset + window - margin
+        windows.append((offset, valid_start, valid_stop))
+        if last:
+            return windows
+        # the last window is shifted back to end on the scene edge, so every window has the same size
+        offset, valid_start = min(offset + stride, size - window), valid_stop
+
+
+def iter_windows(rows, cols, window=WINDOW_SIZE, margin=MARGIN):
+    """Yield (row_off, col_off, (row_start, row_stop), (col_start, col_stop)) for the windows of a
+    (rows, cols) scene, in row-major order; the last two are the valid ranges in scene pixels."""
+    for row_off, row_start, row_stop in window_offsets(rows, window, margin):
+        for col_off, col_start, col_stop in window_offsets(cols, window, margin):
+            yield row_off, col_off, (row_start, row_stop), (col_start, col_stop)
+
+
+def pad_window(block, rows, cols):
+    """Mirror-pad a (r, c, bands) block at the bottom / right to (rows, cols, bands)."""
+    pad = ((0, rows - block.shape[0]), (0, cols - block.shape[1]), (0, 0))
+    return block if not any(p[1] for p in pad[:2]) else np.pad(block, pad, mode='symmetric')
+
+
+def predict_windows(generator, read_window, rows, cols, window=WINDOW_SIZE, margin=MARGIN, batch_size=1,
+                    multiple=None, max_memory_mb=None):
+    """
+    Run a generator over a scene window by window and stitch the valid parts of its masks.
+    inputs:
+    generator: a gan_inference.ShorelineGenerator, or a callable taking and returning (n, c, rows, cols) tensors
+    read_window: read_window(row_off, col_off, rows, cols) -> (rows, cols, bands) uint8 or [0, 1] float
+                 block of the scene (callable)
+    rows, cols: scene size in pixels (int)
+    window: window size in pixels, rounded up to multiple (int)
+    margin: pixels cropped from each inner window edge, half the overlap of neighbouring windows (int)
+    batch_size: windows per forward pass (int)
+    multiple: size the window is padded to a multiple of, from the generator architecture when None (int)
+    max_memory_mb: size the window to this forward pass memory budget instead of window (float)
+    outputs:
+    mask: (rows, cols) uint8 mask, (rows, cols, output_nc) for output_nc > 1 (array)
+    """
+    predict = getattr(generator, 'predict', generator)
+    if multiple is None:
+        multiple = SIZE_MULTIPLE.get(getattr(generator, 'arch', 'unet_256'), 256)
+    if max_memory_mb is not None:
+        window = window_for_memory(max_memory_mb, getattr(generator, 'ngf', 64), batch_size, multiple)
+    window = round_up(window, multiple)
+    # windows are never larger than the (padded) scene, and all have the same padded size, so they batch
+    win_rows, win_cols = min(window, round_up(rows, multiple)), min(window, round_up(cols, multiple))
+    windows = list(iter_windows(rows, cols, window, margin))
+
+    def batches():
+        for i in range(0, len(windows), batch_size):
+            chunk = windows[i:i + batch_size]
+            blocks = [pad_window(read_window(r, c, min(win_rows, rows), min(win_cols, cols)), win_rows, win_cols)
+                      for r, c, _, _ in chunk]
+            yield chunk, gan_inference.tiles_to_batch(np.stack(blocks))
+
+    mask = None
+    for chunk, batch in gan_inference.prefetch(batches()):
+        masks = gan_inference.to_uint8(predict(batch))
+        if mask is None:
+            mask = np.zeros((rows, cols) + masks.shape[3:], dtype=np.uint8)
+        for (row_off, col_off, (r0, r1), (c0, c1)), out in zip(chunk, masks):
+            mask[r0:r1, c0:c1] = out[r0 - row_off:r1 - row_off, c0 - col_off:c1 - col_off]
+    return mask
+
+
+def predict_image(generator, image, window=WINDOW_SIZE, margin=MARGIN, batch_size=1, **kwargs):
+    """predict_windows over a (rows, cols, bands) uint8 or [0, 1] float image held in memory."""
+    image = np.asarray(image)
+    if image.ndim == 2:
+        image = image[:, :, np.newaxis]
+    return predict_windows(generator, lambda r, c, nr, nc: image[r:r + nr, c:c + nc], image.shape[0],
+                           image.shape[1], window, margin, batch_size, **kwargs)
+
+
+def predict_raster(generator, tif_path, window=WINDOW_SIZE, margin=MARGIN, batch_size=1, bands=(1, 2, 3),
+                   limits=None, dtype='uint8', **kwargs):
+    """
+    predict_windows over a GeoTIFF scene, read window by window and stretched as scene_tiler.tile_scene
+    stretches its tiles.
+    inputs:
+    tif_path: path to the scene GeoTIFF (str)
+    bands, limits, dtype: see scene_tiler.iter_tiles; bands must be the band map the generator's tiles were
+                          cut with, e.g. prepare_pix2pix_from_harmonized.RGB_BANDS for harmonized scenes,
+                          one band per generator input channel (input_nc)
+    kwargs: further predict_windows arguments (multiple, max_memory_mb)
+    outputs:
+    mosaic: mask_mosaic.MaskMosaic of the scene, georeferenced like it, for the scene-level extraction
+    """
+    bands = list(bands)
+    input_nc = getattr(generator, 'input_nc', len(bands))
+    if len(bands) != input_nc:
+        raise ValueError(f'{len(bands)} bands {bands} for a generator with input_nc={input_nc}')
+    stretch = radiometric_stretch.apply_stretch if np.dtype(dtype) == np.uint8 \
+        else radiometric_stretch.apply_stretch_float
+    with scene_tiler.WindowedRaster(tif_path) as raster:
+        if limits is None:
+            limits = scene_tiler.stretch_limits(raster, bands)
+
+        def read_window(row_off, col_off, rows, cols):
+            block = raster.read(bands, row_off, col_off, rows, cols)
+            return stretch(np.moveaxis(block, 0, -1), limits)
+
+        mask = predict_windows(generator, read_window, raster.height, raster.width, window, margin, batch_size,
+                               **kwargs)
+        mosaic = mask_mosaic.MaskMosaic(raster.height, raster.width, raster.geotransform, raster.epsg)
+    mosaic.add(mask.astype(np.float32) / 255.0, 0, 0)
+    return mosaic